@@ -15,7 +15,7 @@ from django.conf import settings
 from django_otp.plugins.otp_totp.models import TOTPDevice
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
-from django.core.paginator import Paginator
+from vl09_web.pagination import EstimatedCountPaginator
 import pyotp
 
 from .forms import UserProfileForm, UserForm, TOTPForm, PasswordChangeForm
@@ -353,7 +353,7 @@ def is_admin(user):
 @user_passes_test(is_admin)
 def user_list(request):
     users = User.objects.all().order_by('-date_joined')
-    paginator = Paginator(users, 10)
+    paginator = EstimatedCountPaginator(users, 10)
     page = request.GET.get('page')
     users = paginator.get_page(page)
     return render(request, 'accounts/user_list.html', {'users': users})
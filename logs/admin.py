@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserActionLog
+from .models import UserActionLog, SlowQueryLog
 
 # Register your models here.
 
@@ -23,3 +23,21 @@ class UserActionLogAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         # Только суперпользователи могут удалять логи
         return request.user.is_superuser
+
+
+@admin.register(SlowQueryLog)
+class SlowQueryLogAdmin(admin.ModelAdmin):
+    list_display = ('view_name', 'duration_ms', 'shape_hash', 'user', 'captured_at')
+    list_filter = ('view_name', 'captured_at')
+    search_fields = ('shape_hash', 'sql')
+    date_hierarchy = 'captured_at'
+    readonly_fields = ('view_name', 'path', 'user', 'shape_hash', 'sql', 'params_fingerprint',
+                       'duration_ms', 'plan', 'captured_at')
+    ordering = ('-duration_ms',)
+    list_per_page = 50
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
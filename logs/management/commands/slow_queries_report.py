@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Max, Sum
+from django.utils import timezone
+
+from logs.models import SlowQueryLog
+
+
+class Command(BaseCommand):
+    help = 'Отчёт по медленным запросам представлений (SlowQueryLog): худшие формы запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=7, help='За сколько последних дней (по умолчанию 7)')
+        parser.add_argument('--limit', type=int, default=20, help='Сколько форм запросов показать (по умолчанию 20)')
+        parser.add_argument('--view', default=None, help='Только для указанного представления')
+        parser.add_argument(
+            '--order',
+            choices=['total', 'max', 'count'],
+            default='total',
+            help='Сортировка: суммарное время (по умолчанию), максимум или число случаев'
+        )
+        parser.add_argument('--plans', action='store_true', help='Показать последний снятый план каждой формы')
+
+    def handle(self, *args, **options):
+        queryset = SlowQueryLog.objects.filter(captured_at__gte=timezone.now() - timedelta(days=options['days']))
+        if options['view']:
+            queryset = queryset.filter(view_name=options['view'])
+
+        order = {'total': '-total_ms', 'max': '-max_ms', 'count': '-count'}[options['order']]
+        offenders = (
+            queryset.values('shape_hash')
+            .annotate(count=Count('id'), total_ms=Sum('duration_ms'), max_ms=Max('duration_ms'),
+                      avg_ms=Avg('duration_ms'), last_seen=Max('captured_at'),
+                      params_variants=Count('params_fingerprint', distinct=True))
+            .order_by(order)[:options['limit']]
+        )
+
+        if not offenders:
+            self.stdout.write(self.style.SUCCESS('Медленных запросов не найдено'))
+            return
+
+        for position, offender in enumerate(offenders, 1):
+            sample = queryset.filter(shape_hash=offender['shape_hash']).order_by('-captured_at').first()
+            views = sorted(set(queryset.filter(shape_hash=offender['shape_hash']).values_list('view_name', flat=True)))
+            self.stdout.write('=' * 60)
+            self.stdout.write(self.style.WARNING(
+                f"{position}. {offender['shape_hash'][:8]}: {offender['count']} раз, "
+                f"всего {offender['total_ms'] / 1000:.1f} с, макс. {offender['max_ms']:.0f} мс, "
+                f"сред. {offender['avg_ms']:.0f} мс, наборов параметров: {offender['params_variants']}"
+            ))
+            self.stdout.write(f"   Представления: {', '.join(views)}; последний раз: {offender['last_seen']:%d.%m.%Y %H:%M}")
+            self.stdout.write(f"   {sample.sql[:500]}")
+            if options['plans']:
+                with_plan = queryset.filter(shape_hash=offender['shape_hash'], plan__isnull=False).order_by('-captured_at').first()
+                self.stdout.write(with_plan.plan if with_plan else '   (план не снимался)')
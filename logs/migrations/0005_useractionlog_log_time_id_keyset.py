@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0004_useractionlog_related_log'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useractionlog',
+            index=models.Index(fields=['action_time', 'id'], name='log_time_id_keyset'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-19 20:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0005_useractionlog_log_time_id_keyset'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQueryLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(db_index=True, max_length=100, verbose_name='Представление')),
+                ('path', models.CharField(default='/', max_length=255, verbose_name='Путь запроса')),
+                ('shape_hash', models.CharField(db_index=True, max_length=32, verbose_name='Отпечаток формы запроса')),
+                ('sql', models.TextField(verbose_name='Форма запроса')),
+                ('params_fingerprint', models.CharField(max_length=32, verbose_name='Отпечаток параметров')),
+                ('duration_ms', models.FloatField(verbose_name='Длительность (ms)')),
+                ('plan', models.TextField(blank=True, null=True, verbose_name='План EXPLAIN (ANALYZE, BUFFERS)')),
+                ('captured_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Время')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Медленный запрос',
+                'verbose_name_plural': 'Медленные запросы',
+                'ordering': ['-captured_at'],
+            },
+        ),
+    ]
@@ -8,6 +8,13 @@ from uuid import uuid4
 
 # Create your models here.
 
+# Ключ постраничного вывода журнала (vl09_web.pagination.KeysetPaginator, по убыванию),
+# совпадает с индексом log_time_id_keyset
+LOG_KEYSET_KEYS = (
+    ('"logs_useractionlog"."action_time"', 'action_time', '%s::timestamptz'),
+    ('"logs_useractionlog"."id"', 'id'),
+)
+
 class UserActionLog(models.Model):
     """Модель для логирования действий пользователей"""
     ACTION_TYPES = [
@@ -54,8 +61,32 @@ class UserActionLog(models.Model):
             models.Index(fields=['user']),
             models.Index(fields=['action_type']),
             models.Index(fields=['action_time']),
+            models.Index(fields=['action_time', 'id'], name='log_time_id_keyset'),
             models.Index(fields=['content_type', 'object_id']),
         ]
     
     def __str__(self):
         return f"{self.get_action_type_display()} - {self.user.username} - {self.action_time.strftime('%d.%m.%Y %H:%M:%S')}"
+
+
+class SlowQueryLog(models.Model):
+    """Медленный SQL-запрос представления (logs.slow_queries.capture_slow_queries)"""
+    view_name = models.CharField(_('Представление'), max_length=100, db_index=True)
+    path = models.CharField(_('Путь запроса'), max_length=255, default='/')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name=_('Пользователь'))
+    # Форма запроса - SQL с плейсхолдерами, списки IN (%s, %s, ...) схлопнуты; значения
+    # параметров не хранятся, только их отпечаток
+    shape_hash = models.CharField(_('Отпечаток формы запроса'), max_length=32, db_index=True)
+    sql = models.TextField(_('Форма запроса'))
+    params_fingerprint = models.CharField(_('Отпечаток параметров'), max_length=32)
+    duration_ms = models.FloatField(_('Длительность (ms)'))
+    plan = models.TextField(_('План EXPLAIN (ANALYZE, BUFFERS)'), null=True, blank=True)
+    captured_at = models.DateTimeField(_('Время'), default=timezone.now, db_index=True)
+    
+    class Meta:
+        verbose_name = _('Медленный запрос')
+        verbose_name_plural = _('Медленные запросы')
+        ordering = ['-captured_at']
+    
+    def __str__(self):
+        return f"{self.view_name}: {self.duration_ms:.0f} ms ({self.shape_hash[:8]})"
@@ -0,0 +1,136 @@
+import contextlib
+import functools
+import hashlib
+import logging
+import random
+import re
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Списки IN (%s, %s, ...) разной длины - одна форма запроса
+_PLACEHOLDER_LIST_RE = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def query_shape(sql):
+    """Форма запроса: SQL с плейсхолдерами без повторов в списках и лишних пробелов."""
+    return _WHITESPACE_RE.sub(' ', _PLACEHOLDER_LIST_RE.sub('(%s, ...)', sql)).strip()
+
+
+def fingerprint(value):
+    return hashlib.md5(repr(value).encode('utf-8', errors='replace')).hexdigest()
+
+
+class _SlowQueryCapture:
+    """
+    execute_wrapper: замеряет каждый запрос; запросы дольше SLOW_QUERY_THRESHOLD_MS
+    запоминаются, для доли SLOW_QUERY_EXPLAIN_SAMPLE_RATE из них сразу снимается
+    EXPLAIN (ANALYZE, BUFFERS) - только для SELECT, ANALYZE выполняет запрос повторно.
+    """
+
+    def __init__(self):
+        self.threshold_ms = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 500)
+        self.sample_rate = getattr(settings, 'SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 0.1)
+        self.captured = []
+        self.explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.explaining or many:
+            return execute(sql, params, many, context)
+        started = time.monotonic()
+        try:
+            result = execute(sql, params, many, context)
+        except Exception:
+            # Прерванный по statement_timeout запрос - самый медленный, его тоже учитываем (без плана)
+            self._record(sql, params, started, plan=None)
+            raise
+        self._record(sql, params, started, context['connection'])
+        return result
+
+    def _record(self, sql, params, started, db=None, plan=None):
+        duration_ms = (time.monotonic() - started) * 1000
+        if duration_ms < self.threshold_ms:
+            return duration_ms
+        if db is not None and sql.lstrip()[:6].upper() == 'SELECT' and random.random() < self.sample_rate:
+            plan = self._explain(db, sql, params)
+        self.captured.append({
+            'sql': query_shape(sql),
+            'params_fingerprint': fingerprint(params),
+            'duration_ms': round(duration_ms, 1),
+            'plan': plan,
+        })
+        return duration_ms
+
+    def _explain(self, db, sql, params):
+        self.explaining = True
+        try:
+            with db.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+                return '\n'.join(row[0] for row in cursor.fetchall())
+        except Exception as e:  # noqa: BLE001 - например, statement_timeout
+            logger.warning(f"Не удалось снять план медленного запроса: {e}")
+            return None
+        finally:
+            self.explaining = False
+
+    def save(self, view_name, request):
+        if not self.captured:
+            return
+        from .models import SlowQueryLog
+        user = getattr(request, 'user', None)
+        try:
+            SlowQueryLog.objects.bulk_create([
+                SlowQueryLog(
+                    view_name=view_name,
+                    path=request.path[:255],
+                    user=user if user is not None and user.is_authenticated else None,
+                    shape_hash=hashlib.md5(item['sql'].encode()).hexdigest(),
+                    **item,
+                )
+                for item in self.captured
+            ])
+        except Exception as e:  # noqa: BLE001 - учёт не должен ломать ответ
+            logger.error(f"Не удалось сохранить медленные запросы {view_name}: {e}")
+        self.captured = []
+
+
+@contextlib.contextmanager
+def _capture(view_name, request):
+    capture = _SlowQueryCapture()
+    try:
+        with contextlib.ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(capture))
+            yield
+    finally:
+        capture.save(view_name, request)
+
+
+def _stream_with_capture(content, view_name, request):
+    with _capture(view_name, request):
+        yield from content
+
+
+def capture_slow_queries(view_func):
+    """
+    Учёт медленных SQL-запросов представления в SlowQueryLog: форма запроса, отпечаток
+    параметров, длительность и выборочно план. Отключается SLOW_QUERY_CAPTURE = False.
+    Отчёт - manage.py slow_queries_report.
+    """
+    view_name = view_func.__name__
+
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not getattr(settings, 'SLOW_QUERY_CAPTURE', True):
+            return view_func(request, *args, **kwargs)
+        with _capture(view_name, request):
+            response = view_func(request, *args, **kwargs)
+        if getattr(response, 'streaming', False):
+            response.streaming_content = _stream_with_capture(response.streaming_content, view_name, request)
+        return response
+
+    return wrapper
@@ -1,8 +1,12 @@
-from django.test import TestCase
+from django.test import TestCase, RequestFactory, override_settings
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.http import HttpResponse
 from django.utils import timezone
-from .models import UserActionLog
+from .models import UserActionLog, SlowQueryLog
+from .slow_queries import capture_slow_queries, query_shape
 from .utils import assign_logical_sessions
+import io
 import uuid
 from datetime import timedelta
 
@@ -49,3 +53,35 @@ class LogicalSessionAssignmentTest(TestCase):
         self.assertIsNotNone(log1.logical_session_id)
         self.assertIsNotNone(log2.logical_session_id)
         self.assertNotEqual(log1.logical_session_id, log2.logical_session_id)
+
+
+@override_settings(SLOW_QUERY_CAPTURE=True, SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_EXPLAIN_SAMPLE_RATE=1.0)
+class SlowQueryCaptureTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='searcher', password='123')
+        self.factory = RequestFactory()
+
+    def test_query_shape_collapses_lists(self):
+        self.assertEqual(
+            query_shape('SELECT * FROM t WHERE id IN (%s, %s, %s)\n  AND x = %s'),
+            query_shape('SELECT * FROM t WHERE id IN (%s, %s) AND x = %s'),
+        )
+
+    def test_decorated_view_records_queries_with_plan(self):
+        @capture_slow_queries
+        def search_view(request):
+            list(UserActionLog.objects.filter(user=request.user, action_type__in=['SEARCH', 'EXPORT']))
+            return HttpResponse('ok')
+
+        request = self.factory.get('/subscribers/search/')
+        request.user = self.user
+        search_view(request)
+
+        entry = SlowQueryLog.objects.get(view_name='search_view')
+        self.assertEqual(entry.user, self.user)
+        self.assertIn('IN (%s, ...)', entry.sql)
+        self.assertIn('actual time', entry.plan)
+
+        output = io.StringIO()
+        call_command('slow_queries_report', '--plans', stdout=output)
+        self.assertIn(entry.shape_hash[:8], output.getvalue())
@@ -14,9 +14,12 @@ from collections import defaultdict
 from django.utils import timezone
 from django.db.models import Count
 
-from .models import UserActionLog
+from .models import UserActionLog, LOG_KEYSET_KEYS
 from .forms import LogFilterForm
 from accounts.utils import is_admin
+from vl09_web.db_router import use_read_replica
+from vl09_web.db_timeouts import statement_timeout
+from vl09_web.pagination import KeysetPaginator
 
 
 def is_superadmin(user):
@@ -26,6 +29,8 @@ def is_superadmin(user):
 
 @login_required
 @user_passes_test(is_admin)
+@statement_timeout('logs')
+@use_read_replica
 def log_list(request):
     """Представление для просмотра списка логов действий пользователей"""
     form = LogFilterForm(request.GET or None)
@@ -35,10 +40,9 @@ def log_list(request):
     if request.GET and form.is_valid():
         logs = form.get_queryset()
     
-    # Пагинация
-    paginator = Paginator(logs, 25)  # 25 записей на страницу
-    page = request.GET.get('page')
-    logs_page = paginator.get_page(page)
+    # Пагинация по ключу (action_time, id) - без OFFSET и полного COUNT(*)
+    paginator = KeysetPaginator(logs.select_related('user'), LOG_KEYSET_KEYS, per_page=25, descending=True)
+    logs_page = paginator.paginate_request(request)
 
     # --- ДОБАВЛЕНО: формируем детали для каждого лога ---
     logs_with_details = []
@@ -59,6 +63,7 @@ def log_list(request):
     context = {
         'form': form,
         'logs': logs_with_details,  # заменили на logs_with_details
+        'logs_page': logs_page,
         'title': 'Журнал действий пользователей',
     }
     
@@ -67,6 +72,8 @@ def log_list(request):
 
 @login_required
 @user_passes_test(is_admin)
+@statement_timeout('logs')
+@use_read_replica
 def log_detail(request, log_id):
     """Представление для просмотра детальной информации о логе"""
     log = get_object_or_404(UserActionLog, id=log_id)
@@ -112,6 +119,8 @@ def log_detail(request, log_id):
 
 @login_required
 @user_passes_test(is_admin)
+@statement_timeout('export')
+@use_read_replica
 def export_logs(request):
     """Представление для экспорта логов в CSV"""
     form = LogFilterForm(request.GET or None)
@@ -213,6 +222,8 @@ def clear_old_logs(request):
 
 @login_required
 @user_passes_test(is_admin)
+@statement_timeout('logs')
+@use_read_replica
 def log_sessions(request):
     """
     Представление для просмотра логов, сгруппированных по логическим сессиям (logical_session_id).
@@ -257,6 +268,8 @@ def log_sessions(request):
 
 @login_required
 @user_passes_test(is_admin)
+@statement_timeout('logs')
+@use_read_replica
 def log_chain(request, log_id):
     """
     Представление для просмотра цепочки связанных действий (related_log).
@@ -290,6 +303,8 @@ def log_chain(request, log_id):
 
 @login_required
 @user_passes_test(is_admin)
+@statement_timeout('logs')
+@use_read_replica
 def activity_overview(request):
     """
     Визуализация активности пользователей: график количества действий по дням.
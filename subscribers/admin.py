@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Subscriber, ImportHistory, ImportError
+from .models import Subscriber, ImportHistory, ImportError, bump_data_generation
 from accounts.utils import can_view_imsi
 
 # Register your models here.
@@ -28,6 +28,19 @@ class SubscriberAdmin(admin.ModelAdmin):
         }),
     )
     
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Правка в админке должна быть видна в поиске сразу
+        bump_data_generation()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_data_generation()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        bump_data_generation()
+
     def get_list_display(self, request):
         """Динамически изменяет отображаемые колонки в зависимости от разрешений пользователя"""
         list_display = list(super().get_list_display(request))
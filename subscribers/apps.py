@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class SubscribersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'subscribers'
+
+    def ready(self):
+        # Индекс подсказок ФИО строится в фоне при старте, см. subscribers.typeahead
+        from .typeahead import preload_name_indexes
+        preload_name_indexes()
@@ -0,0 +1,197 @@
+import csv
+import logging
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .history import row_hash_source
+from .models import ImportHistory, Subscriber
+
+logger = logging.getLogger(__name__)
+
+# Колонки владельца в файле сравнения; смена любой из них - смена владельца номера,
+# остальные отличия хеша - изменение данных (адрес, паспорт, IMSI и т.п.)
+DIFF_OWNER_COLUMNS = ('last_name', 'first_name', 'middle_name', 'birth_date')
+
+DIFF_KINDS = {
+    'added': 'Новый номер',
+    'removed': 'Номер удалён',
+    'owner_changed': 'Сменился владелец',
+    'changed': 'Изменены данные',
+}
+
+_RUNNING_DIFFS = {}
+
+
+class TableChangedError(Exception):
+    """Таблицу подменили (финализация, откат) во время сравнения - результат был бы смесью двух таблиц."""
+
+
+def iter_sorted_rows(table_name, batch_size=None):
+    """
+    Строки таблицы (number, хеш, колонки владельца) в порядке номера. Читаются пачками
+    по ключу: WHERE number ~>~ последний ORDER BY number USING ~<~ LIMIT n - это порядок
+    индекса sub_number_prefix_cover (text_pattern_ops), побайтовый и совпадающий со
+    сравнением строк в Python, независимо от правил сортировки базы. Каждая пачка - свой
+    короткий запрос: долгая транзакция не держит таблицу и не мешает подмене при финализации.
+    """
+    batch_size = batch_size or getattr(settings, 'DIFF_BATCH_SIZE', 10000)
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)::oid", [qn(table_name)])
+        table_oid = cursor.fetchone()[0]
+        if table_oid is None:
+            raise Exception(f"Таблица {table_name} не найдена")
+        select = (
+            f"SELECT number, {row_hash_source(cursor, table_name)}, "
+            f"{', '.join(qn(column) for column in DIFF_OWNER_COLUMNS)} FROM {qn(table_name)} "
+        )
+    last_number = None
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)::oid", [qn(table_name)])
+            if cursor.fetchone()[0] != table_oid:
+                raise TableChangedError(f"Таблица {table_name} подменена во время сравнения")
+            if last_number is None:
+                cursor.execute(select + "ORDER BY number USING ~<~ LIMIT %s", [batch_size])
+            else:
+                cursor.execute(select + "WHERE number ~>~ %s ORDER BY number USING ~<~ LIMIT %s",
+                               [last_number, batch_size])
+            rows = cursor.fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_number = rows[-1][0]
+
+
+def merge_diff(old_rows, new_rows):
+    """
+    Слияние двух потоков, отсортированных по номеру: (вид изменения, старая строка, новая строка).
+    Один проход по обоим потокам, в памяти - по строке с каждой стороны.
+    """
+    old_rows, new_rows = iter(old_rows), iter(new_rows)
+    old, new = next(old_rows, None), next(new_rows, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield 'removed', old, None
+            old = next(old_rows, None)
+        elif old is None or new[0] < old[0]:
+            yield 'added', None, new
+            new = next(new_rows, None)
+        else:
+            if old[1] != new[1]:
+                yield ('owner_changed' if old[2:] != new[2:] else 'changed'), old, new
+            old, new = next(old_rows, None), next(new_rows, None)
+
+
+def diff_header():
+    owner_titles = ('Фамилия', 'Имя', 'Отчество', 'Дата рождения')
+    return (['Изменение', 'Номер'] + [f'Было: {title}' for title in owner_titles]
+            + [f'Стало: {title}' for title in owner_titles])
+
+
+def _diff_row(kind, old, new):
+    owner_count = len(DIFF_OWNER_COLUMNS)
+    old_owner = list(old[2:]) if old else [None] * owner_count
+    new_owner = list(new[2:]) if new else [None] * owner_count
+    return [DIFF_KINDS[kind], (new or old)[0]] + ['' if value is None else value for value in old_owner + new_owner]
+
+
+def _save_diff_stats(import_history, stats):
+    import_history.diff_stats = stats
+    import_history.save(update_fields=['diff_stats'])
+
+
+def _counted(rows, import_history, stats, key):
+    """Считает прочитанные строки таблицы в stats[key]; раз в DIFF_PROGRESS_EVERY строк сохраняет ход сравнения."""
+    progress_every = getattr(settings, 'DIFF_PROGRESS_EVERY', 100000)
+    for row in rows:
+        stats[key] += 1
+        if stats[key] % progress_every == 0:
+            _save_diff_stats(import_history, stats)
+        yield row
+
+
+def run_import_diff(import_history_id, archive_table_name=None):
+    """
+    Сравнивает основную таблицу с архивом (по умолчанию - архивом, созданным финализацией
+    этого импорта, т.е. данными до него). Отличия пишутся в CSV по мере слияния, счётчики
+    и ход работы - в ImportHistory.diff_stats, файл - в ImportHistory.diff_file.
+    """
+    from .tasks import _ARCHIVE_TABLE_RE
+
+    import_history = ImportHistory.objects.get(id=import_history_id)
+    archive_table_name = archive_table_name or import_history.archive_table_name
+    main_table_name = Subscriber._meta.db_table
+    counts = {kind: 0 for kind in DIFF_KINDS}
+    stats = {
+        'status': 'running',
+        'archive_table_name': archive_table_name,
+        'started_at': timezone.now().isoformat(),
+        'counts': counts,
+        'old_rows': 0,
+        'new_rows': 0,
+    }
+    _save_diff_stats(import_history, stats)
+
+    relative_path = f"diffs/{timezone.now():%Y/%m/%d}/diff_{import_history_id}_{int(time.time())}.csv"
+    file_path = Path(settings.MEDIA_ROOT) / relative_path
+    started = time.monotonic()
+    try:
+        if not _ARCHIVE_TABLE_RE.match(archive_table_name or ''):
+            raise Exception(f"Недопустимое имя архивной таблицы: {archive_table_name}")
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(file_path, 'w', newline='', encoding='utf-8') as fh:
+            writer = csv.writer(fh)
+            writer.writerow(diff_header())
+            old_rows = _counted(iter_sorted_rows(archive_table_name), import_history, stats, 'old_rows')
+            new_rows = _counted(iter_sorted_rows(main_table_name), import_history, stats, 'new_rows')
+            for kind, old, new in merge_diff(old_rows, new_rows):
+                counts[kind] += 1
+                writer.writerow(_diff_row(kind, old, new))
+        stats.update(status='completed', finished_at=timezone.now().isoformat(),
+                     ms=int((time.monotonic() - started) * 1000))
+        if import_history.diff_file:
+            # Файл прошлого сравнения больше не нужен
+            import_history.diff_file.delete(save=False)
+        import_history.diff_file.name = relative_path
+        import_history.diff_stats = stats
+        import_history.save(update_fields=['diff_stats', 'diff_file'])
+        logger.info(f"[DIFF] Импорт {import_history_id}: сравнение с {archive_table_name} завершено: {counts}")
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"[ERROR] Ошибка сравнения импорта {import_history_id} с {archive_table_name}: {str(e)}")
+        file_path.unlink(missing_ok=True)
+        stats.update(status='failed', error=str(e), finished_at=timezone.now().isoformat())
+        _save_diff_stats(import_history, stats)
+    return stats
+
+
+def _run_import_diff_thread(import_history_id, archive_table_name):
+    try:
+        run_import_diff(import_history_id, archive_table_name)
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"[ERROR] Критическая ошибка сравнения импорта {import_history_id}: {str(e)}")
+    finally:
+        _RUNNING_DIFFS.pop(import_history_id, None)
+        connection.close()
+
+
+def is_diff_running(import_history_id):
+    t = _RUNNING_DIFFS.get(import_history_id)
+    return bool(t and t.is_alive())
+
+
+def start_diff_async(import_history_id, archive_table_name=None):
+    """Стартует сравнение в фоновом потоке, если по этому импорту оно ещё не идёт. Возвращает True, если стартовали сейчас."""
+    if is_diff_running(import_history_id):
+        logger.info(f"Сравнение импорта {import_history_id} уже выполняется")
+        return False
+    t = threading.Thread(target=_run_import_diff_thread, args=(import_history_id, archive_table_name),
+                         name=f'import-diff-{import_history_id}', daemon=True)
+    _RUNNING_DIFFS[import_history_id] = t
+    t.start()
+    return True
@@ -5,8 +5,8 @@ class CSVImportForm(forms.Form):
     """Объединенная форма для импорта данных из CSV-файла"""
     csv_file = forms.FileField(
         label=_('CSV-файл'),
-        help_text=_('Выберите CSV-файл с данными абонентов'),
-        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv'})
+        help_text=_('Выберите CSV-файл с данными абонентов (можно сжатый: .gz, .bz2, .xz, .zip)'),
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv,.gz,.bz2,.xz,.zip'})
     )
     
     delimiter_choices = [
@@ -59,6 +59,20 @@ class SearchForm(forms.Form):
         )
     )
     
+    number_match = forms.ChoiceField(
+        label=_('Совпадение номера'),
+        required=False,
+        choices=[
+            ('auto', _('Автоматически')),
+            ('suffix', _('Последние цифры')),
+            ('prefix', _('Начало номера')),
+            ('contains', _('Любая часть номера')),
+        ],
+        initial='auto',
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        help_text=_('Автоматически: с 993 - по началу номера, до 7 цифр - по последним цифрам, иначе - по любой части номера')
+    )
+    
     full_name = forms.CharField(
         label=_('ФИО'),
         required=False,
@@ -93,10 +107,89 @@ class SearchForm(forms.Form):
         )
     )
     
+    fulltext = forms.BooleanField(
+        label=_('Полнотекстовый поиск'),
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        help_text=_('ФИО и адрес ищутся по словоформам, лучшие совпадения - первыми')
+    )
+    
+    fuzzy = forms.BooleanField(
+        label=_('Нечёткий поиск по ФИО'),
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        help_text=_('Фамилия и имя ищутся по звучанию (транслит, опечатки), ближайшие написания - первыми')
+    )
+    
     def clean_phone_number(self):
         """Валидация номера телефона"""
         phone_number = self.cleaned_data.get('phone_number')
         if phone_number:
             # Удаляем все нецифровые символы
             phone_number = ''.join(filter(str.isdigit, phone_number))
-        return phone_number 
\ No newline at end of file
+        return phone_number 
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('fulltext') and cleaned_data.get('fuzzy'):
+            raise forms.ValidationError(_('Выберите либо полнотекстовый, либо нечёткий поиск'))
+        return cleaned_data
+
+class BulkLookupForm(forms.Form):
+    """Форма массовой проверки номеров"""
+    numbers_file = forms.FileField(
+        label=_('Файл с номерами'),
+        required=False,
+        help_text=_('Текстовый или CSV-файл: по одному номеру в строке (берётся первое поле)'),
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.txt,.csv'})
+    )
+    
+    numbers = forms.CharField(
+        label=_('Номера'),
+        required=False,
+        widget=forms.Textarea(
+            attrs={
+                'class': 'form-control',
+                'rows': 6,
+                'placeholder': _('Или вставьте номера, по одному в строке'),
+            }
+        )
+    )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('numbers_file') and not cleaned_data.get('numbers'):
+            raise forms.ValidationError(_('Загрузите файл с номерами или вставьте номера в поле'))
+        return cleaned_data
+
+
+class HistoryLookupForm(forms.Form):
+    """Форма поиска по истории номеров: номер или IMSI и момент времени"""
+    number = forms.CharField(
+        label=_('Номер телефона'),
+        required=False,
+        max_length=20,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': _('Введите номер телефона')})
+    )
+    
+    imsi = forms.CharField(
+        label='IMSI',
+        required=False,
+        max_length=50,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': _('Или IMSI')})
+    )
+    
+    at = forms.DateTimeField(
+        label=_('На момент'),
+        required=False,
+        help_text=_('Пусто - вся история'),
+        widget=forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'})
+    )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        cleaned_data['number'] = (cleaned_data.get('number') or '').strip()
+        cleaned_data['imsi'] = (cleaned_data.get('imsi') or '').strip()
+        if not cleaned_data['number'] and not cleaned_data['imsi']:
+            raise forms.ValidationError(_('Укажите номер телефона или IMSI'))
+        return cleaned_data
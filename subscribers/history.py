@@ -0,0 +1,236 @@
+import datetime
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection, connections, router, transaction
+from django.db.models import Q
+
+from .manifest import read_table_manifest
+from .models import ROW_HASH_COLUMNS, Subscriber, SubscriberHistory
+
+logger = logging.getLogger(__name__)
+
+
+def row_hash_sql(quote_name, alias=None):
+    """SQL-выражение хеша версии записи - то же, что models.subscriber_row_hash; alias - псевдоним таблицы в запросе"""
+    prefix = f"{alias}." if alias else ''
+    values = ', '.join(
+        f"COALESCE(to_char({prefix}{quote_name(column)}, 'YYYY-MM-DD'), '')" if column == 'birth_date'
+        else f"COALESCE({prefix}{quote_name(column)}::text, '')"
+        for column in ROW_HASH_COLUMNS
+    )
+    return f"md5(concat_ws(chr(31), {values}))"
+
+
+def row_hash_source(cursor, table_name, alias=None):
+    """
+    Хеш версии записи для строк таблицы: сохранённый при импорте row_hash, а для
+    архивов, созданных до появления колонки, - вычисленный (row_hash_sql).
+    """
+    qn = connection.ops.quote_name
+    cursor.execute(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'row_hash'",
+        [table_name]
+    )
+    if cursor.fetchone():
+        prefix = f"{alias}." if alias else ''
+        return f"COALESCE(NULLIF({prefix}row_hash, ''), {row_hash_sql(qn, alias)})"
+    return row_hash_sql(qn, alias)
+
+
+def update_history_index(table_name, import_id, changed_at):
+    """
+    Сверяет индекс истории с таблицей, ставшей основной в момент changed_at.
+
+    Два set-based запроса по паре (номер, хеш строки - row_hash_source) прямо между таблицей
+    и открытыми интервалами, без промежуточной копии: открытые интервалы номеров, версии
+    которых в таблице нет, закрываются (valid_to = changed_at); версии, которых нет среди
+    открытых интервалов, открываются с указателем (import_id, id строки). NOT EXISTS с обеих
+    сторон идёт по уникальному индексу номера (в таблице - number, в истории -
+    sub_history_open_number), неизменившиеся номера не трогаются. Выполняется после
+    подмены таблиц, вне её блокировок.
+
+    Returns:
+        dict: число закрытых и открытых интервалов и длительность (мс)
+    """
+    qn = connection.ops.quote_name
+    history_table = qn(SubscriberHistory._meta.db_table)
+    started = time.monotonic()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            row_hash = row_hash_source(cursor, table_name, alias='t')
+            cursor.execute(f"""
+                UPDATE {history_table} h SET valid_to = %s
+                WHERE h.valid_to IS NULL AND NOT EXISTS (
+                    SELECT 1 FROM {qn(table_name)} t WHERE t.number = h.number AND {row_hash} = h.row_hash
+                )
+            """, [changed_at])
+            closed = cursor.rowcount
+            cursor.execute(f"""
+                INSERT INTO {history_table} (number, imsi, import_id, valid_from, valid_to, row_hash, row_id)
+                SELECT t.number, t.imsi, %s, %s, NULL, {row_hash}, t.id
+                FROM {qn(table_name)} t
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {history_table} h
+                    WHERE h.valid_to IS NULL AND h.number = t.number AND h.row_hash = {row_hash}
+                )
+            """, [import_id, changed_at])
+            opened = cursor.rowcount
+    result = {'closed': closed, 'opened': opened, 'ms': int((time.monotonic() - started) * 1000)}
+    logger.info(f"[HISTORY] Индекс истории по {table_name} на {changed_at.isoformat()}: {result}")
+    return result
+
+
+def data_tables(cursor):
+    """
+    Основная и архивные таблицы абонентов с манифестами из комментариев (только каталог):
+    [{'name', 'import_id', 'finalized_at', 'is_main'}]
+    """
+    main_table_name = Subscriber._meta.db_table
+    cursor.execute("""
+        SELECT c.relname, obj_description(c.oid, 'pg_class')
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relkind = 'r'
+          AND n.nspname = current_schema()
+          AND (c.relname = %s OR c.relname LIKE 'subscribers_subscriber_archive_%%')
+    """, [main_table_name])
+    tables = []
+    for name, comment in cursor.fetchall():
+        manifest = read_table_manifest(comment) or {}
+        finalized_at = manifest.get('finalized_at')
+        try:
+            finalized_at = datetime.datetime.fromisoformat(finalized_at) if finalized_at else None
+        except ValueError:
+            finalized_at = None
+        tables.append({
+            'name': name,
+            'import_id': manifest.get('import_id'),
+            'finalized_at': finalized_at,
+            'is_main': name == main_table_name,
+        })
+    return tables
+
+
+def rebuild_history_index():
+    """
+    Перестраивает индекс истории с нуля, проигрывая сохранившиеся таблицы по порядку:
+    архивы по метке времени в имени (момент ухода из основных), затем основная таблица.
+    Начало действия таблицы - момент ухода предыдущей или finalized_at манифеста
+    (что позже), для первой таблицы без манифеста - MIN(created_at) её строк.
+    История до самого старого сохранившегося архива не восстанавливается.
+
+    Returns:
+        list: по таблице - имя, начало действия и итог update_history_index
+    """
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        tables = data_tables(cursor)
+    archives = sorted(
+        (table for table in tables if not table['is_main'] and table['name'].rsplit('_', 1)[1].isdigit()),
+        key=lambda table: int(table['name'].rsplit('_', 1)[1])
+    )
+    ordered = archives + [table for table in tables if table['is_main']]
+
+    SubscriberHistory.objects.all().delete()
+    steps = []
+    previous_end = None
+    for table in ordered:
+        start = max(filter(None, [table['finalized_at'], previous_end]), default=None)
+        if start is None:
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT MIN(created_at) FROM {qn(table['name'])}")
+                start = cursor.fetchone()[0]
+        end = None if table['is_main'] else datetime.datetime.fromtimestamp(
+            int(table['name'].rsplit('_', 1)[1]), tz=datetime.timezone.utc
+        )
+        if start is None or (end is not None and start >= end):
+            steps.append({'table': table['name'], 'skipped': True})
+            continue
+        steps.append({
+            'table': table['name'],
+            'valid_from': start.isoformat(),
+            **update_history_index(table['name'], table['import_id'], start),
+        })
+        previous_end = end
+    return steps
+
+
+def _candidate_tables(entry, tables):
+    """
+    Таблицы, где может лежать версия записи интервала: сначала таблица импорта-указателя,
+    затем основная (для открытого интервала) и таблицы, ставшие основными внутри интервала.
+    """
+    by_pointer = [table for table in tables if entry.import_id is not None and table['import_id'] == entry.import_id]
+    by_time = [
+        table for table in tables
+        if table not in by_pointer and (
+            (table['is_main'] and entry.valid_to is None)
+            or (table['finalized_at'] and entry.valid_from <= table['finalized_at']
+                and (entry.valid_to is None or table['finalized_at'] < entry.valid_to))
+        )
+    ]
+    return [(table, True) for table in by_pointer] + [(table, False) for table in by_time]
+
+
+def _resolve_record(cursor, quote_name, entry, tables, columns):
+    """Читает версию записи интервала: по id строки или по номеру, с проверкой хеша. (таблица, запись) или (None, None)"""
+    select = ', '.join(quote_name(column) for column in columns)
+    for table, by_pointer in _candidate_tables(entry, tables):
+        key_sql, key = ('id = %s', entry.row_id) if by_pointer else ('number = %s', entry.number)
+        try:
+            cursor.execute(
+                f"SELECT {select} FROM {quote_name(table['name'])} "
+                f"WHERE {key_sql} AND {row_hash_sql(quote_name)} = %s",
+                [key, entry.row_hash]
+            )
+            row = cursor.fetchone()
+        except Exception as e:  # noqa: BLE001 - например, таблица удалена очисткой архивов
+            logger.warning(f"[HISTORY] Не удалось прочитать {table['name']}: {e}")
+            continue
+        if row:
+            return table['name'], dict(zip(columns, row))
+    return None, None
+
+
+def lookup_history(number=None, imsi=None, at=None, include_imsi=True, limit=None):
+    """
+    История номера или IMSI: интервалы из индекса SubscriberHistory (на момент at - только
+    действовавший тогда интервал, иначе все, новые первыми) и данные абонента по указателю.
+    Архивные таблицы не сканируются - только чтение строки по первичному ключу или
+    уникальному индексу номера. Если таблицы с версией уже нет (очистка архивов),
+    интервал отдаётся без данных.
+    """
+    limit = limit or getattr(settings, 'HISTORY_LOOKUP_LIMIT', 100)
+    if number:
+        entries = SubscriberHistory.objects.filter(number=number)
+    elif imsi:
+        entries = SubscriberHistory.objects.filter(imsi=imsi)
+    else:
+        return []
+    if at is not None:
+        entries = entries.filter(Q(valid_to__gt=at) | Q(valid_to__isnull=True), valid_from__lte=at)
+    entries = list(entries.order_by('-valid_from')[:limit])
+    if not entries:
+        return []
+
+    columns = [column for column in ROW_HASH_COLUMNS if include_imsi or column != 'imsi']
+    db = connections[router.db_for_read(SubscriberHistory)]
+    with db.cursor() as cursor:
+        tables = data_tables(cursor)
+        result = []
+        for entry in entries:
+            table_name, record = _resolve_record(cursor, db.ops.quote_name, entry, tables, columns)
+            result.append({
+                'number': entry.number,
+                'imsi': entry.imsi if include_imsi else None,
+                'valid_from': entry.valid_from,
+                'valid_to': entry.valid_to,
+                'import_id': entry.import_id,
+                'row_hash': entry.row_hash,
+                'table_name': table_name,
+                'record': record,
+            })
+    return result
@@ -0,0 +1,75 @@
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from subscribers.models import Subscriber, normalize_search_text
+
+# Фильтры поиска в том виде, в каком их строят search_subscribers и subscriber_list
+SEARCH_CASES = (
+    ('number', lambda term: Q(number__contains=term)),
+    ('imsi', lambda term: Q(imsi__contains=term)),
+    ('last_name', lambda term: Q(last_name_norm__contains=normalize_search_text(term))),
+    ('first_name', lambda term: Q(first_name_norm__contains=normalize_search_text(term))),
+    ('middle_name', lambda term: Q(middle_name_norm__contains=normalize_search_text(term))),
+    ('address', lambda term: Q(address_norm__contains=normalize_search_text(term))),
+    ('memo1', lambda term: Q(memo1_norm__contains=normalize_search_text(term))),
+)
+
+_EXECUTION_TIME_RE = re.compile(r'Execution Time: ([\d.]+) ms')
+
+
+class Command(BaseCommand):
+    help = 'Проверка планов поиска по подстроке: EXPLAIN ANALYZE и использование триграммных индексов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--term',
+            default=None,
+            help='Строка поиска для текстовых полей (по умолчанию: часть фамилии первого абонента)'
+        )
+        parser.add_argument(
+            '--digits',
+            default=None,
+            help='Строка поиска для номера и IMSI (по умолчанию: середина номера первого абонента)'
+        )
+
+    def handle(self, *args, **options):
+        sample = Subscriber.objects.exclude(last_name__isnull=True).exclude(last_name='').first()
+        term = options['term'] or (sample.last_name[1:5] if sample else 'ова')
+        digits = options['digits'] or (sample.number[3:8] if sample and sample.number else '12345')
+
+        self.stdout.write(self.style.SUCCESS(f'🔍 Текст: "{term}", цифры: "{digits}"'))
+        self.stdout.write('=' * 60)
+
+        failed = 0
+        for column, build_filter in SEARCH_CASES:
+            search_term = digits if column in ('number', 'imsi') else term
+            queryset = Subscriber.objects.filter(build_filter(search_term)).order_by('last_name', 'first_name')[:20]
+            plan = queryset.explain(analyze=True, buffers=True)
+            uses_index = 'Index Scan' in plan
+            elapsed = _EXECUTION_TIME_RE.search(plan)
+            elapsed_ms = elapsed.group(1) if elapsed else '?'
+
+            if uses_index:
+                self.stdout.write(f'  ✅ {column}: индекс, {elapsed_ms} мс')
+            else:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'  ⚠️ {column}: последовательное сканирование, {elapsed_ms} мс'))
+            if options['verbosity'] > 1:
+                self.stdout.write(plan)
+
+        # Может ли планировщик вообще использовать индексы (на маленькой таблице seq scan дешевле)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            usable = [
+                column for column, build_filter in SEARCH_CASES
+                if 'Index Scan' in Subscriber.objects.filter(
+                    build_filter(digits if column in ('number', 'imsi') else term)
+                ).explain()
+            ]
+        self.stdout.write('=' * 60)
+        self.stdout.write(f'Индекс применим (enable_seqscan=off): {", ".join(usable) or "нет"}')
+        if failed:
+            self.stdout.write(self.style.WARNING(f'Без индекса выполнено запросов: {failed}'))
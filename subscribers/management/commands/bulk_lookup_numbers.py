@@ -0,0 +1,55 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from subscribers.utils import read_lookup_numbers, bulk_lookup_header, iter_bulk_lookup_rows
+
+
+class Command(BaseCommand):
+    help = 'Массовая проверка списка номеров по базе абонентов (результат в CSV)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input',
+            help='Файл с номерами, по одному в строке (берётся первое поле); "-" - stdin'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для результата CSV (по умолчанию: stdout)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Размер пачки номеров на один запрос (по умолчанию: BULK_LOOKUP_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--no-imsi',
+            action='store_true',
+            help='Не выгружать IMSI'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options['input'] == '-':
+                numbers = read_lookup_numbers(sys.stdin)
+            else:
+                with open(options['input'], encoding='utf-8', errors='replace') as fh:
+                    numbers = read_lookup_numbers(fh)
+        except OSError as e:
+            raise CommandError(f'Не удалось прочитать файл с номерами: {e}')
+
+        include_imsi = not options['no_imsi']
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else self.stdout
+        matched = 0
+        try:
+            writer = csv.writer(output)
+            writer.writerow(bulk_lookup_header(include_imsi))
+            for row in iter_bulk_lookup_rows(numbers, include_imsi=include_imsi, batch_size=options['batch_size']):
+                writer.writerow(row)
+                matched += 1
+        finally:
+            if options['output']:
+                output.close()
+
+        self.stderr.write(self.style.SUCCESS(f'✅ Номеров: {len(numbers)}, найдено: {matched}'))
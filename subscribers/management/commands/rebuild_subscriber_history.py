@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from subscribers.history import rebuild_history_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Перестраивает индекс истории номеров (SubscriberHistory) по основной и архивным таблицам. '
+        'Нужна один раз после установки и после сбоя обновления индекса при финализации'
+    )
+
+    def handle(self, *args, **options):
+        for step in rebuild_history_index():
+            if step.get('skipped'):
+                self.stdout.write(self.style.WARNING(f"{step['table']}: пропущена, время действия не определено"))
+                continue
+            self.stdout.write(
+                f"{step['table']}: с {step['valid_from']}, закрыто {step['closed']}, "
+                f"открыто {step['opened']}, {step['ms']} мс"
+            )
+        self.stdout.write(self.style.SUCCESS('Индекс истории номеров перестроен'))
@@ -0,0 +1,37 @@
+import json
+
+from django.db import connection
+
+
+def _quote_table(table_name):
+    """Имя таблицы, возможно с явной схемой ('schema.table'), в кавычках"""
+    return '.'.join(connection.ops.quote_name(part) for part in table_name.split('.', 1))
+
+
+def write_table_manifest(cursor, table_name, manifest):
+    """
+    Сохраняет манифест данных таблицы в её комментарий (COMMENT ON TABLE).
+    Комментарий переезжает вместе с таблицей при переименовании, поэтому, когда
+    таблица уйдёт в архив, манифест читается из каталога без COUNT(*).
+    """
+    cursor.execute(
+        f"COMMENT ON TABLE {_quote_table(table_name)} IS %s",
+        [json.dumps(manifest, ensure_ascii=False)]
+    )
+
+
+def read_table_manifest(comment):
+    """Разбирает манифест из комментария таблицы; для таблиц без манифеста - None."""
+    if not comment:
+        return None
+    try:
+        manifest = json.loads(comment)
+    except ValueError:
+        return None
+    return manifest if isinstance(manifest, dict) else None
+
+
+def get_table_manifest(cursor, table_name):
+    """Манифест существующей таблицы из каталога; для таблиц без манифеста - None."""
+    cursor.execute("SELECT obj_description(%s::regclass, 'pg_class')", [_quote_table(table_name)])
+    return read_table_manifest(cursor.fetchone()[0])
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0017_alter_subscriber_first_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importhistory',
+            name='resume_byte_offset',
+            field=models.BigIntegerField(default=0, verbose_name='Смещение в файле для резюме'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0018_importhistory_resume_byte_offset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importhistory',
+            name='finalize_stats',
+            field=models.JSONField(blank=True, null=True, verbose_name='Проверки и тайминги финализации'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0019_importhistory_finalize_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importhistory',
+            name='rolled_back_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата отката'),
+        ),
+        migrations.AddField(
+            model_name='importhistory',
+            name='rollback_table_name',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='Архивная таблица с данными до отката'),
+        ),
+        migrations.AddField(
+            model_name='importhistory',
+            name='rollback_stats',
+            field=models.JSONField(blank=True, null=True, verbose_name='Тайминги отката'),
+        ),
+    ]
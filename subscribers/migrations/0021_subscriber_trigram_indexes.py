@@ -0,0 +1,45 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:40
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0020_importhistory_rollback'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('last_name'), name='gin_trgm_ops'), name='sub_last_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('first_name'), name='gin_trgm_ops'), name='sub_first_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('middle_name'), name='gin_trgm_ops'), name='sub_middle_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('address'), name='gin_trgm_ops'), name='sub_address_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('memo1'), name='gin_trgm_ops'), name='sub_memo1_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['number'], name='sub_number_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['imsi'], name='sub_imsi_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
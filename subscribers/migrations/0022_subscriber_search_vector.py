@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0021_subscriber_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        # Заполняем вектор для уже загруженных абонентов до построения индекса
+        migrations.RunSQL(
+            sql="""
+                UPDATE subscribers_subscriber
+                SET search_vector =
+                    setweight(to_tsvector('russian', concat_ws(' ', last_name, first_name, middle_name)), 'A')
+                    || setweight(to_tsvector('russian', concat_ws(' ', address, birth_place)), 'B')
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='sub_search_vector_gin'),
+        ),
+    ]
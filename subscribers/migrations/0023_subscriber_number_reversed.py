@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0022_subscriber_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='number_reversed',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20, verbose_name='Номер (обратный)'),
+        ),
+        migrations.RunSQL(
+            sql="UPDATE subscribers_subscriber SET number_reversed = reverse(number)",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['number'], name='sub_number_prefix', opclasses=['text_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['number_reversed'], name='sub_number_suffix', opclasses=['text_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:05
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0023_subscriber_number_reversed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(django.db.models.functions.comparison.Coalesce('last_name', models.Value('')), django.db.models.functions.comparison.Coalesce('first_name', models.Value('')), models.F('id'), name='sub_name_keyset'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0024_subscriber_sub_name_keyset'),
+    ]
+
+    operations = [
+        # Поколение данных абонентов для кеша поиска, см. models.DATA_GENERATION_SEQUENCE
+        migrations.RunSQL(
+            sql="CREATE SEQUENCE IF NOT EXISTS subscribers_data_generation",
+            reverse_sql="DROP SEQUENCE IF EXISTS subscribers_data_generation",
+        ),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 5.1.7 on 2026-10-19 17:10
+
+import re
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Копия subscribers.models на момент миграции: миграция не должна меняться вместе с моделью
+SEARCH_NORMALIZED_FIELDS = {
+    'last_name': 'last_name_norm',
+    'first_name': 'first_name_norm',
+    'middle_name': 'middle_name_norm',
+    'address': 'address_norm',
+    'memo1': 'memo1_norm',
+}
+
+_HOMOGLYPHS = str.maketrans('AaBCcEeHKkMOoPpTXxYy', 'АаВСсЕеНКкМОоРрТХхУу')
+_CYRILLIC_RE = re.compile(r'[а-яё]', re.IGNORECASE)
+
+
+def normalize_search_text(value):
+    if not value:
+        return ''
+    words = [
+        word.translate(_HOMOGLYPHS) if _CYRILLIC_RE.search(word) else word
+        for word in str(value).split()
+    ]
+    return ' '.join(words).casefold().replace('ё', 'е')
+
+
+def fill_search_norm_columns(apps, schema_editor):
+    """
+    Заполняет колонки *_norm существующих абонентов пакетами по id. Миграция
+    неатомарная: каждый пакет (bulk_update) фиксируется своей транзакцией.
+    """
+    Subscriber = apps.get_model('subscribers', 'Subscriber')
+    fields = list(SEARCH_NORMALIZED_FIELDS)
+    last_id = 0
+    while True:
+        batch = list(
+            Subscriber.objects.filter(id__gt=last_id).order_by('id').only('id', *fields)[:BACKFILL_BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for subscriber in batch:
+            for field, norm_field in SEARCH_NORMALIZED_FIELDS.items():
+                setattr(subscriber, norm_field, normalize_search_text(getattr(subscriber, field)))
+        Subscriber.objects.bulk_update(batch, list(SEARCH_NORMALIZED_FIELDS.values()))
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('subscribers', '0025_data_generation_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='last_name_norm',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='Фамилия (ключ поиска)'),
+        ),
+        migrations.AddField(
+            model_name='subscriber',
+            name='first_name_norm',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='Имя (ключ поиска)'),
+        ),
+        migrations.AddField(
+            model_name='subscriber',
+            name='middle_name_norm',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='Отчество (ключ поиска)'),
+        ),
+        migrations.AddField(
+            model_name='subscriber',
+            name='address_norm',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Адрес (ключ поиска)'),
+        ),
+        migrations.AddField(
+            model_name='subscriber',
+            name='memo1_norm',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='Memo1 (ключ поиска)'),
+        ),
+        migrations.RunPython(fill_search_norm_columns, migrations.RunPython.noop),
+        migrations.RemoveIndex(model_name='subscriber', name='sub_last_name_trgm'),
+        migrations.RemoveIndex(model_name='subscriber', name='sub_first_name_trgm'),
+        migrations.RemoveIndex(model_name='subscriber', name='sub_middle_name_trgm'),
+        migrations.RemoveIndex(model_name='subscriber', name='sub_address_trgm'),
+        migrations.RemoveIndex(model_name='subscriber', name='sub_memo1_trgm'),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['last_name_norm'], name='sub_last_name_norm_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['first_name_norm'], name='sub_first_name_norm_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['middle_name_norm'], name='sub_middle_name_norm_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['address_norm'], name='sub_address_norm_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['memo1_norm'], name='sub_memo1_norm_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
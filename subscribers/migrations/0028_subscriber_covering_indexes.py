@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-19 19:20
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0027_subscriber_phonetic_keys'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['number'], include=('id', 'last_name', 'first_name', 'middle_name', 'birth_date', 'is_active'), name='sub_number_prefix_cover', opclasses=['text_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(django.db.models.functions.comparison.Coalesce('last_name', models.Value('')), django.db.models.functions.comparison.Coalesce('first_name', models.Value('')), models.F('id'), include=('number', 'last_name', 'first_name', 'middle_name', 'birth_date', 'is_active'), name='sub_name_keyset_cover'),
+        ),
+        migrations.RemoveIndex(
+            model_name='subscriber',
+            name='sub_number_prefix',
+        ),
+        migrations.RemoveIndex(
+            model_name='subscriber',
+            name='sub_name_keyset',
+        ),
+    ]
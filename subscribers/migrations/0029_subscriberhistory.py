@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-19 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0028_subscriber_covering_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubscriberHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.CharField(max_length=20, verbose_name='Номер')),
+                ('imsi', models.CharField(blank=True, max_length=50, null=True, verbose_name='IMSI')),
+                ('import_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='ID импорта')),
+                ('valid_from', models.DateTimeField(verbose_name='Действует с')),
+                ('valid_to', models.DateTimeField(blank=True, null=True, verbose_name='Действует по')),
+                ('row_hash', models.CharField(max_length=32, verbose_name='Хеш записи')),
+                ('row_id', models.BigIntegerField(verbose_name='ID строки в таблице импорта')),
+            ],
+            options={
+                'verbose_name': 'История номера',
+                'verbose_name_plural': 'История номеров',
+                'indexes': [
+                    models.Index(fields=['number', 'valid_from'], name='sub_history_number'),
+                    models.Index(fields=['imsi', 'valid_from'], name='sub_history_imsi'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(condition=models.Q(('valid_to__isnull', True)), fields=('number',), name='sub_history_open_number'),
+                ],
+            },
+        ),
+    ]
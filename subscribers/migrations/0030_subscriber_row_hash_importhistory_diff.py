@@ -0,0 +1,59 @@
+# Generated by Django 5.1.7 on 2026-10-19 22:40
+
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 50000
+
+# Тот же хеш, что models.subscriber_row_hash: md5 колонок ROW_HASH_COLUMNS через \x1f
+ROW_HASH_SQL = """
+    md5(concat_ws(chr(31),
+        COALESCE(number, ''), COALESCE(last_name, ''), COALESCE(first_name, ''), COALESCE(middle_name, ''),
+        COALESCE(to_char(birth_date, 'YYYY-MM-DD'), ''), COALESCE(birth_place, ''), COALESCE(address, ''),
+        COALESCE(memo1, ''), COALESCE(memo2, ''), COALESCE(imsi, '')
+    ))
+"""
+
+
+def fill_row_hash(apps, schema_editor):
+    """
+    Заполняет row_hash существующих абонентов диапазонами id - без одного долгого UPDATE всей таблицы.
+    Миграция не атомарная: каждый диапазон фиксируется сразу, блокировки строк не копятся до конца.
+    """
+    Subscriber = apps.get_model('subscribers', 'Subscriber')
+    table = schema_editor.quote_name(Subscriber._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM {table}")
+        min_id, max_id = cursor.fetchone()
+        for start in range(min_id, max_id + 1, BACKFILL_BATCH_SIZE):
+            cursor.execute(
+                f"UPDATE {table} SET row_hash = {ROW_HASH_SQL} WHERE id >= %s AND id < %s",
+                [start, start + BACKFILL_BATCH_SIZE]
+            )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('subscribers', '0029_subscriberhistory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='row_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name='Хеш записи'),
+        ),
+        migrations.RunPython(fill_row_hash, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='importhistory',
+            name='diff_stats',
+            field=models.JSONField(blank=True, null=True, verbose_name='Сравнение с архивом'),
+        ),
+        migrations.AddField(
+            model_name='importhistory',
+            name='diff_file',
+            field=models.FileField(blank=True, null=True, upload_to='diffs/%Y/%m/%d/', verbose_name='Файл сравнения с архивом'),
+        ),
+    ]
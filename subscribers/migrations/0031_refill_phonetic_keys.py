@@ -0,0 +1,106 @@
+# Generated by Django 5.1.7 on 2026-10-19 23:30
+
+import re
+
+from django.db import migrations
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Копия subscribers.models на момент миграции: dzh/dj -> дж, ы сводится к и
+PHONETIC_KEY_FIELDS = {
+    'last_name': 'last_name_phonetic',
+    'first_name': 'first_name_phonetic',
+}
+
+_HOMOGLYPHS = str.maketrans('AaBCcEeHKkMOoPpTXxYy', 'АаВСсЕеНКкМОоРрТХхУу')
+_CYRILLIC_RE = re.compile(r'[а-яё]', re.IGNORECASE)
+_TRANSLIT = (
+    ('dzh', 'дж'), ('dj', 'дж'),
+    ('shch', 'щ'), ('sch', 'щ'), ('zh', 'ж'), ('kh', 'х'), ('ch', 'ч'), ('sh', 'ш'), ('ts', 'ц'),
+    ('ya', 'я'), ('ja', 'я'), ('yu', 'ю'), ('ju', 'ю'), ('yo', 'е'), ('jo', 'е'), ('ye', 'е'),
+    ('ph', 'ф'), ('x', 'кс'),
+)
+_TRANSLIT_LETTERS = str.maketrans('abcdefghijklmnopqrstuvwyz', 'абкдефгхийклмнопкрстуввиз')
+_FEMALE_ENDINGS = (('ская', 'ский'), ('цкая', 'цкий'), ('ова', 'ов'), ('ева', 'ев'), ('ина', 'ин'), ('ына', 'ын'))
+_PHONETIC_VOWELS = (('йо', 'и'), ('ио', 'и'), ('йе', 'и'), ('ие', 'и'))
+_PHONETIC_LETTERS = str.maketrans('оыяеэйю', 'аиаиииу')
+_DEVOICE = str.maketrans('бздвгж', 'пстфкш')
+_VOICELESS = set('пстфкшхцчщ')
+_NON_LETTERS_RE = re.compile(r'[^а-я]+')
+
+
+def normalize_search_text(value):
+    if not value:
+        return ''
+    words = [
+        word.translate(_HOMOGLYPHS) if _CYRILLIC_RE.search(word) else word
+        for word in str(value).split()
+    ]
+    return ' '.join(words).casefold().replace('ё', 'е')
+
+
+def _phonetic_word(word):
+    for latin, cyrillic in _TRANSLIT:
+        word = word.replace(latin, cyrillic)
+    word = _NON_LETTERS_RE.sub('', word.translate(_TRANSLIT_LETTERS).replace('ё', 'е'))
+    for female, male in _FEMALE_ENDINGS:
+        if word.endswith(female):
+            word = word[:-len(female)] + male
+            break
+    for group, vowel in _PHONETIC_VOWELS:
+        word = word.replace(group, vowel)
+    word = word.translate(_PHONETIC_LETTERS).replace('ь', '').replace('ъ', '')
+    letters = list(word)
+    for index, letter in enumerate(letters):
+        following = letters[index + 1] if index + 1 < len(letters) else None
+        if following is None or following in _VOICELESS:
+            letters[index] = letter.translate(_DEVOICE)
+    word = ''.join(letters).replace('тс', 'ц')
+    return ''.join(letter for index, letter in enumerate(word) if index == 0 or letter != word[index - 1])
+
+
+def phonetic_key(value):
+    words = (_phonetic_word(word) for word in re.split(r'[\s\-]+', normalize_search_text(value)))
+    return ' '.join(word for word in words if word)[:64]
+
+
+def refill_phonetic_keys(apps, schema_editor):
+    """
+    Пересчитывает фонетические ключи существующих абонентов пакетами по id; пишутся
+    только изменившиеся строки. Миграция неатомарная: каждый пакет фиксируется своей транзакцией.
+    """
+    Subscriber = apps.get_model('subscribers', 'Subscriber')
+    fields = list(PHONETIC_KEY_FIELDS) + list(PHONETIC_KEY_FIELDS.values())
+    last_id = 0
+    while True:
+        batch = list(
+            Subscriber.objects.filter(id__gt=last_id).order_by('id').only('id', *fields)[:BACKFILL_BATCH_SIZE]
+        )
+        if not batch:
+            break
+        changed = []
+        for subscriber in batch:
+            keys = {
+                key_field: phonetic_key(getattr(subscriber, field))
+                for field, key_field in PHONETIC_KEY_FIELDS.items()
+            }
+            if any(getattr(subscriber, key_field) != key for key_field, key in keys.items()):
+                for key_field, key in keys.items():
+                    setattr(subscriber, key_field, key)
+                changed.append(subscriber)
+        if changed:
+            Subscriber.objects.bulk_update(changed, list(PHONETIC_KEY_FIELDS.values()))
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('subscribers', '0030_subscriber_row_hash_importhistory_diff'),
+    ]
+
+    operations = [
+        migrations.RunPython(refill_phonetic_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-20 09:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0031_refill_phonetic_keys'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='subscriber',
+            name='subscribers_number_22e515_idx',
+        ),
+    ]
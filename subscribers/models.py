@@ -1,10 +1,185 @@
-from django.db import models
+import datetime
+import hashlib
+import re
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connection, models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
 
 # Create your models here.
 
+def subscriber_search_vector(subscriber):
+    """
+    Полнотекстовый вектор абонента (конфигурация russian): ФИО - вес A, адрес и место рождения - вес B.
+    Считается в БД из значений полей записи, поэтому пишется тем же INSERT/UPDATE, что и сама запись.
+    При импорте тот же вектор считается в INSERT пакета (tasks._TEMP_SEARCH_VECTOR_SQL)
+    """
+    def values(*fields):
+        return [models.Value(getattr(subscriber, field), output_field=models.TextField()) for field in fields]
+
+    return (
+        SearchVector(*values('last_name', 'first_name', 'middle_name'), config='russian', weight='A')
+        + SearchVector(*values('address', 'birth_place'), config='russian', weight='B')
+    )
+
+# Поколение данных абонентов: растёт один раз на массовую операцию (финализация импорта, откат,
+# прямой импорт) и при правке абонента в админке, но не в Subscriber.save -
+# иначе массовая запись сбрасывала бы кеш на каждой строке. Хранится в последовательности БД,
+# чтобы его видели все процессы; по нему ключуется кеш поиска (subscribers.utils.search_cache_key)
+DATA_GENERATION_SEQUENCE = 'subscribers_data_generation'
+
+
+def get_data_generation():
+    # До первого nextval last_value уже равен стартовому значению (is_called = false),
+    # и первый nextval вернул бы то же число - такое поколение считается предыдущим
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT last_value - CASE WHEN is_called THEN 0 ELSE 1 END "
+            f"FROM {connection.ops.quote_name(DATA_GENERATION_SEQUENCE)}"
+        )
+        return cursor.fetchone()[0]
+
+
+def bump_data_generation():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(%s)", [DATA_GENERATION_SEQUENCE])
+        return cursor.fetchone()[0]
+
+
+# Нормализованные копии текстовых полей для поиска по подстроке: поле -> колонка-ключ.
+# Заполняются при импорте (tasks._prepare_record_data) и в Subscriber.save()
+SEARCH_NORMALIZED_FIELDS = {
+    'last_name': 'last_name_norm',
+    'first_name': 'first_name_norm',
+    'middle_name': 'middle_name_norm',
+    'address': 'address_norm',
+    'memo1': 'memo1_norm',
+}
+
+# Латинские буквы, неотличимые на вид от кириллических
+_HOMOGLYPHS = str.maketrans('AaBCcEeHKkMOoPpTXxYy', 'АаВСсЕеНКкМОоРрТХхУу')
+_CYRILLIC_RE = re.compile(r'[а-яё]', re.IGNORECASE)
+
+
+def normalize_search_text(value):
+    """
+    Ключ поиска: латинские двойники заменены кириллицей (только в словах, где уже есть
+    кириллица - латинские слова и номера паспортов не трогаются), регистр свёрнут,
+    ё -> е, пробелы схлопнуты. Одинаково применяется к данным и к вводу поиска.
+    """
+    if not value:
+        return ''
+    words = [
+        word.translate(_HOMOGLYPHS) if _CYRILLIC_RE.search(word) else word
+        for word in str(value).split()
+    ]
+    return ' '.join(words).casefold().replace('ё', 'е')
+
+
+# Фонетические ключи фамилии и имени для нечёткого поиска: поле -> колонка-ключ.
+# Заполняются там же, где и SEARCH_NORMALIZED_FIELDS
+PHONETIC_KEY_FIELDS = {
+    'last_name': 'last_name_phonetic',
+    'first_name': 'first_name_phonetic',
+}
+
+# Транслитерация латиницы в кириллицу: сначала буквосочетания, потом одиночные буквы.
+# dzh/dj - раньше ja/ju/jo: Khodjaev - Ходжаев, а не Ходяев
+_TRANSLIT = (
+    ('dzh', 'дж'), ('dj', 'дж'),
+    ('shch', 'щ'), ('sch', 'щ'), ('zh', 'ж'), ('kh', 'х'), ('ch', 'ч'), ('sh', 'ш'), ('ts', 'ц'),
+    ('ya', 'я'), ('ja', 'я'), ('yu', 'ю'), ('ju', 'ю'), ('yo', 'е'), ('jo', 'е'), ('ye', 'е'),
+    ('ph', 'ф'), ('x', 'кс'),
+)
+_TRANSLIT_LETTERS = str.maketrans('abcdefghijklmnopqrstuvwyz', 'абкдефгхийклмнопкрстуввиз')
+# Женские окончания фамилий - к мужской форме: Иванова и Иванов дают один ключ
+_FEMALE_ENDINGS = (('ская', 'ский'), ('цкая', 'цкий'), ('ова', 'ов'), ('ева', 'ев'), ('ина', 'ин'), ('ына', 'ын'))
+_PHONETIC_VOWELS = (('йо', 'и'), ('ио', 'и'), ('йе', 'и'), ('ие', 'и'))
+# ы сводится к и, как латинская y после согласной: Charyev и Чарыев, Myradov и Мырадов - один ключ
+_PHONETIC_LETTERS = str.maketrans('оыяеэйю', 'аиаиииу')
+_DEVOICE = str.maketrans('бздвгж', 'пстфкш')
+_VOICELESS = set('пстфкшхцчщ')
+_NON_LETTERS_RE = re.compile(r'[^а-я]+')
+
+
+def _phonetic_word(word):
+    for latin, cyrillic in _TRANSLIT:
+        word = word.replace(latin, cyrillic)
+    word = _NON_LETTERS_RE.sub('', word.translate(_TRANSLIT_LETTERS).replace('ё', 'е'))
+    for female, male in _FEMALE_ENDINGS:
+        if word.endswith(female):
+            word = word[:-len(female)] + male
+            break
+    for group, vowel in _PHONETIC_VOWELS:
+        word = word.replace(group, vowel)
+    word = word.translate(_PHONETIC_LETTERS).replace('ь', '').replace('ъ', '')
+    # Оглушение звонких на конце слова и перед глухими, тс/дс -> ц
+    letters = list(word)
+    for index, letter in enumerate(letters):
+        following = letters[index + 1] if index + 1 < len(letters) else None
+        if following is None or following in _VOICELESS:
+            letters[index] = letter.translate(_DEVOICE)
+    word = ''.join(letters).replace('тс', 'ц')
+    # Удвоенные буквы - одной
+    return ''.join(letter for index, letter in enumerate(word) if index == 0 or letter != word[index - 1])
+
+
+def phonetic_key(value):
+    """
+    Фонетический ключ (вариант «русского метафона»): латиница транслитерируется,
+    женские окончания фамилий приводятся к мужским, безударные гласные сводятся
+    (о/я -> а, е/ё/э/и/й/ы -> и, ю -> у), звонкие оглушаются, удвоения убираются.
+    Ivanoff, Иванов и Иванова дают «иванаф». Ключ строки - ключи слов через пробел.
+    """
+    words = (_phonetic_word(word) for word in re.split(r'[\s\-]+', normalize_search_text(value)))
+    return ' '.join(word for word in words if word)[:64]
+
+
+# Версия записи абонента - колонки, по которым считается хеш содержимого строки (row_hash).
+# Служебные колонки (id, даты, ключи поиска) в хеш не входят: перезагрузка тех же данных
+# даёт тот же хеш. Хеш пишется при импорте (tasks._temp_table_row) и в Subscriber.save();
+# для таблиц без колонки тот же хеш считает SQL (subscribers.history.row_hash_sql)
+ROW_HASH_COLUMNS = (
+    'number', 'last_name', 'first_name', 'middle_name', 'birth_date', 'birth_place',
+    'address', 'memo1', 'memo2', 'imsi',
+)
+
+
+def _row_hash_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
+
+
+def subscriber_row_hash(values):
+    """md5 значений ROW_HASH_COLUMNS (в том же порядке) через разделитель \x1f, NULL - пустая строка"""
+    return hashlib.md5('\x1f'.join(_row_hash_text(value) for value in values).encode('utf-8')).hexdigest()
+
+
+# Колонки строки списка абонентов и результатов поиска по номеру. Входят в покрывающие
+# индексы sub_number_prefix_cover и sub_name_keyset_cover (INCLUDE), поэтому выборка
+# .only(*SUBSCRIBER_LIST_COLUMNS) читается index-only scan, без обращения к строкам таблицы
+SUBSCRIBER_LIST_COLUMNS = ('id', 'number', 'last_name', 'first_name', 'middle_name', 'birth_date')
+_COVER_INCLUDE = ('last_name', 'first_name', 'middle_name', 'birth_date', 'is_active')
+
+# Колонки страницы результатов поиска: строка списка плюс адрес, паспорт и IMSI;
+# без поискового вектора и колонок-ключей, которые шаблону не нужны
+SUBSCRIBER_SEARCH_COLUMNS = SUBSCRIBER_LIST_COLUMNS + ('address', 'memo1', 'memo2', 'imsi')
+
+# Ключ постраничного вывода абонентов (vl09_web.pagination.KeysetPaginator): сортировка
+# по ФИО, NULL - как пустая строка; выражения совпадают с индексом sub_name_keyset_cover
+SUBSCRIBER_KEYSET_KEYS = (
+    ("""COALESCE("subscribers_subscriber"."last_name", '')""", lambda subscriber: subscriber.last_name or ''),
+    ("""COALESCE("subscribers_subscriber"."first_name", '')""", lambda subscriber: subscriber.first_name or ''),
+    ('"subscribers_subscriber"."id"', 'id'),
+)
+
 class Subscriber(models.Model):
     """Модель для хранения данных об абонентах"""
     GENDER_CHOICES = [
@@ -15,6 +190,8 @@ class Subscriber(models.Model):
     # Поля из CSV-файла
     original_id = models.PositiveIntegerField(_('Оригинальный ID'), null=True, blank=True)
     number = models.CharField(_('Номер'), max_length=20, unique=True, default='')
+    # Номер задом наперёд: поиск по последним цифрам - это поиск по префиксу этой колонки
+    number_reversed = models.CharField(_('Номер (обратный)'), max_length=20, blank=True, default='', editable=False)
     last_name = models.CharField(_('Фамилия'), max_length=255, blank=True, null=True)
     first_name = models.CharField(_('Имя'), max_length=255, blank=True, null=True)
     middle_name = models.CharField(_('Отчество'), max_length=255, blank=True, null=True)
@@ -38,18 +215,65 @@ class Subscriber(models.Model):
     import_history = models.ForeignKey('ImportHistory', on_delete=models.SET_NULL, 
                                        null=True, blank=True, verbose_name=_('История импорта'))
     
+    # Ключи поиска по подстроке, см. SEARCH_NORMALIZED_FIELDS и normalize_search_text
+    last_name_norm = models.CharField(_('Фамилия (ключ поиска)'), max_length=255, blank=True, default='', editable=False)
+    first_name_norm = models.CharField(_('Имя (ключ поиска)'), max_length=255, blank=True, default='', editable=False)
+    middle_name_norm = models.CharField(_('Отчество (ключ поиска)'), max_length=255, blank=True, default='', editable=False)
+    address_norm = models.TextField(_('Адрес (ключ поиска)'), blank=True, default='', editable=False)
+    memo1_norm = models.CharField(_('Memo1 (ключ поиска)'), max_length=255, blank=True, default='', editable=False)
+    
+    # Нечёткий поиск по фамилии и имени, см. PHONETIC_KEY_FIELDS и phonetic_key
+    last_name_phonetic = models.CharField(_('Фамилия (фонетический ключ)'), max_length=64, blank=True, default='', editable=False)
+    first_name_phonetic = models.CharField(_('Имя (фонетический ключ)'), max_length=64, blank=True, default='', editable=False)
+    
+    # Хеш содержимого строки, см. ROW_HASH_COLUMNS
+    row_hash = models.CharField(_('Хеш записи'), max_length=32, blank=True, default='', editable=False)
+    
+    # Полнотекстовый поиск, см. subscriber_search_vector
+    search_vector = SearchVectorField(_('Поисковый вектор'), null=True, blank=True, editable=False)
+    
     class Meta:
         verbose_name = _('Абонент')
         verbose_name_plural = _('Абоненты')
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['number']),
             models.Index(fields=['last_name', 'first_name']),
             models.Index(fields=['imsi']),
+            # Триграммные индексы (pg_trgm) под поиск по подстроке (contains, col LIKE '%...%'):
+            # текстовые поля ищутся по нормализованным колонкам *_norm без UPPER() на каждой строке
+            GinIndex(fields=['last_name_norm'], opclasses=['gin_trgm_ops'], name='sub_last_name_norm_trgm'),
+            GinIndex(fields=['first_name_norm'], opclasses=['gin_trgm_ops'], name='sub_first_name_norm_trgm'),
+            GinIndex(fields=['middle_name_norm'], opclasses=['gin_trgm_ops'], name='sub_middle_name_norm_trgm'),
+            GinIndex(fields=['address_norm'], opclasses=['gin_trgm_ops'], name='sub_address_norm_trgm'),
+            GinIndex(fields=['memo1_norm'], opclasses=['gin_trgm_ops'], name='sub_memo1_norm_trgm'),
+            GinIndex(fields=['number'], opclasses=['gin_trgm_ops'], name='sub_number_trgm'),
+            GinIndex(fields=['imsi'], opclasses=['gin_trgm_ops'], name='sub_imsi_trgm'),
+            GinIndex(fields=['search_vector'], name='sub_search_vector_gin'),
+            # Нечёткий поиск: кандидаты выбираются равенством фонетического ключа
+            models.Index(fields=['last_name_phonetic'], name='sub_last_name_phonetic'),
+            models.Index(fields=['first_name_phonetic'], name='sub_first_name_phonetic'),
+            # LIKE 'x%' по префиксу номера и по префиксу обратного номера (= суффиксу номера);
+            # индекс префикса покрывает и точное совпадение, см. SUBSCRIBER_LIST_COLUMNS
+            models.Index(fields=['number'], opclasses=['text_pattern_ops'], include=('id',) + _COVER_INCLUDE,
+                         name='sub_number_prefix_cover'),
+            models.Index(fields=['number_reversed'], opclasses=['text_pattern_ops'], name='sub_number_suffix'),
+            # Постраничный вывод по ключу, см. SUBSCRIBER_KEYSET_KEYS и SUBSCRIBER_LIST_COLUMNS
+            models.Index(Coalesce('last_name', models.Value('')), Coalesce('first_name', models.Value('')), 'id',
+                         include=('number',) + _COVER_INCLUDE, name='sub_name_keyset_cover'),
         ]
     
     def __str__(self):
         return f"{self.last_name} {self.first_name} ({self.number})"
+    
+    def save(self, *args, **kwargs):
+        self.number_reversed = (self.number or '')[::-1]
+        for field, norm_field in SEARCH_NORMALIZED_FIELDS.items():
+            setattr(self, norm_field, normalize_search_text(getattr(self, field)))
+        for field, key_field in PHONETIC_KEY_FIELDS.items():
+            setattr(self, key_field, phonetic_key(getattr(self, field)))
+        self.row_hash = subscriber_row_hash(getattr(self, column) for column in ROW_HASH_COLUMNS)
+        self.search_vector = subscriber_search_vector(self)
+        super().save(*args, **kwargs)
 
 class ImportHistory(models.Model):
     """Модель для хранения истории импорта данных"""
@@ -79,6 +303,7 @@ class ImportHistory(models.Model):
     info_message = models.TextField('Информационное сообщение', blank=True, null=True)
     uploaded_file = models.FileField('Файл импорта', upload_to='imports/%Y/%m/%d/', blank=True, null=True)
     processed_rows = models.PositiveIntegerField('Обработано записей', default=0)
+    resume_byte_offset = models.BigIntegerField('Смещение в файле для резюме', default=0)
     phase = models.CharField('Этап', max_length=50, default='pending')
     archived_done = models.BooleanField('Архивирование завершено', default=False)
     progress_percent = models.PositiveIntegerField('Прогресс, %', default=0)
@@ -86,6 +311,12 @@ class ImportHistory(models.Model):
     cancel_requested = models.BooleanField('Отмена запрошена', default=False)
     last_heartbeat_at = models.DateTimeField('Последний heartbeat', null=True, blank=True)
     stop_reason = models.CharField('Причина остановки', max_length=255, null=True, blank=True)
+    finalize_stats = models.JSONField('Проверки и тайминги финализации', null=True, blank=True)
+    rolled_back_at = models.DateTimeField('Дата отката', null=True, blank=True)
+    rollback_table_name = models.CharField('Архивная таблица с данными до отката', max_length=255, blank=True, null=True)
+    rollback_stats = models.JSONField('Тайминги отката', null=True, blank=True)
+    diff_stats = models.JSONField('Сравнение с архивом', null=True, blank=True)
+    diff_file = models.FileField('Файл сравнения с архивом', upload_to='diffs/%Y/%m/%d/', blank=True, null=True)
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='imports')
     import_session_id = models.CharField('Уникальный ID сессии импорта', max_length=50, unique=True, default='')
@@ -119,3 +350,40 @@ class ImportError(models.Model):
 
     def __str__(self):
         return f'Ошибка в записи {self.row_index}: {self.message[:50]}'
+
+
+class SubscriberHistory(models.Model):
+    """
+    Индекс истории номеров: интервал [valid_from, valid_to), в котором номер принадлежал
+    одной и той же версии записи абонента (row_hash). Ведётся при подмене таблицы
+    (финализация импорта, откат) - см. subscribers.history. Сами данные не копируются:
+    указатель - row_id в таблице, загруженной импортом import_id (её находит манифест
+    таблицы); та же версия есть и в любой таблице, действовавшей внутри интервала.
+    """
+    number = models.CharField(_('Номер'), max_length=20)
+    imsi = models.CharField('IMSI', max_length=50, blank=True, null=True)
+    # Не внешний ключ: записи ImportHistory чистятся (cleanup_old_import_data), а указатель
+    # должен жить, пока жива таблица с манифестом этого импорта
+    import_id = models.PositiveIntegerField(_('ID импорта'), null=True, blank=True)
+    valid_from = models.DateTimeField(_('Действует с'))
+    valid_to = models.DateTimeField(_('Действует по'), null=True, blank=True)
+    row_hash = models.CharField(_('Хеш записи'), max_length=32)
+    row_id = models.BigIntegerField(_('ID строки в таблице импорта'))
+
+    class Meta:
+        verbose_name = _('История номера')
+        verbose_name_plural = _('История номеров')
+        indexes = [
+            # Запрос на момент времени: number = X AND valid_from <= D AND (valid_to > D OR NULL)
+            models.Index(fields=['number', 'valid_from'], name='sub_history_number'),
+            models.Index(fields=['imsi', 'valid_from'], name='sub_history_imsi'),
+        ]
+        constraints = [
+            # Номер уникален в таблице абонентов - открытый интервал у него один;
+            # индекс служит и сверке с новой таблицей при подмене
+            models.UniqueConstraint(fields=['number'], condition=models.Q(valid_to__isnull=True),
+                                    name='sub_history_open_number'),
+        ]
+
+    def __str__(self):
+        return f"{self.number}: {self.valid_from:%d.%m.%Y %H:%M} - {self.valid_to or '...'}"
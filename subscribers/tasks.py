@@ -1,17 +1,33 @@
+import bz2
+import contextlib
 import csv
+import gzip
+import hashlib
 import io
 import datetime
+import lzma
+import zipfile
 import logging
 import re
 import threading
 import os
+import queue
+import time
 from pathlib import Path
 from typing import Optional, Tuple
 from django.conf import settings
-from django.db import transaction, connection
+from django.db import transaction, connection, OperationalError
+from django.db.models import Q
 from django.utils import timezone
 
-from .models import Subscriber, ImportHistory, ImportError
+from .models import (
+    Subscriber, ImportHistory, ImportError, bump_data_generation,
+    SEARCH_NORMALIZED_FIELDS, normalize_search_text, PHONETIC_KEY_FIELDS, phonetic_key,
+    ROW_HASH_COLUMNS, subscriber_row_hash,
+)
+from .typeahead import start_rebuild_async as start_typeahead_rebuild
+from .history import update_history_index
+from .manifest import get_table_manifest, read_table_manifest, write_table_manifest
 
 def _split_schema_name(qualified_name: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
     """Разделяет имя вида 'schema.object' на схему и объект."""
@@ -45,56 +61,396 @@ def _create_temp_table(temp_table_name):
 
     with connection.cursor() as cursor:
         cursor.execute(f"CREATE TABLE {qn(temp_table_name)} (LIKE {qn(main_table)} INCLUDING ALL)")
-        # Удаляем наследованный default, чтобы привязать отдельную последовательность
-        cursor.execute(f"ALTER TABLE {qn(temp_table_name)} ALTER COLUMN id DROP DEFAULT")
-        cursor.execute(f"DROP SEQUENCE IF EXISTS {qn(temp_sequence)}")
-        cursor.execute(f"CREATE SEQUENCE {qn(temp_sequence)} START WITH 1")
-        cursor.execute(f"ALTER SEQUENCE {qn(temp_sequence)} OWNED BY {qn(temp_table_name)}.id")
         cursor.execute(
-            f"ALTER TABLE {qn(temp_table_name)} ALTER COLUMN id SET DEFAULT nextval(%s)",
-            [temp_sequence]
+            "SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'",
+            [qn(temp_table_name)]
         )
+        # id - identity-колонка (таблицы, созданные Django 4.1+): LIKE ... INCLUDING ALL уже
+        # создал для неё собственную последовательность
+        if not cursor.fetchone()[0]:
+            # Удаляем наследованный default, чтобы привязать отдельную последовательность
+            cursor.execute(f"ALTER TABLE {qn(temp_table_name)} ALTER COLUMN id DROP DEFAULT")
+            cursor.execute(f"DROP SEQUENCE IF EXISTS {qn(temp_sequence)}")
+            cursor.execute(f"CREATE SEQUENCE {qn(temp_sequence)} START WITH 1")
+            cursor.execute(f"ALTER SEQUENCE {qn(temp_sequence)} OWNED BY {qn(temp_table_name)}.id")
+            cursor.execute(
+                f"ALTER TABLE {qn(temp_table_name)} ALTER COLUMN id SET DEFAULT nextval(%s)",
+                [temp_sequence]
+            )
+        # GIN-индексы (триграммы) дорого поддерживать при пакетной вставке -
+        # они строятся одним проходом при финализации (_rebuild_missing_indexes)
+        cursor.execute("""
+            SELECT i.relname
+            FROM pg_index ix
+            JOIN pg_class i ON i.oid = ix.indexrelid
+            JOIN pg_am am ON am.oid = i.relam
+            WHERE ix.indrelid = %s::regclass AND am.amname = 'gin'
+        """, [qn(temp_table_name)])
+        for (index_name,) in cursor.fetchall():
+            cursor.execute(f"DROP INDEX {qn(index_name)}")
     logger.info(f"[OK] Временная таблица {temp_table_name} создана успешно")
     return temp_table_name
 
+_TEMP_TABLE_COLUMNS = (
+    'original_id', 'number', 'number_reversed', 'last_name', 'first_name', 'middle_name',
+    'address', 'memo1', 'memo2', 'birth_place', 'birth_date', 'imsi',
+    'gender', 'email', 'is_active', 'created_at', 'updated_at', 'import_history_id',
+) + tuple(SEARCH_NORMALIZED_FIELDS.values()) + tuple(PHONETIC_KEY_FIELDS.values()) + ('row_hash',)
+
+# Хеш версии записи считается по уже обрезанным значениям - тем, что лягут в таблицу
+_ROW_HASH_SOURCE_INDEXES = tuple(_TEMP_TABLE_COLUMNS.index(column) for column in ROW_HASH_COLUMNS)
+
+# Полнотекстовый вектор считается прямо в INSERT пакета - без триггеров и без UPDATE всей
+# таблицы после загрузки; должен совпадать с models.subscriber_search_vector
+_SEARCH_VECTOR_SOURCE_COLUMNS = ('last_name', 'first_name', 'middle_name', 'address', 'birth_place')
+_TEMP_SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('russian', concat_ws(' ', %s::text, %s::text, %s::text)), 'A')"
+    " || setweight(to_tsvector('russian', concat_ws(' ', %s::text, %s::text)), 'B')"
+)
+_SEARCH_VECTOR_SOURCE_INDEXES = tuple(_TEMP_TABLE_COLUMNS.index(column) for column in _SEARCH_VECTOR_SOURCE_COLUMNS)
+
+# Ограничение PostgreSQL на число параметров в одном запросе - 65535
+_TEMP_INSERT_CHUNK_ROWS = 1000
+
+
+def _temp_table_row(record_data):
+    """Готовит значения колонок временной таблицы в порядке _TEMP_TABLE_COLUMNS"""
+    now = timezone.now()
+    # Дополнительная защита - обрезаем все поля до максимальной длины
+    row = [
+        record_data['original_id'],
+        (record_data['number'] or '')[:20],  # Номер: максимум 20 символов
+        (record_data['number'] or '')[:20][::-1],  # Обратный номер - для поиска по последним цифрам
+        (record_data['last_name'] or '')[:100],  # Фамилия: максимум 100 символов
+        (record_data['first_name'] or '')[:100],  # Имя: максимум 100 символов
+        (record_data['middle_name'] or '')[:100] if record_data['middle_name'] else None,  # Отчество: максимум 100 символов
+        record_data['address'],  # TEXT поле - без ограничений
+        (record_data['memo1'] or '')[:255] if record_data['memo1'] else None,  # Memo1: максимум 255 символов
+        (record_data['memo2'] or '')[:255] if record_data['memo2'] else None,  # Memo2: максимум 255 символов
+        (record_data['birth_place'] or '')[:255] if record_data['birth_place'] else None,  # Место рождения: максимум 255 символов
+        record_data['birth_date'],
+        (record_data['imsi'] or '')[:50] if record_data['imsi'] else None,  # IMSI: максимум 50 символов
+        None,  # gender
+        None,  # email
+        True,  # is_active
+        now,  # created_at
+        now,  # updated_at
+        record_data['import_history_id'],
+        # Ключи поиска (*_norm), см. SEARCH_NORMALIZED_FIELDS; адрес - TEXT
+        *(
+            record_data[norm_field] if field == 'address' else record_data[norm_field][:255]
+            for field, norm_field in SEARCH_NORMALIZED_FIELDS.items()
+        ),
+        # Фонетические ключи, см. PHONETIC_KEY_FIELDS
+        *(record_data[key_field] for key_field in PHONETIC_KEY_FIELDS.values()),
+    ]
+    row.append(subscriber_row_hash(row[index] for index in _ROW_HASH_SOURCE_INDEXES))
+    return row
+
+
+def _insert_batch_into_temp_table(temp_table_name, rows):
+    """Вставляет пакет подготовленных строк (см. _temp_table_row) во временную таблицу многострочным INSERT"""
+    if not rows:
+        return
+    placeholders = '(' + ', '.join(['%s'] * len(_TEMP_TABLE_COLUMNS)) + ', ' + _TEMP_SEARCH_VECTOR_SQL + ')'
+    columns = ', '.join(_TEMP_TABLE_COLUMNS + ('search_vector',))
+    with connection.cursor() as cursor:
+        for offset in range(0, len(rows), _TEMP_INSERT_CHUNK_ROWS):
+            chunk = rows[offset:offset + _TEMP_INSERT_CHUNK_ROWS]
+            params = []
+            for row in chunk:
+                params.extend(row)
+                params.extend(row[index] for index in _SEARCH_VECTOR_SOURCE_INDEXES)
+            cursor.execute(
+                f"INSERT INTO {connection.ops.quote_name(temp_table_name)} ({columns}) VALUES "
+                + ', '.join([placeholders] * len(chunk)),
+                params
+            )
+
+
 def _insert_into_temp_table(temp_table_name, record_data):
     """Вставляет запись во временную таблицу"""
-    # logger.debug(f"[INSERT] Вставка записи ID={record_data['original_id']} в {temp_table_name}")
+    _insert_batch_into_temp_table(temp_table_name, [_temp_table_row(record_data)])
+
+@contextlib.contextmanager
+def _timed(timings, key):
+    """Записывает длительность блока в timings[key] (мс)."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[key] = int((time.monotonic() - started) * 1000)
+
+
+def _validate_temp_table(import_history, timings):
+    """
+    Готовит временную таблицу к подмене и проверяет её целостность.
+
+    VACUUM (ANALYZE) собирает статистику планировщика (иначе первые поиски после
+    подмены выбирают плохие планы) и заполняет карту видимости, поэтому проверки
+    ниже выполняются index-only сканированием индексов по number.
+
+    Returns:
+        dict с результатами проверок; при нарушении целостности - исключение
+    """
+    temp_table_name = import_history.temp_table_name
+    table = _quote_db_object(temp_table_name)
+    checks = {}
+
     with connection.cursor() as cursor:
-        # Дополнительная защита - обрезаем все поля до максимальной длины
-        safe_data = [
-            record_data['original_id'],
-            (record_data['number'] or '')[:20],  # Номер: максимум 20 символов
-            (record_data['last_name'] or '')[:100],  # Фамилия: максимум 100 символов
-            (record_data['first_name'] or '')[:100],  # Имя: максимум 100 символов
-            (record_data['middle_name'] or '')[:100] if record_data['middle_name'] else None,  # Отчество: максимум 100 символов
-            record_data['address'],  # TEXT поле - без ограничений
-            (record_data['memo1'] or '')[:255] if record_data['memo1'] else None,  # Memo1: максимум 255 символов
-            (record_data['memo2'] or '')[:255] if record_data['memo2'] else None,  # Memo2: максимум 255 символов
-            (record_data['birth_place'] or '')[:255] if record_data['birth_place'] else None,  # Место рождения: максимум 255 символов
-            record_data['birth_date'],
-            (record_data['imsi'] or '')[:50] if record_data['imsi'] else None,  # IMSI: максимум 50 символов
-            None,  # gender
-            None,  # email
-            True,  # is_active
-            timezone.now(),  # created_at
-            timezone.now(),  # updated_at
-            record_data['import_history_id']
-        ]
-        
-        cursor.execute(f"""
-            INSERT INTO {temp_table_name} (
-                original_id, number, last_name, first_name, middle_name, 
-                address, memo1, memo2, birth_place, birth_date, imsi, 
-                gender, email, is_active, created_at, updated_at, import_history_id
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+        with _timed(timings, 'analyze_ms'):
+            if connection.in_atomic_block:
+                # VACUUM нельзя выполнить внутри транзакции
+                cursor.execute(f"ANALYZE {table}")
+            else:
+                cursor.execute(f"VACUUM (ANALYZE) {table}")
+
+        with _timed(timings, 'row_count_ms'):
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            checks['row_count'] = cursor.fetchone()[0]
+
+        with _timed(timings, 'empty_numbers_ms'):
+            cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE number IS NULL OR number = ''")
+            checks['empty_numbers'] = cursor.fetchone()[0]
+
+        with _timed(timings, 'uniqueness_ms'):
+            # Уникальный индекс по number (копируется из основной таблицы) гарантирует уникальность
+            cursor.execute("""
+                SELECT 1
+                FROM pg_index i
+                JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+                WHERE i.indrelid = %s::regclass
+                  AND i.indisunique AND i.indisvalid AND i.indnatts = 1
+                  AND a.attname = 'number'
+                LIMIT 1
+            """, [temp_table_name])
+            if cursor.fetchone():
+                checks['duplicate_numbers'] = 0
+                checks['uniqueness_source'] = 'unique_index'
+            else:
+                cursor.execute(f"""
+                    SELECT COUNT(*) FROM (
+                        SELECT number FROM {table} GROUP BY number HAVING COUNT(*) > 1
+                    ) AS duplicates
+                """)
+                checks['duplicate_numbers'] = cursor.fetchone()[0]
+                checks['uniqueness_source'] = 'group_by'
+
+    logger.info(f"[CHECK] Проверка временной таблицы {temp_table_name}: {checks}, тайминги: {timings}")
+
+    problems = []
+    if checks['row_count'] != import_history.records_created:
+        problems.append(
+            f"строк во временной таблице {checks['row_count']}, а создано записей {import_history.records_created}"
+        )
+    if checks['duplicate_numbers']:
+        problems.append(f"повторяющихся номеров: {checks['duplicate_numbers']}")
+    if problems:
+        raise Exception("Проверка временной таблицы не пройдена: " + "; ".join(problems))
+    if checks['empty_numbers']:
+        logger.warning(f"[WARNING] Во временной таблице {checks['empty_numbers']} записей без номера")
+    return checks
+
+
+# Горячие индексы новой таблицы для прогрева: ведущая колонка -> порядок обхода при
+# запасном прогреве сканированием (в порядке приоритета)
+_PREWARM_INDEX_COLUMNS = (
+    ('number', 'number'),
+    ('last_name', 'last_name, first_name'),
+    ('imsi', 'imsi'),
+)
+
+
+def _prewarm_temp_table(import_history, timings):
+    """
+    Прогревает кеш перед подменой таблиц: загружает в shared buffers горячие индексы
+    (number, last_name/first_name, imsi) и карту видимости новой таблицы.
+    Буферы привязаны к файлам отношений, поэтому переименование их не сбрасывает.
+
+    Использует pg_prewarm, если расширение установлено, иначе обходит индексы
+    index-only сканированием. Ограничен IMPORT_PREWARM_MAX_MB и IMPORT_PREWARM_MAX_SECONDS;
+    ошибки прогрева не прерывают финализацию.
+
+    Returns:
+        dict с телеметрией прогрева или None, если прогрев отключён
+    """
+    if not getattr(settings, 'IMPORT_PREWARM_ENABLED', True):
+        return None
+
+    budget_bytes = getattr(settings, 'IMPORT_PREWARM_MAX_MB', 512) * 1024 * 1024
+    deadline = time.monotonic() + getattr(settings, 'IMPORT_PREWARM_MAX_SECONDS', 30)
+    temp_table_name = import_history.temp_table_name
+    table = _quote_db_object(temp_table_name)
+    result = {'method': None, 'relations': [], 'bytes': 0, 'budget_exhausted': False}
+
+    def _remaining_ms():
+        return int((deadline - time.monotonic()) * 1000)
+
+    with _timed(timings, 'prewarm_ms'):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm'")
+                result['method'] = 'pg_prewarm' if cursor.fetchone() else 'index_scan'
+                cursor.execute("SELECT current_setting('block_size')::int")
+                block_size = cursor.fetchone()[0]
+                cursor.execute("""
+                    SELECT a.attname, i.indexrelid::regclass::text, pg_relation_size(i.indexrelid)
+                    FROM pg_index i
+                    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+                    WHERE i.indrelid = %s::regclass AND i.indisvalid
+                      AND a.attname = ANY(%s)
+                    ORDER BY i.indisunique DESC
+                """, [temp_table_name, [column for column, _ in _PREWARM_INDEX_COLUMNS]])
+                indexes = cursor.fetchall()
+
+            priority = [column for column, _ in _PREWARM_INDEX_COLUMNS]
+            indexes.sort(key=lambda row: priority.index(row[0]))
+            scan_order = dict(_PREWARM_INDEX_COLUMNS)
+            warmed_columns = set()
+
+            if result['method'] == 'pg_prewarm':
+                # Сначала карта видимости: она нужна index-only сканированиям и занимает мало места
+                targets = [(temp_table_name, 'vm', None)] + [(name, 'main', size) for _, name, size in indexes]
+            else:
+                targets = [(name, column, size) for column, name, size in indexes]
+
+            for relation, fork_or_column, size in targets:
+                remaining_ms = _remaining_ms()
+                remaining_bytes = budget_bytes - result['bytes']
+                if remaining_ms <= 0 or remaining_bytes < block_size:
+                    result['budget_exhausted'] = True
+                    break
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(f"SET LOCAL statement_timeout = {remaining_ms}")
+                    if result['method'] == 'pg_prewarm':
+                        last_block = None
+                        if size is not None and size > remaining_bytes:
+                            last_block = remaining_bytes // block_size - 1
+                            result['budget_exhausted'] = True
+                        cursor.execute(
+                            "SELECT pg_prewarm(%s::regclass, 'buffer', %s, NULL, %s)",
+                            [relation, fork_or_column, last_block]
+                        )
+                        blocks = cursor.fetchone()[0]
+                    else:
+                        # Без pg_prewarm читаем индекс целиком index-only сканированием (читает и карту видимости)
+                        if fork_or_column in warmed_columns:
+                            continue
+                        cursor.execute("SET LOCAL enable_seqscan = off")
+                        cursor.execute("SET LOCAL enable_bitmapscan = off")
+                        cursor.execute(
+                            f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} ORDER BY {scan_order[fork_or_column]}) AS warm"
+                        )
+                        blocks = (size or 0) // block_size
+                        warmed_columns.add(fork_or_column)
+                result['bytes'] += blocks * block_size
+                result['relations'].append({'name': relation, 'fork': fork_or_column, 'blocks': blocks})
+        except Exception as e:  # noqa: BLE001 - прогрев не должен мешать финализации
+            logger.warning(f"[WARNING] Прогрев кеша прерван: {str(e)}")
+            result['error'] = str(e)
+
+    logger.info(f"[PREWARM] Прогрев {temp_table_name}: {result}, {timings.get('prewarm_ms')} мс")
+    return result
+
+
+def _sync_table_sequence(cursor, table_name):
+    """
+    Выставляет последовательность id таблицы по MAX(id). Вызывается до подмены таблиц,
+    вне блокировок: в подменяемую таблицу в это время никто не пишет.
+    """
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table_name])
+    sequence_name = cursor.fetchone()[0]
+    if not sequence_name:
+        raise Exception(f"Не удалось определить последовательность id для таблицы {table_name}")
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {_quote_db_object(table_name)}")
+    max_id = cursor.fetchone()[0] or 0
+    cursor.execute("SELECT setval(%s, %s, %s)", [sequence_name, max_id if max_id else 1, bool(max_id)])
+    return sequence_name
+
+
+def _is_lock_timeout(error):
+    """Проверяет, что ошибка БД - истечение lock_timeout (SQLSTATE 55P03)."""
+    return getattr(error.__cause__, 'pgcode', None) == '55P03'
+
+
+def _swap_tables(incoming_table_name, archive_table_name, timings):
+    """
+    Подменяет основную таблицу абонентов: основная -> archive_table_name,
+    incoming_table_name -> основная. В транзакции только блокировки и два RENAME.
+
+    Блокировки берутся с коротким lock_timeout (FINALIZE_LOCK_TIMEOUT_MS), чтобы долгий
+    поиск не держал подмену, а новые поиски не копились в очереди за ней. При таймауте
+    попытка повторяется с экспоненциальной паузой, всего FINALIZE_LOCK_RETRIES раз.
+    Суммарное ожидание блокировок пишется в timings['lock_wait_ms'].
+    """
+    qn = connection.ops.quote_name
+    main_table_name = Subscriber._meta.db_table
+    lock_timeout_ms = int(getattr(settings, 'FINALIZE_LOCK_TIMEOUT_MS', 2000))
+    retries = max(1, int(getattr(settings, 'FINALIZE_LOCK_RETRIES', 10)))
+    backoff_seconds = float(getattr(settings, 'FINALIZE_RETRY_BACKOFF_SECONDS', 1))
+    timings.setdefault('lock_wait_ms', 0)
+
+    for attempt in range(1, retries + 1):
+        timings['lock_attempts'] = attempt
+        lock_started = time.monotonic()
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(f"SET LOCAL lock_timeout = {lock_timeout_ms}")
+                    # Берём эксклюзивные блокировки, чтобы избежать конкурентного доступа
+                    cursor.execute(f"LOCK TABLE {qn(main_table_name)} IN ACCESS EXCLUSIVE MODE")
+                    cursor.execute(f"LOCK TABLE {_quote_db_object(incoming_table_name)} IN ACCESS EXCLUSIVE MODE")
+                    timings['lock_wait_ms'] += int((time.monotonic() - lock_started) * 1000)
+
+                    swap_started = time.monotonic()
+                    logger.info(f"[RENAME] Основная таблица -> {archive_table_name}")
+                    cursor.execute(f"ALTER TABLE {qn(main_table_name)} RENAME TO {qn(archive_table_name)}")
+                    logger.info(f"[RENAME] {incoming_table_name} -> основная")
+                    cursor.execute(f"ALTER TABLE {_quote_db_object(incoming_table_name)} RENAME TO {qn(main_table_name)}")
+            timings['swap_ms'] = int((time.monotonic() - swap_started) * 1000)
+            return
+        except OperationalError as e:
+            if not _is_lock_timeout(e):
+                raise
+            timings['lock_wait_ms'] += int((time.monotonic() - lock_started) * 1000)
+            if attempt == retries:
+                raise Exception(
+                    f"Не удалось получить блокировки таблиц за {retries} попыток "
+                    f"(lock_timeout {lock_timeout_ms} мс): таблица занята долгими запросами"
+                ) from e
+            delay = min(backoff_seconds * 2 ** (attempt - 1), 30)
+            logger.warning(
+                f"[LOCK] Блокировки не получены за {lock_timeout_ms} мс (попытка {attempt}/{retries}), "
+                f"повтор через {delay} с"
             )
-        """, safe_data)
-    # logger.debug(f"[OK] Запись ID={record_data['original_id']} вставлена в {temp_table_name}")
+            time.sleep(delay)
+
+
+def _update_history_index_after_swap(table_name, import_id, changed_at, timings):
+    """
+    Обновляет индекс истории номеров (subscribers.history) после подмены таблиц.
+    Данные уже подменены, поэтому ошибка не отменяет финализацию/откат: она попадает
+    в отчёт, индекс можно перестроить командой rebuild_subscriber_history.
+    """
+    try:
+        with _timed(timings, 'history_ms'):
+            return update_history_index(table_name, import_id, changed_at)
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"[ERROR] Не удалось обновить индекс истории номеров: {str(e)}")
+        return {'error': str(e)}
+
 
 def _finalize_import(import_history):
-    """Финализирует импорт: переименовывает таблицы, чтобы минимизировать простои."""
+    """
+    Финализирует импорт: переименовывает таблицы, чтобы минимизировать простои.
+
+    Построение индексов, проверки, ANALYZE, прогрев кеша и синхронизация последовательности
+    выполняются до блокировок; под ACCESS EXCLUSIVE остаются только переименования (_swap_tables).
+
+    Returns:
+        dict с результатами проверок и длительностью этапов (мс), он же сохраняется
+        в ImportHistory.finalize_stats
+    """
     temp_table_name = import_history.temp_table_name
     if not temp_table_name:
         raise Exception("Не указана временная таблица для финализации импорта")
@@ -107,63 +463,288 @@ def _finalize_import(import_history):
     logger.info(f"[FILE] Временная таблица: {temp_table_name}")
     logger.info(f"[ARCHIVE] Новая архивная таблица: {archive_table_name}")
 
-    qn = connection.ops.quote_name
-    main_schema, main_table_only = _split_schema_name(main_table_name)
-    temp_schema, temp_table_only = _split_schema_name(temp_table_name)
-    archive_schema, archive_table_only = _split_schema_name(archive_table_name)
-
-    # Имена последовательностей
-    main_sequence_name = f"{main_table_only}_id_seq" if main_table_only else "id_seq"
-    main_sequence_qualified = _qualified_name(main_schema, main_sequence_name)
-    temp_sequence_name = f"{temp_table_only}_id_seq" if temp_table_only else "id_seq"
-    temp_sequence_qualified = _qualified_name(temp_schema, temp_sequence_name)
-    archive_sequence_name = f"{archive_table_only}_id_seq" if archive_table_only else "id_seq"
-
+    timings = {}
     try:
-        with transaction.atomic():
+        # Индексы, снятые на время загрузки (см. _create_temp_table)
+        with _timed(timings, 'indexes_ms'):
             with connection.cursor() as cursor:
-                # Берём эксклюзивные блокировки, чтобы избежать конкурентного доступа
-                cursor.execute(f"LOCK TABLE {qn(main_table_name)} IN ACCESS EXCLUSIVE MODE")
-                cursor.execute(f"LOCK TABLE {qn(temp_table_name)} IN ACCESS EXCLUSIVE MODE")
-
-                # Переименовываем основную таблицу в архивную
-                logger.info("[RENAME] Основная таблица -> архив")
-                cursor.execute(f"ALTER TABLE {qn(main_table_name)} RENAME TO {qn(archive_table_name)}")
-
-                # После переименования отключаем автоинкремент у архивной таблицы, освобождаем её последовательность
-                # У архивной таблицы сохраняется последовательность, трогать её не нужно
+                _rebuild_missing_indexes(cursor, temp_table_name)
 
-                # Переименовываем временную таблицу в основную
-                logger.info("[RENAME] Временная таблица -> основная")
-                cursor.execute(f"ALTER TABLE {qn(temp_table_name)} RENAME TO {qn(main_table_name)}")
+        checks = _validate_temp_table(import_history, timings)
+        prewarm = _prewarm_temp_table(import_history, timings)
 
-                # Привязываем последовательность к новой основной таблице и синхронизируем значения
-                cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [main_table_name])
-                main_sequence_after = cursor.fetchone()[0]
-
-                if not main_sequence_after:
-                    raise Exception("Не удалось определить последовательность для новой основной таблицы после переименования")
-
-                cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {qn(main_table_name)}")
-                max_id = cursor.fetchone()[0] or 0
-                cursor.execute("SELECT setval(%s, %s, %s)", [main_sequence_after, max_id if max_id else 1, bool(max_id)])
+        # Последовательность временной таблицы привязана к её id ещё в _create_temp_table
+        # и переезжает вместе с ней при переименовании - достаточно выставить значение
+        with _timed(timings, 'sequence_ms'):
+            with connection.cursor() as cursor:
+                _sync_table_sequence(cursor, temp_table_name)
+                # Тот же момент - начало интервалов в индексе истории: по нему lookup_history
+                # находит таблицу, действовавшую внутри интервала
+                finalized_at = timezone.now()
+                write_table_manifest(cursor, temp_table_name, {
+                    'import_id': import_history.id,
+                    'file_name': import_history.file_name,
+                    'rows': checks['row_count'],
+                    'finalized_at': finalized_at.isoformat(),
+                })
 
-                cursor.execute(f"ALTER SEQUENCE {main_sequence_after} OWNED BY {qn(main_table_name)}.id")
-                cursor.execute(f"ALTER TABLE {qn(main_table_name)} ALTER COLUMN id SET DEFAULT nextval(%s)", [main_sequence_after])
+        _swap_tables(temp_table_name, archive_table_name, timings)
+        # Кеш поиска по старым данным больше не действителен
+        data_generation = bump_data_generation()
+        # Подсказки ФИО этого процесса - по новым данным (остальные заметят смену поколения)
+        start_typeahead_rebuild()
+        history = _update_history_index_after_swap(main_table_name, import_history.id, finalized_at, timings)
 
         # Обновляем ImportHistory вне транзакции курсора
+        report = {
+            'checks': checks, 'timings': timings, 'prewarm': prewarm, 'data_generation': data_generation,
+            'history': history,
+        }
         import_history.archive_table_name = archive_table_name
         import_history.temp_table_name = None
         import_history.archived_done = True
-        import_history.save(update_fields=['archive_table_name', 'temp_table_name', 'archived_done'])
+        import_history.finalize_stats = report
+        import_history.save(update_fields=['archive_table_name', 'temp_table_name', 'archived_done', 'finalize_stats'])
 
         logger.info("[SUCCESS] Финализация импорта завершена успешно (таблицы переименованы)!")
-        return True
+        return report
 
     except Exception as e:  # noqa: BLE001
         logger.error(f"[ERROR] Ошибка при финализации импорта: {str(e)}")
+        # Сохраняем тайминги неудачной попытки, включая ожидание блокировок
+        import_history.finalize_stats = {'timings': timings, 'error': str(e)}
+        import_history.save(update_fields=['finalize_stats'])
         raise Exception(f"Ошибка при финализации импорта: {str(e)}")
 
+_ARCHIVE_TABLE_RE = re.compile(rf'^{Subscriber._meta.db_table}_archive_\d+$')
+
+
+def _table_exists(cursor, table_name):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [connection.ops.quote_name(table_name)])
+    return cursor.fetchone()[0]
+
+
+def _table_columns(cursor, table_name):
+    cursor.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+    """, [connection.ops.quote_name(table_name)])
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _index_signatures(cursor, table_name):
+    """
+    Индексы таблицы в виде множества (уникальный, часть определения после USING).
+    Сигнатура не зависит от имён индекса и таблицы, поэтому индексы разных таблиц сравнимы.
+    """
+    cursor.execute("""
+        SELECT ix.indisunique, pg_get_indexdef(ix.indexrelid)
+        FROM pg_index ix
+        WHERE ix.indrelid = %s::regclass
+    """, [connection.ops.quote_name(table_name)])
+    return {(is_unique, definition.split(' USING ', 1)[1]) for is_unique, definition in cursor.fetchall()}
+
+
+def _ensure_id_sequence(cursor, table_name):
+    """Привязывает к id таблицы собственную последовательность, если её нет (архивы старых версий)."""
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table_name])
+    if cursor.fetchone()[0]:
+        return
+    qn = connection.ops.quote_name
+    sequence_name = f"{table_name}_id_seq"
+    logger.info(f"[BUILD] Создаём последовательность {sequence_name}")
+    cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {qn(sequence_name)} START WITH 1")
+    cursor.execute(f"ALTER SEQUENCE {qn(sequence_name)} OWNED BY {qn(table_name)}.id")
+    cursor.execute(f"ALTER TABLE {qn(table_name)} ALTER COLUMN id SET DEFAULT nextval(%s)", [sequence_name])
+
+
+def _rebuild_missing_indexes(cursor, table_name):
+    """
+    Создаёт на таблице индексы, которые есть у основной таблицы, но отсутствуют у неё.
+    Возвращает список созданных индексов.
+    """
+    qn = connection.ops.quote_name
+    existing = _index_signatures(cursor, table_name)
+    created = []
+    for is_unique, method_and_columns in sorted(_index_signatures(cursor, Subscriber._meta.db_table) - existing):
+        unique = 'UNIQUE ' if is_unique else ''
+        # Уникальный и обычный индексы по одним колонкам различаются только флагом - он входит в имя
+        index_name = f"{table_name}_{hashlib.md5(f'{unique}{method_and_columns}'.encode()).hexdigest()[:8]}"
+        logger.info(f"[BUILD] Создаём недостающий индекс {index_name}: {unique}USING {method_and_columns}")
+        cursor.execute(f"CREATE {unique}INDEX {qn(index_name)} ON {qn(table_name)} USING {method_and_columns}")
+        created.append(index_name)
+    return created
+
+
+# Ключ рекомендательной блокировки: проверка «подмена таблиц не идёт» и отметка о начале
+# финализации или отката выполняются под ней одной транзакцией, без гонки между процессами
+_TABLE_SWAP_LOCK_KEY = 7300932
+
+
+def claim_table_swap(import_history, **changes) -> Optional[str]:
+    """
+    Отмечает, что import_history начинает подмену основной таблицы (финализация - status/phase,
+    откат - rollback_stats со status 'running'), если никакая другая подмена не идёт.
+    Возвращает текст ошибки, если подмена уже выполняется, иначе None.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [_TABLE_SWAP_LOCK_KEY])
+        running = ImportHistory.objects.filter(
+            Q(status='processing', phase='finalizing') | Q(rollback_stats__status='running')
+        ).first()
+        if running:
+            if running.rollback_stats and running.rollback_stats.get('status') == 'running':
+                return f"Идёт откат к архиву {running.rollback_stats.get('archive_table_name')}, дождитесь его завершения"
+            return f"Идёт финализация импорта {running.id}, дождитесь её завершения"
+        for field, value in changes.items():
+            setattr(import_history, field, value)
+        import_history.save(update_fields=list(changes))
+    return None
+
+
+def _claim_rollback(archive_table_name, user=None):
+    """Проверяет архив и отмечает откат в ImportHistory импорта, создавшего архив. (import_history, ошибка)"""
+    if not _ARCHIVE_TABLE_RE.match(archive_table_name or ''):
+        return None, f"Недопустимое имя архивной таблицы: {archive_table_name}"
+    import_history = ImportHistory.objects.filter(archive_table_name=archive_table_name).order_by('-created_at').first()
+    if import_history is None:
+        # Ход и итог отката видны только через ImportHistory - без записи откат не запускаем
+        return None, f"Не найден импорт, создавший архив {archive_table_name}; откат невозможен"
+    error = claim_table_swap(import_history, rollback_stats={
+        'status': 'running',
+        'archive_table_name': archive_table_name,
+        'started_at': timezone.now().isoformat(),
+        'user': user.username if user else None,
+    })
+    return import_history, error
+
+
+def _perform_rollback(import_history, archive_table_name, user=None):
+    """
+    Откат, уже отмеченный в import_history (_claim_rollback): архив становится основной
+    таблицей, текущая основная таблица уходит в новый архив. Подмена - та же, что при
+    финализации (_swap_tables); последовательность и недостающие индексы готовятся до блокировок.
+    Итог записывается в import_history.rollback_stats.
+    """
+    main_table_name = Subscriber._meta.db_table
+    new_archive_table_name = f"{main_table_name}_archive_{int(timezone.now().timestamp())}"
+    stats = dict(import_history.rollback_stats or {}, new_archive_table_name=new_archive_table_name)
+    timings = {}
+
+    def fail(error):
+        stats.update(status='failed', error=error, timings=timings, finished_at=timezone.now().isoformat())
+        import_history.rollback_stats = stats
+        import_history.save(update_fields=['rollback_stats'])
+        return {"success": False, "error": error, "timings": timings}
+
+    logger.info(f"[ROLLBACK] Откат к архиву {archive_table_name}, текущая таблица -> {new_archive_table_name}")
+    try:
+        with connection.cursor() as cursor:
+            if not _table_exists(cursor, archive_table_name):
+                return fail(f"Архивная таблица {archive_table_name} не найдена")
+            if _table_exists(cursor, new_archive_table_name):
+                return fail(f"Таблица {new_archive_table_name} уже существует, повторите позже")
+
+            # Архив старой схемы не подойдёт модели - колонки добавлять не берёмся
+            missing_columns = _table_columns(cursor, main_table_name) - _table_columns(cursor, archive_table_name)
+            if missing_columns:
+                return fail(f"В архиве нет колонок {', '.join(sorted(missing_columns))}, откат невозможен")
+
+            with _timed(timings, 'indexes_ms'):
+                created_indexes = _rebuild_missing_indexes(cursor, archive_table_name)
+            with _timed(timings, 'sequence_ms'):
+                _ensure_id_sequence(cursor, archive_table_name)
+                _sync_table_sequence(cursor, archive_table_name)
+
+        _swap_tables(archive_table_name, new_archive_table_name, timings)
+        data_generation = bump_data_generation()
+        start_typeahead_rebuild()
+        with connection.cursor() as cursor:
+            restored_manifest = get_table_manifest(cursor, main_table_name) or {}
+        history = _update_history_index_after_swap(
+            main_table_name, restored_manifest.get('import_id'), timezone.now(), timings
+        )
+
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"[ERROR] Ошибка при откате к архиву {archive_table_name}: {str(e)}")
+        return fail(str(e))
+
+    stats.update(status='completed', finished_at=timezone.now().isoformat(), timings=timings,
+                 created_indexes=created_indexes, history=history)
+    import_history.rolled_back_at = timezone.now()
+    import_history.rollback_table_name = new_archive_table_name
+    import_history.rollback_stats = stats
+    import_history.info_message = (
+        f"Откат к архиву {archive_table_name} выполнен"
+        + (f" пользователем {user.username}" if user else "")
+        + f". Данные до отката: {new_archive_table_name}"
+    )
+    import_history.save(update_fields=['rolled_back_at', 'rollback_table_name', 'rollback_stats', 'info_message'])
+
+    logger.info(f"[SUCCESS] Откат к архиву {archive_table_name} завершён")
+    return {
+        "success": True,
+        "restored_table": archive_table_name,
+        "archive_table_name": new_archive_table_name,
+        "import_id": import_history.id,
+        "created_indexes": created_indexes,
+        "timings": timings,
+        "history": history,
+        "data_generation": data_generation,
+        "message": f"Восстановлены данные из {archive_table_name}. Текущие данные сохранены в {new_archive_table_name}",
+    }
+
+
+def rollback_to_archive(archive_table_name, user=None):
+    """
+    Откатывает абонентов к архивной таблице в текущем потоке (управляющие команды, тесты);
+    из представлений - start_rollback_async. Откат фиксируется в ImportHistory того импорта,
+    финализация которого создала архив.
+
+    Returns:
+        dict: Результат операции
+    """
+    import_history, error = _claim_rollback(archive_table_name, user)
+    if error:
+        return {"success": False, "error": error}
+    return _perform_rollback(import_history, archive_table_name, user)
+
+
+def process_rollback(import_history_id, archive_table_name, user=None):
+    """Фоновый откат к архиву; итог - в ImportHistory.rollback_stats."""
+    try:
+        import_history = ImportHistory.objects.get(id=import_history_id)
+        _perform_rollback(import_history, archive_table_name, user)
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"[ERROR] Критическая ошибка в process_rollback: {str(e)}")
+    finally:
+        _RUNNING_IMPORTS.pop(import_history_id, None)
+        connection.close()
+
+
+def start_rollback_async(archive_table_name, user=None):
+    """
+    Отмечает откат в ImportHistory и запускает его в фоне - индексы архива, ожидание блокировок
+    и пересчёт истории не укладываются в HTTP-запрос. Ход виден в list_archives и import_status.
+
+    Returns:
+        dict: success, import_id или error
+    """
+    import_history, error = _claim_rollback(archive_table_name, user)
+    if error:
+        return {"success": False, "error": error}
+    logger.info(f"Запускаем фоновый откат к архиву {archive_table_name} (импорт {import_history.id})")
+    t = threading.Thread(target=process_rollback, args=(import_history.id, archive_table_name, user), daemon=True)
+    _RUNNING_IMPORTS[import_history.id] = t
+    t.start()
+    return {
+        "success": True,
+        "import_id": import_history.id,
+        "message": f"Откат к архиву {archive_table_name} запущен в фоне. Статус обновится после подмены таблиц.",
+    }
+
+
 def _cleanup_temp_table(temp_table_name):
     """Удаляет временную таблицу при ошибке или отмене импорта"""
     if temp_table_name:
@@ -179,6 +760,9 @@ logger = logging.getLogger(__name__)
 # Регистр активных импортов, чтобы не запускать параллельно один и тот же
 _RUNNING_IMPORTS = {}
 
+# Телеметрия конвейеров активных импортов (глубина очереди, простои стадий)
+_PIPELINE_STATS = {}
+
 # Имитация задачи Celery с помощью обычной функции
 def process_csv_import_task(csv_data, import_history_id, delimiter, encoding, has_header):
     """
@@ -504,6 +1088,9 @@ def process_csv_import_task_impl(csv_data, import_history_id, delimiter, encodin
                 failed_count += 1
                 errors.append(f"Ошибка при создании записи: {str(e)}")
                 print(f"Ошибка при сохранении абонента: {str(e)}")
+
+        # Кеш поиска сбрасывается один раз на весь импорт, а не на каждую запись
+        bump_data_generation()
         
         # Обновляем статистику импорта
         import_history.records_created = created_count
@@ -587,6 +1174,66 @@ def process_csv_import_task_impl(csv_data, import_history_id, delimiter, encodin
 # === РЕЖИМ ПОТОКОВОГО (РЕЗЮМИРУЕМОГО) ИМПОРТА ===
 
 
+def _prepare_record_data(parsed, import_history: ImportHistory):
+    """Нормализует и валидирует разобранную запись перед вставкой во временную таблицу."""
+    # Нормализация даты
+    if parsed['birth_date'] is not None:
+        from datetime import date
+        if not isinstance(parsed['birth_date'], date) and hasattr(parsed['birth_date'], 'date'):
+            parsed['birth_date'] = parsed['birth_date'].date()
+
+    # Подготовка данных для записи
+
+    # Валидация длины полей перед вставкой
+    validation_errors = []
+
+    if parsed.get('number') and len(parsed['number']) > 20:
+        validation_errors.append(f"Номер слишком длинный: {len(parsed['number'])} символов (максимум 20)")
+        parsed['number'] = parsed['number'][:20]  # Обрезаем до максимальной длины
+
+    if parsed.get('last_name') and len(parsed['last_name']) > 255:
+        validation_errors.append(f"Фамилия слишком длинная: {len(parsed['last_name'])} символов (максимум 255)")
+        parsed['last_name'] = parsed['last_name'][:255]
+
+    if parsed.get('first_name') and len(parsed['first_name']) > 255:
+        validation_errors.append(f"Имя слишком длинное: {len(parsed['first_name'])} символов (максимум 255)")
+        parsed['first_name'] = parsed['first_name'][:255]
+
+    if parsed.get('middle_name') and len(parsed['middle_name']) > 255:
+        validation_errors.append(f"Отчество слишком длинное: {len(parsed['middle_name'])} символов (максимум 255)")
+        parsed['middle_name'] = parsed['middle_name'][:255]
+
+    if parsed.get('imsi') and len(parsed['imsi']) > 50:
+        validation_errors.append(f"IMSI слишком длинный: {len(parsed['imsi'])} символов (максимум 50)")
+        parsed['imsi'] = parsed['imsi'][:50]
+
+    # Логируем предупреждения о валидации
+    if validation_errors:
+        logger.warning(f"[WARNING] Предупреждения валидации для записи ID={parsed.get('original_id')}: {validation_errors}")
+
+    # Подготавливаем данные для вставки во временную таблицу
+    record_data = {
+        'original_id': parsed['original_id'],
+        'number': _sanitize_text(parsed['number']),
+        'last_name': _sanitize_text(parsed['last_name']),
+        'first_name': _sanitize_text(parsed['first_name']),
+        'middle_name': _sanitize_text(parsed['middle_name']),
+        'address': _sanitize_text(parsed['address']),
+        'memo1': _sanitize_text(parsed['memo1']),
+        'memo2': _sanitize_text(parsed['memo2']),
+        'birth_place': _sanitize_text(parsed['birth_place']),
+        'birth_date': parsed['birth_date'],
+        'imsi': _sanitize_text(parsed['imsi']),
+        'import_history_id': import_history.id,
+    }
+    # Ключи поиска считаются один раз здесь, а не UPPER() в каждом запросе поиска
+    for field, norm_field in SEARCH_NORMALIZED_FIELDS.items():
+        record_data[norm_field] = normalize_search_text(record_data[field])
+    for field, key_field in PHONETIC_KEY_FIELDS.items():
+        record_data[key_field] = phonetic_key(record_data[field])
+    return record_data
+
+
 def _process_record_row(parsed, import_history: ImportHistory, created_failed_acc):
     created_count, failed_count, errors = created_failed_acc
     try:
@@ -601,57 +1248,8 @@ def _process_record_row(parsed, import_history: ImportHistory, created_failed_ac
             # Основной цикл обработает эти флаги
             return created_count, failed_count, errors
         
-        # Нормализация даты
-        if parsed['birth_date'] is not None:
-            from datetime import date
-            if not isinstance(parsed['birth_date'], date) and hasattr(parsed['birth_date'], 'date'):
-                parsed['birth_date'] = parsed['birth_date'].date()
+        record_data = _prepare_record_data(parsed, import_history)
 
-        # Подготовка данных для записи
-
-        # Валидация длины полей перед вставкой
-        validation_errors = []
-        
-        if parsed.get('number') and len(parsed['number']) > 20:
-            validation_errors.append(f"Номер слишком длинный: {len(parsed['number'])} символов (максимум 20)")
-            parsed['number'] = parsed['number'][:20]  # Обрезаем до максимальной длины
-            
-        if parsed.get('last_name') and len(parsed['last_name']) > 255:
-            validation_errors.append(f"Фамилия слишком длинная: {len(parsed['last_name'])} символов (максимум 255)")
-            parsed['last_name'] = parsed['last_name'][:255]
-            
-        if parsed.get('first_name') and len(parsed['first_name']) > 255:
-            validation_errors.append(f"Имя слишком длинное: {len(parsed['first_name'])} символов (максимум 255)")
-            parsed['first_name'] = parsed['first_name'][:255]
-            
-        if parsed.get('middle_name') and len(parsed['middle_name']) > 255:
-            validation_errors.append(f"Отчество слишком длинное: {len(parsed['middle_name'])} символов (максимум 255)")
-            parsed['middle_name'] = parsed['middle_name'][:255]
-            
-        if parsed.get('imsi') and len(parsed['imsi']) > 50:
-            validation_errors.append(f"IMSI слишком длинный: {len(parsed['imsi'])} символов (максимум 50)")
-            parsed['imsi'] = parsed['imsi'][:50]
-
-        # Логируем предупреждения о валидации
-        if validation_errors:
-            logger.warning(f"[WARNING] Предупреждения валидации для записи ID={parsed.get('original_id')}: {validation_errors}")
-
-        # Подготавливаем данные для вставки во временную таблицу
-        record_data = {
-            'original_id': parsed['original_id'],
-            'number': _sanitize_text(parsed['number']),
-            'last_name': _sanitize_text(parsed['last_name']),
-            'first_name': _sanitize_text(parsed['first_name']),
-            'middle_name': _sanitize_text(parsed['middle_name']),
-            'address': _sanitize_text(parsed['address']),
-            'memo1': _sanitize_text(parsed['memo1']),
-            'memo2': _sanitize_text(parsed['memo2']),
-            'birth_place': _sanitize_text(parsed['birth_place']),
-            'birth_date': parsed['birth_date'],
-            'imsi': _sanitize_text(parsed['imsi']),
-            'import_history_id': import_history.id,
-        }
-        
         # Вставляем во временную таблицу
         _insert_into_temp_table(import_history.temp_table_name, record_data)
         created_count += 1
@@ -1023,155 +1621,421 @@ def _parse_line_to_record(row_values, row_count, errors):
         errors.append(f"Ошибка при обработке строки {row_count}: {str(e)}")
         return None
 
-def _process_csv_lines_with_smart_joining(file_path, delimiter, encoding, import_history, processed_rows_start):
+# === КОНВЕЙЕР ПОТОКОВОГО ИМПОРТА: чтение/разбор -> ограниченная очередь -> запись ===
+
+_PIPELINE_RECORD = 'record'
+_PIPELINE_ERROR = 'error'
+_PIPELINE_DONE = 'done'
+
+
+class _PipelineStop(Exception):
+    """Писатель остановил конвейер (пауза/отмена/ошибка) — читателю пора завершаться."""
+
+
+def get_pipeline_stats(import_history_id: int) -> Optional[dict]:
     """
-    Потоковая обработка CSV без загрузки всего файла в память
-    с «умным» склеиванием строк.
+    Снимок телеметрии конвейера для import_status.
 
-    Returns:
-        (created_count, failed_count, last_processed_row)
+    Если читатель долго ждёт места в очереди — узкое место в записи в БД,
+    если писатель долго ждёт данных — узкое место в чтении/разборе CSV.
     """
-    created_count = 0
-    failed_count = 0
-    logical_row_index = processed_rows_start
+    stats = _PIPELINE_STATS.get(import_history_id)
+    if not stats:
+        return None
+    snapshot = {key: value for key, value in stats.items() if not key.startswith('_')}
+    record_queue = stats.get('_queue')
+    snapshot['queue_depth'] = record_queue.qsize() if record_queue is not None else 0
+    snapshot['reader_blocked_seconds'] = round(snapshot['reader_blocked_seconds'], 3)
+    snapshot['writer_idle_seconds'] = round(snapshot['writer_idle_seconds'], 3)
+    if snapshot['reader_blocked_seconds'] > snapshot['writer_idle_seconds']:
+        snapshot['bottleneck'] = 'writer'
+    elif snapshot['writer_idle_seconds'] > 0:
+        snapshot['bottleneck'] = 'reader'
+    else:
+        snapshot['bottleneck'] = None
+    return snapshot
+
+
+# Поддерживаемые форматы загрузки: CSV как есть или сжатый (распаковывается потоково при чтении)
+SUPPORTED_IMPORT_EXTENSIONS = ('.csv', '.csv.gz', '.csv.bz2', '.csv.xz', '.zip')
+
+def is_supported_import_file(file_name: str) -> bool:
+    """Проверяет, что файл импорта - CSV или поддерживаемый архив с CSV."""
+    return (file_name or '').lower().endswith(SUPPORTED_IMPORT_EXTENSIONS)
+
+
+def get_zip_csv_entry(zip_file: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """Возвращает единственный файл ZIP-архива; архивы с несколькими файлами не поддерживаются."""
+    entries = [info for info in zip_file.infolist() if not info.is_dir()]
+    if len(entries) != 1:
+        raise ValueError(f'ZIP-архив должен содержать ровно один CSV-файл, найдено файлов: {len(entries)}')
+    return entries[0]
+
+
+@contextlib.contextmanager
+def _open_import_stream(file_path):
+    """
+    Открывает файл импорта как бинарный поток распакованных данных.
 
-    file_size = file_path.stat().st_size
+    Yields:
+        (stream, raw) - stream читается построчно и поддерживает seek() по распакованным
+        байтам (для контрольных точек), raw - исходный файл, его tell() даёт позицию
+        в сжатых байтах для расчёта прогресса.
+    """
+    suffix = file_path.suffix.lower()
+    with file_path.open('rb') as raw:
+        if suffix == '.zip':
+            with zipfile.ZipFile(raw) as archive:
+                with archive.open(get_zip_csv_entry(archive)) as stream:
+                    yield stream, raw
+        elif suffix == '.gz':
+            with gzip.GzipFile(fileobj=raw) as stream:
+                yield stream, raw
+        elif suffix == '.bz2':
+            with bz2.BZ2File(raw) as stream:
+                yield stream, raw
+        elif suffix == '.xz':
+            with lzma.LZMAFile(raw) as stream:
+                yield stream, raw
+        else:
+            yield raw, raw
+
+
+def _read_next_non_empty(fh, encoding):
+    """Читает следующую непустую строку из бинарного потока и декодирует её."""
+    while True:
+        raw = fh.readline()
+        if not raw:
+            return None
+        line = _clean_line_for_combining(raw.decode(encoding, errors='ignore').rstrip('\n\r'))
+        if line:
+            return line
 
-    import_history.phase = 'processing'
-    import_history.save(update_fields=['phase'])
 
-    def _read_next_non_empty(fh):
+def _parse_combined_line(combined_line, logical_row_index, delimiter):
+    """Разбирает склеенную строку в элемент очереди конвейера (запись или ошибку)."""
+    errors = []
+    row_values = _try_parse_csv_line(combined_line, delimiter)
+    parsed = _parse_line_to_record(row_values, logical_row_index, errors) if row_values else None
+    if not parsed:
+        logger.error(f"[ERROR] Не удалось обработать строку {logical_row_index}: {combined_line[:200]}")
+        return (_PIPELINE_ERROR, logical_row_index, "Не удалось обработать объединённую запись", combined_line[:5000])
+    return (_PIPELINE_RECORD, logical_row_index, parsed, combined_line)
+
+
+def _read_csv_records(file_path, delimiter, encoding, processed_rows_start, record_queue, stop_event, stats,
+                      start_offset=0):
+    """
+    Стадия чтения/разбора: читает файл, «умно» склеивает разорванные строки, разбирает
+    записи и кладёт их в ограниченную очередь. put() блокируется, пока писатель не
+    освободит место (обратное давление), и прерывается по stop_event.
+    Работает в отдельном потоке и не обращается к БД.
+
+    Каждый элемент очереди несёт байтовое смещение начала следующей записи в
+    распакованном потоке — это контрольная точка, с которой можно продолжить импорт
+    (start_offset), — и позицию в исходном (возможно сжатом) файле для прогресса.
+    """
+    def _resume_offset():
+        return pending[1] if pending is not None else fh.tell()
+
+    def _put(kind, row_index, payload, raw_data):
+        item = (kind, row_index, payload, raw_data, _resume_offset(), raw.tell())
+        started = time.monotonic()
         while True:
-            raw = fh.readline()
-            if not raw:
-                return None
-            line = _clean_line_for_combining(raw.rstrip('\n\r'))
-            if line:
+            if stop_event.is_set():
+                raise _PipelineStop()
+            try:
+                record_queue.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        stats['reader_blocked_seconds'] += time.monotonic() - started
+        if kind != _PIPELINE_DONE:
+            stats['rows_parsed'] += 1
+
+    pending = None  # (строка, смещение) прочитанная наперёд при поиске продолжения записи
+
+    with _open_import_stream(file_path) as (fh, raw):
+        def _next_line():
+            nonlocal pending
+            if pending is not None:
+                line, pending = pending[0], None
                 return line
+            return _read_next_non_empty(fh, encoding)
 
-    with file_path.open('r', encoding=encoding, errors='ignore', newline='') as fh:
-        # Читаем первую строку
-        current_line = _read_next_non_empty(fh)
-        is_first_line = True
-        
-        while current_line is not None:
-            if logical_row_index % 500 == 0 and logical_row_index != processed_rows_start:
-                import_history.last_heartbeat_at = timezone.now()
-                # Обновляем счетчики в базе данных
-                import_history.records_created = created_count
-                import_history.records_failed = failed_count
-                import_history.processed_rows = logical_row_index
-                import_history.save(update_fields=['last_heartbeat_at', 'records_created', 'records_failed', 'processed_rows'])
-                import_history.refresh_from_db(fields=['pause_requested', 'cancel_requested'])
-                if import_history.cancel_requested:
-                    logger.info(f"[STOP] Импорт {import_history.id} отменен пользователем")
-                    import_history.status = 'cancelled'
-                    import_history.stop_reason = 'Отмена пользователем'
-                    import_history.phase = 'cancelled'
-                    import_history.progress_percent = 0
-                    import_history.save()
-                    _cleanup_temp_table(import_history.temp_table_name)
-                    return created_count, failed_count, logical_row_index
-                if import_history.pause_requested:
-                    logger.info(f"Импорт {import_history.id} поставлен на паузу пользователем")
-                    import_history.status = 'paused'
-                    import_history.stop_reason = 'Пауза пользователем'
-                    import_history.save()
-                    while True:
-                        import time
-                        time.sleep(0.5)
-                        import_history.refresh_from_db(fields=['pause_requested', 'cancel_requested'])
-                        if import_history.cancel_requested:
-                            logger.info(f"[STOP] Импорт {import_history.id} отменен во время паузы")
-                            import_history.status = 'cancelled'
-                            import_history.stop_reason = 'Отмена пользователем'
-                            import_history.phase = 'cancelled'
-                            import_history.progress_percent = 0
-                            import_history.save()
-                            _cleanup_temp_table(import_history.temp_table_name)
-                            return created_count, failed_count, logical_row_index
-                        if not import_history.pause_requested:
-                            logger.info(f"Импорт {import_history.id} возобновлен после паузы")
-                            import_history.status = 'processing'
-                            import_history.stop_reason = None
-                            import_history.save()
-                            break
+        if start_offset:
+            # Точное резюме: контрольная точка указывает на начало записи processed_rows_start + 1.
+            # Для сжатых файлов seek() распаковывает поток до смещения без разбора строк
+            fh.seek(start_offset)
+            logical_row_index = processed_rows_start
+            is_first_line = False
+        else:
+            # Нумерация с начала файла, записи до точки резюме пропускаются
+            logical_row_index = 0
+            is_first_line = True
 
+        current_line = _next_line()
+
+        while current_line is not None:
             # Специальная обработка первой строки - если невалидна, просто пропускаем без ошибки
             if not _is_valid_line(current_line, delimiter):
                 if is_first_line:
-                    # Первая строка невалидна - скорее всего заголовок, просто пропускаем
                     logger.info(f"[SKIP] Первая строка пропущена (вероятно заголовок): {current_line[:100]}")
-                    current_line = _read_next_non_empty(fh)
                     is_first_line = False
-                    continue
-                else:
-                    # Обычная строка невалидна - создаем ошибку
-                    logger.error(f"[ERROR] Невалидная строка на позиции {logical_row_index + 1}: {current_line[:200]}")
-                    failed_count += 1
-                    ImportError.objects.create(
-                        import_history=import_history,
-                        import_session_id=import_history.import_session_id,
-                        row_index=logical_row_index + 1,
-                        message="Невалидная строка (нет ID/номера)",
-                        raw_data=current_line[:5000],
-                    )
-                    current_line = _read_next_non_empty(fh)
-                    continue
+                elif logical_row_index >= processed_rows_start:
+                    # Ошибка получает номер последней записи перед ней, а не следующей: контрольная
+                    # точка по такой ошибке не должна пропускать ещё не прочитанную запись.
+                    # При резюме ошибки до точки остановки уже записаны предыдущим запуском
+                    logger.error(f"[ERROR] Невалидная строка после записи {logical_row_index}: {current_line[:200]}")
+                    _put(_PIPELINE_ERROR, logical_row_index, "Невалидная строка (нет ID/номера)", current_line[:5000])
+                current_line = _next_line()
+                continue
 
             combined_line = current_line
             while True:
-                pos = fh.tell()
-                nxt = _read_next_non_empty(fh)
+                line_offset = fh.tell()
+                nxt = _next_line()
                 if nxt is None:
                     break
                 if _is_valid_line(nxt, delimiter):
-                    fh.seek(pos)
+                    pending = (nxt, line_offset)
                     break
                 combined_line = _clean_line_for_combining(combined_line + " " + nxt)
 
             logical_row_index += 1
-            
-            # Обрабатываем строку только если это не первая строка или если она валидна
-            if logical_row_index > processed_rows_start:
-                success, _ = _try_process_combined_line(
-                    combined_line, logical_row_index, delimiter, import_history
-                )
-                if success:
-                    created_count += 1
-                else:
-                    failed_count += 1
-                    logger.error(f"[ERROR] Не удалось обработать строку {logical_row_index}: {combined_line[:200]}")
-                    ImportError.objects.create(
-                        import_history=import_history,
-                        import_session_id=import_history.import_session_id,
-                        row_index=logical_row_index,
-                        message="Не удалось обработать объединённую запись",
-                        raw_data=combined_line[:5000],
-                    )
-            
-            # Сбрасываем флаг первой строки после обработки
             is_first_line = False
 
+            # Записи до точки резюме уже лежат во временной таблице
+            if logical_row_index > processed_rows_start:
+                _put(*_parse_combined_line(combined_line, logical_row_index, delimiter))
+
+            current_line = _next_line()
+
+        _put(_PIPELINE_DONE, logical_row_index, None, None)
+
+
+def _mark_import_cancelled(import_history):
+    import_history.status = 'cancelled'
+    import_history.stop_reason = 'Отмена пользователем'
+    import_history.phase = 'cancelled'
+    import_history.progress_percent = 0
+    import_history.save()
+    _cleanup_temp_table(import_history.temp_table_name)
+
+
+def _check_pause_cancel(import_history):
+    """
+    Проверяет флаги паузы/отмены между пакетами. На паузе ждёт возобновления —
+    читатель в это время упирается в заполненную очередь.
+
+    Returns:
+        True, если импорт отменён
+    """
+    import_history.refresh_from_db(fields=['pause_requested', 'cancel_requested'])
+    if import_history.cancel_requested:
+        logger.info(f"[STOP] Импорт {import_history.id} отменен пользователем")
+        _mark_import_cancelled(import_history)
+        return True
+    if not import_history.pause_requested:
+        return False
+
+    logger.info(f"Импорт {import_history.id} поставлен на паузу пользователем")
+    import_history.status = 'paused'
+    import_history.stop_reason = 'Пауза пользователем'
+    import_history.save()
+    while True:
+        time.sleep(0.5)
+        import_history.refresh_from_db(fields=['pause_requested', 'cancel_requested'])
+        if import_history.cancel_requested:
+            logger.info(f"[STOP] Импорт {import_history.id} отменен во время паузы")
+            _mark_import_cancelled(import_history)
+            return True
+        if not import_history.pause_requested:
+            logger.info(f"Импорт {import_history.id} возобновлен после паузы")
+            import_history.status = 'processing'
+            import_history.stop_reason = None
+            import_history.save()
+            return False
+
+
+def _write_pipeline_batch(import_history, batch):
+    """
+    Стадия записи: вставляет пакет записей во временную таблицу одним INSERT,
+    при ошибке пакета повторяет построчно, чтобы отделить сбойные строки.
+    Вызывается внутри транзакции пакета, вложенные atomic() - это точки сохранения.
+
+    Returns:
+        (created_count, failed_count)
+    """
+    records = [item for item in batch if item[0] == _PIPELINE_RECORD]
+    errors = [
+        ImportError(
+            import_history=import_history,
+            import_session_id=import_history.import_session_id,
+            row_index=row_index,
+            message=message,
+            raw_data=raw_data,
+        )
+        for kind, row_index, message, raw_data, *_ in batch if kind == _PIPELINE_ERROR
+    ]
+    created_count = 0
+    failed_count = len(errors)
+
+    rows = [_temp_table_row(_prepare_record_data(parsed, import_history)) for _, _, parsed, *_ in records]
+    try:
+        with transaction.atomic():
+            _insert_batch_into_temp_table(import_history.temp_table_name, rows)
+        created_count = len(rows)
+    except Exception as e:  # noqa: BLE001 - ищем сбойные строки построчно
+        logger.warning(f"[WARNING] Пакет из {len(rows)} записей не вставлен ({str(e)}), повторяем построчно")
+        for (_, row_index, parsed, raw_line, *_), row in zip(records, rows):
+            try:
+                with transaction.atomic():
+                    _insert_batch_into_temp_table(import_history.temp_table_name, [row])
+                created_count += 1
+            except Exception as row_error:  # noqa: BLE001
+                failed_count += 1
+                error_msg = f"Ошибка при создании записи: {str(row_error)}"
+                logger.error(f"[ERROR] Ошибка сохранения записи: {error_msg}")
+                errors.append(ImportError(
+                    import_history=import_history,
+                    import_session_id=import_history.import_session_id,
+                    row_index=row_index,
+                    message=error_msg,
+                    raw_data=raw_line[:5000],
+                ))
+
+    if errors:
+        ImportError.objects.bulk_create(errors)
+    return created_count, failed_count
+
+
+def _process_csv_lines_with_smart_joining(file_path, delimiter, encoding, import_history, processed_rows_start):
+    """
+    Потоковая обработка CSV без загрузки всего файла в память
+    с «умным» склеиванием строк.
+
+    Чтение и разбор идут в отдельном потоке и через ограниченную очередь
+    (IMPORT_PIPELINE_QUEUE_SIZE) передаются писателю, который вставляет записи
+    во временную таблицу пакетами по IMPORT_PIPELINE_BATCH_SIZE. Так разбор CSV
+    и обращения к БД перекрываются во времени.
+
+    Каждый пакет фиксируется одной транзакцией вместе с контрольной точкой
+    (processed_rows, resume_byte_offset) и счетчиками, поэтому во временной
+    таблице никогда не бывает строк дальше processed_rows и резюме точное.
+
+    Returns:
+        (created_count, failed_count, last_processed_row) - счетчики с начала импорта
+    """
+    # При резюме продолжаем накопленные счетчики, они согласованы с контрольной точкой.
+    # Контрольная точка может стоять и до первой записи (пакет из одних ошибок) - тогда есть только смещение
+    resuming = bool(processed_rows_start or import_history.resume_byte_offset)
+    created_count = import_history.records_created if resuming else 0
+    failed_count = import_history.records_failed if resuming else 0
+    logical_row_index = processed_rows_start
+    start_offset = import_history.resume_byte_offset if resuming else 0
+
+    file_size = file_path.stat().st_size
+    queue_size = getattr(settings, 'IMPORT_PIPELINE_QUEUE_SIZE', 5000)
+    batch_size = getattr(settings, 'IMPORT_PIPELINE_BATCH_SIZE', 500)
+
+    import_history.phase = 'processing'
+    import_history.save(update_fields=['phase'])
+
+    record_queue = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    reader_errors = []
+    stats = {
+        '_queue': record_queue,
+        'queue_capacity': queue_size,
+        'batch_size': batch_size,
+        'rows_parsed': 0,
+        'rows_written': 0,
+        'batches_written': 0,
+        'last_batch_ms': 0,
+        'reader_blocked_seconds': 0.0,
+        'writer_idle_seconds': 0.0,
+    }
+    _PIPELINE_STATS[import_history.id] = stats
+
+    def _reader():
+        try:
+            _read_csv_records(
+                file_path, delimiter, encoding, processed_rows_start, record_queue, stop_event, stats,
+                start_offset=start_offset,
+            )
+        except _PipelineStop:
+            logger.info(f"[STOP] Читатель импорта {import_history.id} остановлен")
+        except Exception as e:  # noqa: BLE001 - пробрасываем в поток писателя
+            logger.error(f"[ERROR] Ошибка чтения CSV: {str(e)}")
+            reader_errors.append(e)
+
+    reader_thread = threading.Thread(target=_reader, name=f"import-reader-{import_history.id}", daemon=True)
+    reader_thread.start()
+
+    batch = []
+    finished = False
+    try:
+        while not finished:
+            started = time.monotonic()
             try:
-                if logical_row_index % 200 == 0:
-                    position = fh.tell()
-                    percent = int((position / max(1, file_size)) * 100)
-                    if percent != import_history.progress_percent:
-                        import_history.progress_percent = min(100, max(0, percent))
-                        import_history.processed_rows = logical_row_index
-                        import_history.save(update_fields=['progress_percent', 'processed_rows'])
-            except Exception:
-                pass
-
-            current_line = _read_next_non_empty(fh)
+                item = record_queue.get(timeout=0.5)
+            except queue.Empty:
+                item = None
+            stats['writer_idle_seconds'] += time.monotonic() - started
+
+            if item is None:
+                # Читатель завершился аварийно, не положив маркер конца
+                finished = not reader_thread.is_alive() and record_queue.empty()
+            elif item[0] == _PIPELINE_DONE:
+                finished = True
+                logical_row_index = max(logical_row_index, item[1])
+            else:
+                batch.append(item)
+
+            if not batch or (len(batch) < batch_size and not finished):
+                continue
+
+            batch_started = time.monotonic()
+            resume_offset, position = batch[-1][4], batch[-1][5]
+            with transaction.atomic():
+                created, failed = _write_pipeline_batch(import_history, batch)
+                created_count += created
+                failed_count += failed
+                logical_row_index = max(logical_row_index, batch[-1][1])
+
+                # Контрольная точка фиксируется в той же транзакции, что и пакет
+                import_history.last_heartbeat_at = timezone.now()
+                import_history.records_created = created_count
+                import_history.records_failed = failed_count
+                import_history.processed_rows = logical_row_index
+                import_history.resume_byte_offset = resume_offset
+                import_history.progress_percent = min(100, max(0, int((position / max(1, file_size)) * 100)))
+                import_history.save(update_fields=[
+                    'last_heartbeat_at', 'records_created', 'records_failed', 'processed_rows',
+                    'resume_byte_offset', 'progress_percent'
+                ])
+            stats['rows_written'] += len(batch)
+            stats['batches_written'] += 1
+            stats['last_batch_ms'] = int((time.monotonic() - batch_started) * 1000)
+            batch = []
+
+            if not finished and _check_pause_cancel(import_history):
+                return created_count, failed_count, logical_row_index
+
+        if reader_errors:
+            raise reader_errors[0]
+    finally:
+        stop_event.set()
+        reader_thread.join(timeout=5)
+        _PIPELINE_STATS.pop(import_history.id, None)
 
     # Финальное обновление счетчиков
     import_history.records_created = created_count
     import_history.records_failed = failed_count
     import_history.processed_rows = logical_row_index
     import_history.save(update_fields=['records_created', 'records_failed', 'processed_rows'])
-    
+
     return created_count, failed_count, logical_row_index
 
 def _process_single_csv_record(line, logical_row_index, delimiter, import_history, expected_id=None):
@@ -1430,6 +2294,42 @@ def is_import_running(import_history_id: int) -> bool:
     is_running = t.is_alive() if t else False
     return is_running
 
+def process_finalize_import(import_history_id: int) -> None:
+    """Фоновая финализация импорта: проверки, прогрев кеша и подмена таблиц."""
+    try:
+        import_history = ImportHistory.objects.get(id=import_history_id)
+        try:
+            _finalize_import(import_history)
+            import_history.status = 'completed'
+            import_history.phase = 'completed'
+            import_history.error_message = None
+            import_history.save()
+            logger.info(f"[SUCCESS] Финализация импорта {import_history_id} успешно завершена")
+        except Exception as e:  # noqa: BLE001
+            logger.error(f"[ERROR] Ошибка при финализации импорта {import_history_id}: {str(e)}")
+            # Возвращаем статус обратно в temp_completed, временная таблица не тронута
+            import_history.status = 'temp_completed'
+            import_history.phase = 'waiting_finalization'
+            import_history.error_message = f"Ошибка при финализации: {str(e)}"
+            import_history.save()
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"[ERROR] Критическая ошибка в process_finalize_import: {str(e)}")
+    finally:
+        _RUNNING_IMPORTS.pop(import_history_id, None)
+        connection.close()
+
+def start_finalize_async(import_history_id: int) -> bool:
+    """Стартует фоновую финализацию, если по этому импорту ничего не выполняется. Возвращает True, если стартовали сейчас."""
+    if is_import_running(import_history_id):
+        logger.info(f"Импорт {import_history_id} уже обрабатывается, финализацию не запускаем")
+        return False
+
+    logger.info(f"Запускаем фоновую финализацию импорта {import_history_id}")
+    t = threading.Thread(target=process_finalize_import, args=(import_history_id,), daemon=True)
+    _RUNNING_IMPORTS[import_history_id] = t
+    t.start()
+    return True
+
 # Имитация задачи Celery для очистки устаревших данных
 def cleanup_old_import_data(days=30):
     """
@@ -1568,10 +2468,17 @@ def cleanup_old_archive_tables_task(keep_count=3):
     # Выполняем реальную работу
     return cleanup_old_archive_tables(keep_count)
 
-def list_archive_tables():
+def list_archive_tables(exact_counts=False):
     """
     Функция для диагностики - показывает все существующие архивные таблицы.
     
+    Сведения берутся из каталога: размер - pg_total_relation_size, число строк -
+    из манифеста, записанного при финализации, иначе оценка pg_class.reltuples.
+    Таблицы не сканируются, кроме явного запроса точного подсчёта.
+    
+    Args:
+        exact_counts (bool): Выполнить COUNT(*) по каждой архивной таблице
+    
     Returns:
         dict: Информация об архивных таблицах
     """
@@ -1579,44 +2486,76 @@ def list_archive_tables():
     
     try:
         with connection.cursor() as cursor:
-            # Получаем список всех архивных таблиц
+            # Получаем список архивных таблиц вместе с метаданными из каталога
             cursor.execute("""
-                SELECT table_name 
-                FROM information_schema.tables 
-                WHERE table_name LIKE 'subscribers_subscriber_archive_%'
-                ORDER BY table_name DESC
+                SELECT c.relname,
+                       (SELECT COUNT(*) FROM pg_attribute a
+                        WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped),
+                       c.reltuples::bigint,
+                       pg_total_relation_size(c.oid),
+                       obj_description(c.oid, 'pg_class')
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE c.relkind = 'r'
+                  AND n.nspname = current_schema()
+                  AND c.relname LIKE 'subscribers_subscriber_archive_%'
+                ORDER BY c.relname DESC
             """)
-            archive_tables = [row[0] for row in cursor.fetchall()]
+            archive_rows = cursor.fetchall()
+            archive_tables = [row[0] for row in archive_rows]
             
             result = {
                 "success": True,
                 "total_count": len(archive_tables),
-                "tables": []
+                "total_size_bytes": sum(row[3] for row in archive_rows),
+                "tables": [],
+                "last_rollback": None,
             }
             
-            for table_name in archive_tables:
-                # Получаем количество колонок в таблице
-                try:
-                    cursor.execute("""
-                        SELECT COUNT(*) 
-                        FROM information_schema.columns 
-                        WHERE table_name = %s
-                    """, [table_name])
-                    column_count = cursor.fetchone()[0]
-                except Exception:
-                    column_count = "Ошибка подсчета"
+            # Последний откат (идущий или завершённый): после подмены архив пропадает из списка,
+            # а ход и итог отката остаются в ImportHistory.rollback_stats
+            last_rollback = (
+                ImportHistory.objects.filter(rollback_stats__isnull=False)
+                .order_by('-rollback_stats__started_at').first()
+            )
+            if last_rollback:
+                result["last_rollback"] = {"import_id": last_rollback.id, **last_rollback.rollback_stats}
+            
+            # Импорты, при финализации которых появились архивы - к ним можно откатиться
+            imports_by_archive = {
+                item.archive_table_name: item
+                for item in ImportHistory.objects.filter(archive_table_name__in=archive_tables)
+            }
+            
+            for table_name, column_count, reltuples, size_bytes, comment in archive_rows:
+                manifest = read_table_manifest(comment)
+                if manifest and manifest.get('rows') is not None:
+                    row_count, rows_source = manifest['rows'], 'manifest'
+                elif reltuples >= 0:
+                    # reltuples = -1, пока таблица ни разу не анализировалась
+                    row_count, rows_source = reltuples, 'estimate'
+                else:
+                    row_count, rows_source = None, 'unknown'
                 
-                # Получаем количество строк в таблице
-                try:
-                    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-                    row_count = cursor.fetchone()[0]
-                except Exception:
-                    row_count = "Ошибка подсчета"
+                if exact_counts:
+                    try:
+                        cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(table_name)}")
+                        row_count, rows_source = cursor.fetchone()[0], 'exact'
+                    except Exception:
+                        row_count = "Ошибка подсчета"
                 
+                import_item = imports_by_archive.get(table_name)
                 result["tables"].append({
                     "name": table_name,
                     "columns": column_count,
-                    "rows": row_count
+                    "rows": row_count,
+                    "rows_source": rows_source,
+                    "size_bytes": size_bytes,
+                    "manifest": manifest,
+                    "import_id": import_item.id if import_item else None,
+                    "import_file_name": import_item.file_name if import_item else None,
+                    "rolled_back_at": import_item.rolled_back_at.isoformat() if import_item and import_item.rolled_back_at else None,
+                    "rollback_stats": import_item.rollback_stats if import_item else None,
                 })
             
             return result
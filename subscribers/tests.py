@@ -1,3 +1,888 @@
-from django.test import TestCase
+import csv
+import bz2
+import datetime
+import gzip
+import json
+import lzma
+import tempfile
+import zipfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.db import OperationalError, connection, transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import timezone
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from django.core.cache import cache
+from django.core.management import call_command
+
+from django.contrib.auth.models import User
+
+from logs.models import UserActionLog
+from vl09_web.db_router import PIN_COOKIE_NAME, ReplicaRouter, ReplicaStickinessMiddleware, use_read_replica
+from vl09_web.db_timeouts import statement_timeout
+from vl09_web.pagination import EstimatedCountPaginator, KeysetPaginator
+
+from .models import (
+    ImportHistory, Subscriber, SUBSCRIBER_KEYSET_KEYS, SUBSCRIBER_LIST_COLUMNS, bump_data_generation,
+    normalize_search_text, phonetic_key,
+)
+from .utils import (
+    build_fulltext_query, number_search_filter, search_cache_key,
+    edit_distance, fuzzy_name_filter, rank_fuzzy_candidates,
+    bulk_lookup_header, iter_bulk_lookup_rows, read_lookup_numbers,
+)
+from . import typeahead
+from .typeahead import PrefixIndex, check_generation, rebuild_name_indexes, suggest_names
+from .history import lookup_history, row_hash_sql, update_history_index
+from .diff import merge_diff, run_import_diff
+from .tasks import (
+    _create_temp_table, _index_signatures, _open_import_stream, _prewarm_temp_table,
+    _process_csv_lines_with_smart_joining, _swap_tables, _validate_temp_table, get_zip_csv_entry,
+    claim_table_swap, is_supported_import_file, list_archive_tables, process_rollback, rollback_to_archive,
+    start_rollback_async,
+)
+from .views import bulk_lookup, export_search_results
+
+
+class TrigramSearchIndexTest(TestCase):
+    """Поиск по подстроке должен уметь идти по триграммным индексам, а не seq scan"""
+
+    def setUp(self):
+        Subscriber.objects.create(number='99365123456', last_name='Иванов', first_name='Иван',
+                                  address='ул. Магтымгулы, 12', memo1='I-AH 123456', imsi='438020123456789')
+
+    def assertIndexUsed(self, queryset):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+        self.assertIn('Bitmap Index Scan', plan, plan)
+
+    def test_normalized_contains_uses_trigram_index(self):
+        self.assertIndexUsed(Subscriber.objects.filter(last_name_norm__contains='ванов'))
+        self.assertIndexUsed(Subscriber.objects.filter(address_norm__contains='магтым'))
+        self.assertIndexUsed(Subscriber.objects.filter(memo1_norm__contains='ah 123'))
+
+    def test_number_contains_uses_trigram_index(self):
+        self.assertIndexUsed(Subscriber.objects.filter(number__contains='65123'))
+        self.assertIndexUsed(Subscriber.objects.filter(imsi__contains='0201234'))
+
+    def test_subscriber_list_filter_uses_indexes(self):
+        term = 'ванов'
+        queryset = Subscriber.objects.filter(
+            Q(number__contains=term) | Q(last_name_norm__contains=term) | Q(first_name_norm__contains=term) |
+            Q(middle_name_norm__contains=term) | Q(address_norm__contains=term) | Q(imsi__contains=term)
+        )
+        self.assertIndexUsed(queryset)
+
+
+class NormalizedSearchKeyTest(TestCase):
+    def test_normalize_search_text(self):
+        # Латинские "a" и "o" в кириллическом слове, ё, лишние пробелы
+        self.assertEqual(normalize_search_text('  Сeмёнoв   Пётр '), 'семенов петр')
+        self.assertEqual(normalize_search_text('I-AH 123456'), 'i-ah 123456')
+        self.assertEqual(normalize_search_text(None), '')
+
+    def test_norm_columns_filled_on_save(self):
+        subscriber = Subscriber.objects.create(number='99365000009', last_name='Сeмёнoв', address='ул.  Ёлочная')
+        subscriber.refresh_from_db()
+        self.assertEqual(subscriber.last_name_norm, 'семенов')
+        self.assertEqual(subscriber.address_norm, 'ул. елочная')
+        self.assertTrue(Subscriber.objects.filter(last_name_norm__contains=normalize_search_text('СЕМЕН')).exists())
+
+
+class FuzzyNameSearchTest(TestCase):
+    def setUp(self):
+        Subscriber.objects.create(number='99365000011', last_name='Иванова', first_name='Мария')
+        Subscriber.objects.create(number='99365000012', last_name='Иванов', first_name='Сергей')
+        Subscriber.objects.create(number='99365000013', last_name='Петров', first_name='Иван')
+
+    def test_phonetic_key_matches_transliteration_and_gender(self):
+        self.assertEqual(phonetic_key('Ivanoff'), phonetic_key('Иванов'))
+        self.assertEqual(phonetic_key('Иванова'), phonetic_key('Иванов'))
+        self.assertEqual(phonetic_key('Sergeyev'), phonetic_key('Сергеев'))
+        self.assertEqual(phonetic_key('Khodjaev'), phonetic_key('Ходжаев'))
+        self.assertEqual(phonetic_key('Dzhumaev'), phonetic_key('Джумаев'))
+        self.assertEqual(phonetic_key('Charyev'), phonetic_key('Чарыев'))
+        self.assertEqual(phonetic_key('Myradov'), phonetic_key('Мырадов'))
+        self.assertNotEqual(phonetic_key('Петров'), phonetic_key('Иванов'))
+
+    def test_transliterated_candidates_found(self):
+        Subscriber.objects.create(number='99365000014', last_name='Ходжаев', first_name='Чары')
+        Subscriber.objects.create(number='99365000015', last_name='Чарыева', first_name='Огулжан')
+        for text, number in (('Khodjaev', '99365000014'), ('Charyev', '99365000015'), ('Ходжаев', '99365000014')):
+            numbers = Subscriber.objects.filter(fuzzy_name_filter(text)).values_list('number', flat=True)
+            self.assertEqual(list(numbers), [number], text)
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance('иванов', 'иванов'), 0)
+        self.assertEqual(edit_distance('иванов', 'иванова'), 1)
+        self.assertEqual(edit_distance('иванов', 'ивонов'), 1)
+
+    def test_candidates_ranked_by_edit_distance(self):
+        candidates = list(Subscriber.objects.filter(fuzzy_name_filter('Ivanov')))
+        self.assertEqual(len(candidates), 2)
+        ranked = rank_fuzzy_candidates('Иванов', candidates)
+        self.assertEqual([subscriber.number for subscriber in ranked], ['99365000012', '99365000011'])
+
+
+class TypeaheadTest(TestCase):
+    def test_prefix_index_returns_most_frequent(self):
+        index = PrefixIndex([('иванов', 'Иванов', 5), ('иванова', 'Иванова', 7), ('ивлев', 'Ивлев', 9),
+                             ('петров', 'Петров', 20)])
+        self.assertEqual(index.suggest('иван', 10), [('Иванова', 7), ('Иванов', 5)])
+        self.assertEqual(index.suggest('ив', 1), [('Ивлев', 9)])
+        self.assertEqual(index.suggest('яш', 10), [])
+
+    def test_suggest_names_from_rebuilt_index(self):
+        Subscriber.objects.create(number='99365000021', last_name='Иванов', first_name='Иван')
+        Subscriber.objects.create(number='99365000022', last_name='Иванов', first_name='Сергей')
+        self.assertTrue(rebuild_name_indexes())
+        self.assertEqual(suggest_names('Сергей ИВА', field='last_name'), [{'value': 'Иванов', 'count': 2}])
+        self.assertEqual(suggest_names('и'), [])
+
+    def test_first_request_does_not_build_index(self):
+        Subscriber.objects.create(number='99365000023', last_name='Иванов', first_name='Иван')
+        with (
+            mock.patch.dict(typeahead._state, indexes=None),
+            mock.patch('subscribers.typeahead.start_rebuild_async') as rebuild,
+            mock.patch('subscribers.typeahead.start_generation_watcher'),
+        ):
+            self.assertEqual(suggest_names('Ива'), [])
+        rebuild.assert_called_once_with()
+
+    def test_new_generation_rebuilds_index(self):
+        Subscriber.objects.create(number='99365000024', last_name='Иванов', first_name='Иван')
+        self.assertTrue(rebuild_name_indexes())
+        self.assertFalse(check_generation())
+        Subscriber.objects.create(number='99365000025', last_name='Ивлев', first_name='Иван')
+        bump_data_generation()
+        self.assertTrue(check_generation())
+        self.assertEqual(suggest_names('ивл', field='last_name'), [{'value': 'Ивлев', 'count': 1}])
+
+
+class CoveringIndexTest(TransactionTestCase):
+    """Страницы списка и поиск по номеру должны читаться index-only scan по покрывающим индексам"""
+
+    def setUp(self):
+        Subscriber.objects.bulk_create([
+            Subscriber(number=f'993650{index:05d}', last_name=f'Фамилия{index % 50}', first_name='Имя',
+                       address='ул. Длинная ' * 50)
+            for index in range(500)
+        ])
+        # Карта видимости нужна index-only scan; VACUUM - только вне транзакции
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM ANALYZE subscribers_subscriber")
+
+    def assertIndexOnly(self, queryset, index_name):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("SET LOCAL enable_bitmapscan = off")
+            plan = queryset.explain()
+        self.assertIn(f'Index Only Scan using {index_name}', plan, plan)
+
+    def test_number_lookup_is_index_only(self):
+        # Без сортировки модели по created_at: её нет в индексе, а поиск сортирует по ключу страницы
+        queryset = Subscriber.objects.filter(is_active=True).only(*SUBSCRIBER_LIST_COLUMNS).order_by()
+        self.assertIndexOnly(queryset.filter(number='99365000123'), 'sub_number_prefix_cover')
+        self.assertIndexOnly(queryset.filter(number__startswith='9936500012'), 'sub_number_prefix_cover')
+
+    def test_name_page_is_index_only(self):
+        paginator = KeysetPaginator(Subscriber.objects.only(*SUBSCRIBER_LIST_COLUMNS), SUBSCRIBER_KEYSET_KEYS)
+        self.assertIndexOnly(paginator.queryset.order_by(*paginator._ordering())[:21], 'sub_name_keyset_cover')
+
+
+class FullTextSearchTest(TestCase):
+    def setUp(self):
+        Subscriber.objects.create(number='99365000001', last_name='Иванов', first_name='Сергей',
+                                  address='г. Ашхабад, ул. Атамурата Ниязова')
+        Subscriber.objects.create(number='99365000002', last_name='Петров', first_name='Иван',
+                                  address='г. Мары')
+
+    def test_search_vector_filled_on_save(self):
+        self.assertFalse(Subscriber.objects.filter(search_vector__isnull=True).exists())
+
+    def test_search_vector_follows_edit(self):
+        subscriber = Subscriber.objects.get(number='99365000002')
+        subscriber.address = 'г. Дашогуз'
+        subscriber.save()
+        numbers = Subscriber.objects.filter(search_vector=build_fulltext_query('дашогуз')).values_list('number', flat=True)
+        self.assertEqual(list(numbers), ['99365000002'])
+        self.assertFalse(Subscriber.objects.filter(search_vector=build_fulltext_query('мары')).exists())
+
+    def test_word_forms_and_prefixes_match(self):
+        numbers = Subscriber.objects.filter(
+            search_vector=build_fulltext_query('Иванова ашхаб')
+        ).values_list('number', flat=True)
+        self.assertEqual(list(numbers), ['99365000001'])
+
+    def test_empty_text_gives_no_query(self):
+        self.assertIsNone(build_fulltext_query(' ,. '))
+
+
+class NumberSearchRoutingTest(TestCase):
+    def setUp(self):
+        Subscriber.objects.create(number='99365123456')
+        Subscriber.objects.create(number='99361654321')
+
+    def numbers(self, digits, mode='auto'):
+        return sorted(Subscriber.objects.filter(number_search_filter(digits, mode)).values_list('number', flat=True))
+
+    def test_reversed_number_filled_on_save(self):
+        self.assertEqual(Subscriber.objects.get(number='99365123456').number_reversed, '65432156399')
+
+    def test_auto_routing(self):
+        self.assertEqual(self.numbers('99365123456'), ['99365123456'])
+        self.assertEqual(self.numbers('9936'), ['99361654321', '99365123456'])
+        # Короткий ввод без 993 - последние цифры номера
+        self.assertEqual(self.numbers('3456'), ['99365123456'])
+        self.assertEqual(self.numbers('6543'), [])
+        # Длинный ввод без 993 ищется в любом месте номера
+        self.assertEqual(self.numbers('65123456'), ['99365123456'])
+        self.assertEqual(self.numbers('36165432'), ['99361654321'])
+
+    def test_explicit_modes(self):
+        self.assertEqual(self.numbers('65', 'prefix'), [])
+        self.assertEqual(self.numbers('654', 'contains'), ['99361654321'])
+        self.assertEqual(self.numbers('6543', 'suffix'), [])
+        self.assertEqual(self.numbers('4321', 'suffix'), ['99361654321'])
+
+    def test_auto_suffix_uses_reversed_index(self):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = Subscriber.objects.filter(number_search_filter('3456')).explain()
+        self.assertIn('sub_number_suffix', plan, plan)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        for index in range(45):
+            Subscriber.objects.create(
+                number=f'9936500{index:04d}',
+                last_name=None if index % 10 == 0 else f'Фамилия{index % 7}',
+                first_name=f'Имя{index % 3}',
+            )
+        self.expected = [
+            subscriber.id for subscriber in sorted(
+                Subscriber.objects.all(), key=lambda s: (s.last_name or '', s.first_name or '', s.id)
+            )
+        ]
+
+    def paginator(self, count_limit=1000):
+        return KeysetPaginator(Subscriber.objects.all(), SUBSCRIBER_KEYSET_KEYS, per_page=20, count_limit=count_limit)
+
+    def test_walk_forward_and_back(self):
+        paginator = self.paginator()
+        pages = [paginator.get_page()]
+        while pages[-1].has_next:
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([obj.id for page in pages for obj in page], self.expected)
+        self.assertEqual(len(pages), 3)
+        self.assertFalse(pages[0].has_previous)
+
+        back = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual([obj.id for obj in back], [obj.id for obj in pages[1]])
+
+        last = paginator.get_page(pages[0].last_cursor)
+        self.assertEqual([obj.id for obj in last], self.expected[-20:])
+        self.assertFalse(last.has_next)
+
+    def test_count_is_capped(self):
+        page = self.paginator(count_limit=30).get_page()
+        self.assertEqual((page.count, page.count_capped), (30, True))
+
+    def test_forged_cursor_opens_first_page(self):
+        page = self.paginator().get_page('forged:cursor')
+        self.assertEqual([obj.id for obj in page], self.expected[:20])
+
+
+class EstimatedCountPaginatorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        for index in range(5):
+            Subscriber.objects.create(number=f'9936100{index:04d}', last_name='Сапаров')
+
+    def test_small_selection_counted_exactly(self):
+        paginator = EstimatedCountPaginator(Subscriber.objects.filter(last_name='Сапаров'), 2)
+        self.assertEqual(paginator.count, 5)
+        self.assertFalse(paginator.count_is_estimate)
+
+    def test_estimate_above_threshold_is_cached(self):
+        queryset = Subscriber.objects.filter(last_name='Сапаров')
+        paginator = EstimatedCountPaginator(queryset, 2, exact_threshold=0)
+        estimate = paginator.count
+        self.assertTrue(paginator.count_is_estimate)
+
+        Subscriber.objects.create(number='99361009999', last_name='Сапаров')
+        cached = EstimatedCountPaginator(queryset, 2, exact_threshold=0)
+        self.assertEqual(cached.count, estimate)
+        self.assertTrue(cached.count_is_estimate)
+
+
+class SearchCacheKeyTest(TestCase):
+    def test_normalized_input_shares_key(self):
+        self.assertEqual(
+            search_cache_key({'full_name': '  Иванов   Иван', 'address': ''}),
+            search_cache_key({'address': '', 'full_name': 'иванов иван'}),
+        )
+        self.assertNotEqual(
+            search_cache_key({'full_name': 'иванов'}),
+            search_cache_key({'full_name': 'иванов'}, cursor='next-page'),
+        )
+
+    def test_new_generation_changes_key(self):
+        key = search_cache_key({'full_name': 'иванов'})
+        bump_data_generation()
+        self.assertNotEqual(search_cache_key({'full_name': 'иванов'}), key)
+
+    def test_save_keeps_generation(self):
+        # Массовая запись через save() не должна сбрасывать кеш на каждой строке
+        key = search_cache_key({'full_name': 'иванов'})
+        Subscriber.objects.create(number='99365000031', last_name='Иванов', first_name='Иван')
+        self.assertEqual(search_cache_key({'full_name': 'иванов'}), key)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=5)
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def read_alias_in_view(self, request, write=False):
+        @use_read_replica
+        def view(request):
+            if write:
+                self.router.db_for_write(Subscriber)
+            return HttpResponse(self.router.db_for_read(Subscriber))
+
+        middleware = ReplicaStickinessMiddleware(view)
+        return middleware(request)
+
+    def test_reads_go_to_replica_only_in_marked_views(self):
+        self.assertEqual(self.router.db_for_read(Subscriber), 'default')
+        self.assertEqual(self.read_alias_in_view(self.factory.get('/')).content, b'replica')
+        self.assertEqual(self.router.db_for_write(Subscriber), 'default')
+
+    def test_write_in_request_pins_reads_to_primary(self):
+        self.assertEqual(self.read_alias_in_view(self.factory.get('/'), write=True).content, b'default')
+
+    def test_recent_write_pins_user_to_primary(self):
+        response = self.read_alias_in_view(self.factory.post('/'))
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE_NAME] = response.cookies[PIN_COOKIE_NAME].value
+        self.assertEqual(self.read_alias_in_view(request).content, b'default')
+
+    def test_migrations_skip_replicas(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'subscribers'))
+        self.assertTrue(self.router.allow_migrate('default', 'subscribers'))
+
+
+class StatementTimeoutTest(TransactionTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_slow_query_gives_timeout_response_and_setting_is_restored(self):
+        @statement_timeout(50, json_response=True)
+        def slow_view(request):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_sleep(1)")
+            return HttpResponse('ok')
+
+        response = slow_view(self.factory.get('/'))
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(json.loads(response.content)['timeout'])
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW statement_timeout")
+            self.assertEqual(cursor.fetchone()[0], '0')
+
+    def test_fast_query_passes(self):
+        @statement_timeout(5000)
+        def fast_view(request):
+            with connection.cursor() as cursor:
+                cursor.execute("SHOW statement_timeout")
+                return HttpResponse(cursor.fetchone()[0])
+
+        self.assertEqual(fast_view(self.factory.get('/')).content, b'5s')
+
+
+class SearchExportTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = User.objects.create_superuser('exporter', 'exporter@example.com', 'password')
+        Subscriber.objects.create(number='99365000031', last_name='Иванов', first_name='Иван', imsi='438020000000031')
+        Subscriber.objects.create(number='99365000032', last_name='Иванова', first_name='Анна', imsi='438020000000032')
+        Subscriber.objects.create(number='99365000033', last_name='Петров', first_name='Пётр')
+
+    def export(self, **params):
+        request = self.factory.get('/subscribers/search/export/', params)
+        request.user = self.user
+        response = export_search_results(request)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_export_streams_filtered_rows_and_logs_once(self):
+        lines = self.export(full_name='иванов')
+        self.assertEqual(len(lines), 3)
+        self.assertIn('IMSI', lines[0])
+        self.assertTrue(lines[1].startswith('99365000031'))
+        log = UserActionLog.objects.get(action_type='EXPORT')
+        self.assertEqual(log.additional_data['rows_count'], 2)
+
+    def test_imsi_masked_without_permission(self):
+        self.user.profile.user_type = 2
+        self.user.profile.save()
+        lines = self.export(full_name='иванов')
+        self.assertNotIn('IMSI', lines[0])
+        self.assertNotIn('438020000000031', lines[1])
+
+
+class BulkLookupTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = User.objects.create_superuser('checker', 'checker@example.com', 'password')
+        for index in range(1, 6):
+            Subscriber.objects.create(number=f'9936500005{index}', last_name=f'Фамилия{index}', first_name='Имя',
+                                      imsi=f'43802000000005{index}')
+        Subscriber.objects.filter(number='99365000055').update(is_active=False)
+
+    def test_numbers_parsed_and_deduplicated(self):
+        lines = ['Номер;ФИО', '99365000051;Иванов', '+993 65 000052,Петров', '99365000051\tповтор', '', '99365000053|x']
+        self.assertEqual(read_lookup_numbers(lines), ['99365000051', '99365000052', '99365000053'])
+
+    def test_rows_found_in_batches_without_inactive(self):
+        numbers = [f'9936500005{index}' for index in range(1, 7)]
+        with self.assertNumQueries(3):
+            rows = list(iter_bulk_lookup_rows(numbers, batch_size=2))
+        self.assertEqual(sorted(row[0] for row in rows), ['99365000051', '99365000052', '99365000053', '99365000054'])
+
+    def test_imsi_column_only_when_allowed(self):
+        with_imsi = list(iter_bulk_lookup_rows(['99365000051']))
+        without_imsi = list(iter_bulk_lookup_rows(['99365000051'], include_imsi=False))
+        self.assertEqual(bulk_lookup_header()[-1], 'IMSI')
+        self.assertNotIn('IMSI', bulk_lookup_header(include_imsi=False))
+        self.assertEqual(with_imsi[0][-1], '438020000000051')
+        self.assertEqual(len(without_imsi[0]), len(with_imsi[0]) - 1)
+        self.assertNotIn('438020000000051', without_imsi[0])
+
+    def test_view_streams_csv_and_logs_once(self):
+        request = self.factory.post('/subscribers/search/bulk/', {'numbers': '99365000051\n99365000052\n99365000055'})
+        request.user = self.user
+        with self.settings(BULK_LOOKUP_BATCH_SIZE=1):
+            response = bulk_lookup(request)
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(len(lines), 3)
+        self.assertIn('IMSI', lines[0])
+        log = UserActionLog.objects.get(action_type='SEARCH')
+        self.assertEqual((log.additional_data['numbers_count'], log.additional_data['results_count']), (3, 2))
+
+    def test_command_writes_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / 'numbers.txt'
+            output = Path(directory) / 'result.csv'
+            source.write_text('99365000053\n99365000054;x\n99365000099\n', encoding='utf-8')
+            call_command('bulk_lookup_numbers', str(source), output=str(output), batch_size=1, no_imsi=True,
+                         stderr=mock.Mock())
+            rows = list(csv.reader(output.open(encoding='utf-8')))
+        self.assertEqual(rows[0], bulk_lookup_header(include_imsi=False))
+        self.assertEqual([row[0] for row in rows[1:]], ['99365000053', '99365000054'])
+
+
+class HistoryIndexTest(TestCase):
+    def setUp(self):
+        Subscriber.objects.create(number='99365000041', last_name='Иванов', first_name='Иван', imsi='438020000000041')
+        Subscriber.objects.create(number='99365000042', last_name='Петров', first_name='Пётр')
+        self.t1 = timezone.now() - datetime.timedelta(days=10)
+        self.t2 = timezone.now() - datetime.timedelta(days=5)
+
+    def test_changed_holder_closes_interval(self):
+        table_name = Subscriber._meta.db_table
+        result = update_history_index(table_name, None, self.t1)
+        self.assertEqual((result['closed'], result['opened']), (0, 2))
+        subscriber = Subscriber.objects.get(number='99365000041')
+        subscriber.last_name = 'Сидоров'
+        subscriber.save()
+        result = update_history_index(table_name, None, self.t2)
+        self.assertEqual((result['closed'], result['opened']), (1, 1))
+
+        before = lookup_history(number='99365000041', at=self.t1 + datetime.timedelta(days=1))
+        self.assertEqual(len(before), 1)
+        self.assertEqual(before[0]['valid_to'], self.t2)
+        # Версии "Иванов" больше нет ни в одной таблице - интервал без данных
+        self.assertIsNone(before[0]['record'])
+
+        now = lookup_history(number='99365000041', at=timezone.now())
+        self.assertEqual(now[0]['record']['last_name'], 'Сидоров')
+        self.assertEqual(now[0]['table_name'], table_name)
+        self.assertEqual(len(lookup_history(imsi='438020000000041')), 2)
+        # Неизменившийся номер - один открытый интервал с t1
+        unchanged = lookup_history(number='99365000042')
+        self.assertEqual([(entry['valid_from'], entry['valid_to']) for entry in unchanged], [(self.t1, None)])
+
+    def test_imsi_hidden_without_permission(self):
+        update_history_index(Subscriber._meta.db_table, None, self.t1)
+        entry = lookup_history(number='99365000041', include_imsi=False)[0]
+        self.assertIsNone(entry['imsi'])
+        self.assertNotIn('imsi', entry['record'])
+
+
+class ImportDiffTest(TestCase):
+    archive_table = 'subscribers_subscriber_archive_1700000000'
+
+    def setUp(self):
+        Subscriber.objects.create(number='99365000051', last_name='Иванов', first_name='Иван', address='Ашхабад')
+        Subscriber.objects.create(number='99365000052', last_name='Петров', first_name='Пётр', address='Мары')
+        Subscriber.objects.create(number='99365000053', last_name='Сидоров', first_name='Сидор')
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE TABLE {self.archive_table} (LIKE subscribers_subscriber INCLUDING ALL)")
+            cursor.execute(f"INSERT INTO {self.archive_table} SELECT * FROM subscribers_subscriber")
+        Subscriber.objects.filter(number='99365000053').delete()
+        Subscriber.objects.create(number='99365000054', last_name='Новиков', first_name='Ной')
+        for number, field, value in (('99365000051', 'last_name', 'Смирнов'), ('99365000052', 'address', 'Дашогуз')):
+            subscriber = Subscriber.objects.get(number=number)
+            setattr(subscriber, field, value)
+            subscriber.save()
+        self.import_history = ImportHistory.objects.create(
+            file_name='diff.csv', import_session_id='diff-test', archive_table_name=self.archive_table
+        )
+
+    def test_stored_hash_matches_sql_hash(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM subscribers_subscriber WHERE row_hash <> {row_hash_sql(connection.ops.quote_name)}")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_merge_classifies_changes(self):
+        old = [('1', 'a', 'X'), ('2', 'b', 'Y'), ('3', 'c', 'Z')]
+        new = [('2', 'b2', 'Y'), ('3', 'c2', 'W'), ('4', 'd', 'Q')]
+        self.assertEqual([kind for kind, _, _ in merge_diff(old, new)], ['removed', 'changed', 'owner_changed', 'added'])
+
+    def test_diff_writes_file_and_counts(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root, DIFF_BATCH_SIZE=2):
+            stats = run_import_diff(self.import_history.id)
+            self.assertEqual(stats['status'], 'completed')
+            self.assertEqual(stats['counts'], {'added': 1, 'removed': 1, 'owner_changed': 1, 'changed': 1})
+            self.assertEqual((stats['old_rows'], stats['new_rows']), (3, 3))
+            self.import_history.refresh_from_db()
+            self.assertEqual(self.import_history.diff_stats['counts']['owner_changed'], 1)
+            with self.import_history.diff_file.open('r') as fh:
+                rows = list(csv.reader(fh))
+        self.assertEqual([row[1] for row in rows[1:]], ['99365000051', '99365000052', '99365000053', '99365000054'])
+        self.assertEqual(rows[1][2], 'Иванов')
+        self.assertEqual(rows[1][6], 'Смирнов')
+
+
+class ImportPipelineTest(TestCase):
+    """Конвейер импорта: чтение/разбор в отдельном потоке -> очередь -> пакетная запись во временную таблицу"""
+    temp_table = 'subscribers_subscriber_temp_test'
+    rows = [
+        'ID,Номер,Фамилия,Имя,Отчество,Адрес,Memo1,Memo2,Место рождения,Дата рождения,IMSI',
+        '1,99365000061,Иванов,Иван,,Ашхабад,,,,1980-01-02,',
+        '2,99365000062,Петров,Пётр,,Мары,,,,,',
+        # Тот же номер, что у записи 1: пакет не вставится и будет разобран построчно
+        '3,99365000061,Дубль,Номер,,,,,,,',
+        # Разорванная запись - адрес продолжается на следующей строке
+        '4,99365000064,Сидоров,Сидор,,ул. Длинная',
+        'дом 5,,,,,',
+        # Мало полей - ошибка разбора
+        '5,99365000065',
+        '6,99365000066,Новиков,Ной,,,,,,,',
+    ]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.import_history = ImportHistory.objects.create(
+            file_name='pipeline.csv', import_session_id='pipeline-test', temp_table_name=self.temp_table
+        )
+        _create_temp_table(self.temp_table)
+
+    def write_file(self, name='pipeline.csv', rows=None):
+        path = Path(self.tmp_dir.name) / name
+        data = ('\n'.join(rows or self.rows) + '\n').encode('utf-8')
+        path.write_bytes(gzip.compress(data) if name.endswith('.gz') else data)
+        return path
+
+    def run_pipeline(self, path, processed_rows_start=0):
+        with override_settings(IMPORT_PIPELINE_BATCH_SIZE=3, IMPORT_PIPELINE_QUEUE_SIZE=2):
+            return _process_csv_lines_with_smart_joining(path, ',', 'utf-8', self.import_history, processed_rows_start)
+
+    def temp_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT original_id, number, address FROM {self.temp_table} ORDER BY original_id")
+            return cursor.fetchall()
+
+    def error_rows(self):
+        return list(self.import_history.errors.order_by('row_index', 'id').values_list('row_index', 'raw_data'))
+
+    def test_bad_rows_inside_batch(self):
+        created, failed, processed = self.run_pipeline(self.write_file())
+        self.assertEqual((created, failed, processed), (4, 2, 6))
+        self.import_history.refresh_from_db()
+        self.assertEqual(
+            (self.import_history.records_created, self.import_history.records_failed, self.import_history.processed_rows),
+            (4, 2, 6)
+        )
+        self.assertEqual(self.temp_rows(), [
+            (1, '99365000061', 'Ашхабад'),
+            (2, '99365000062', 'Мары'),
+            (4, '99365000064', 'ул. Длинная дом 5'),
+            (6, '99365000066', ''),
+        ])
+        errors = self.error_rows()
+        self.assertEqual([row_index for row_index, _ in errors], [3, 5])
+        self.assertTrue(errors[0][1].startswith('3,99365000061'))
+        self.assertEqual(errors[1][1], '5,99365000065')
+
+    def test_validate_temp_table_checks_row_count(self):
+        self.run_pipeline(self.write_file())
+        self.import_history.refresh_from_db()
+        timings = {}
+        checks = _validate_temp_table(self.import_history, timings)
+        self.assertEqual(checks['row_count'], 4)
+        self.assertEqual((checks['duplicate_numbers'], checks['uniqueness_source']), (0, 'unique_index'))
+        self.assertIn('analyze_ms', timings)
+        # Счётчик не сходится с таблицей - подменять такую таблицу нельзя
+        self.import_history.records_created = 5
+        with self.assertRaisesMessage(Exception, 'Проверка временной таблицы не пройдена'):
+            _validate_temp_table(self.import_history, {})
+
+    def test_prewarm_hot_indexes(self):
+        self.run_pipeline(self.write_file())
+        result = _prewarm_temp_table(self.import_history, {})
+        self.assertNotIn('error', result)
+        self.assertIn(result['method'], ('pg_prewarm', 'index_scan'))
+        self.assertTrue(result['relations'])
+        with override_settings(IMPORT_PREWARM_ENABLED=False):
+            self.assertIsNone(_prewarm_temp_table(self.import_history, {}))
+        with override_settings(IMPORT_PREWARM_MAX_MB=0):
+            self.assertTrue(_prewarm_temp_table(self.import_history, {})['budget_exhausted'])
+
+    def reset_import(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {self.temp_table}")
+        self.import_history.errors.all().delete()
+        ImportHistory.objects.filter(pk=self.import_history.pk).update(
+            records_created=0, records_failed=0, processed_rows=0, resume_byte_offset=0
+        )
+        self.import_history.refresh_from_db()
+
+    def test_resume_after_interrupted_batch(self):
+        # Строки без ID до первой записи - ошибки; первый пакет (размер 3) состоит только из них
+        rows = self.rows[:1] + ['мусор без номера', 'ещё мусор', 'и ещё'] + [
+            f'{index},9936500007{index},Фамилия{index},Имя,,,,,,,' for index in range(1, 7)
+        ]
+        cases = [
+            # (файл, пакетов до остановки, резюме по смещению)
+            ('resume.csv', 1, True),
+            ('resume.csv', 2, True),
+            ('resume.csv', 2, False),
+            ('resume.csv.gz', 1, True),
+            ('resume.csv.gz', 2, True),
+            ('resume.csv.gz', 2, False),
+        ]
+        for name, batches, from_offset in cases:
+            with self.subTest(file=name, batches=batches, from_offset=from_offset):
+                self.reset_import()
+                path = self.write_file(name, rows)
+                with mock.patch('subscribers.tasks._check_pause_cancel', side_effect=[False] * (batches - 1) + [True]):
+                    self.run_pipeline(path)
+                self.import_history.refresh_from_db()
+                checkpoint = self.import_history.processed_rows
+                self.assertEqual(checkpoint, (batches - 1) * 3)
+                self.assertGreater(self.import_history.resume_byte_offset, 0)
+                if not from_offset:
+                    # Контрольная точка без смещения - записи до неё пропускаются по счёту
+                    self.import_history.resume_byte_offset = 0
+                    self.import_history.save(update_fields=['resume_byte_offset'])
+
+                created, failed, processed = self.run_pipeline(path, checkpoint)
+                self.assertEqual((created, failed, processed), (6, 3, 6))
+                self.assertEqual([row[0] for row in self.temp_rows()], [1, 2, 3, 4, 5, 6])
+                self.assertEqual([row_index for row_index, _ in self.error_rows()], [0, 0, 0])
+
+
+class ImportStreamTest(SimpleTestCase):
+    """Сжатые файлы импорта читаются как распакованный поток с seek() для контрольных точек"""
+    data = b'ID,Number\n1,99365000081\n2,99365000082\n'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def make_file(self, name):
+        path = Path(self.tmp_dir.name) / name
+        if name.endswith('.gz'):
+            path.write_bytes(gzip.compress(self.data))
+        elif name.endswith('.bz2'):
+            path.write_bytes(bz2.compress(self.data))
+        elif name.endswith('.xz'):
+            path.write_bytes(lzma.compress(self.data))
+        elif name.endswith('.zip'):
+            with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr('export/subscribers.csv', self.data)
+        else:
+            path.write_bytes(self.data)
+        return path
+
+    def test_supported_extensions(self):
+        for name in ('a.csv', 'A.CSV.GZ', 'a.csv.bz2', 'a.csv.xz', 'a.zip'):
+            self.assertTrue(is_supported_import_file(name), name)
+        for name in ('a.txt', 'a.gz', 'a.tar.gz', 'a.csv.7z', '', None):
+            self.assertFalse(is_supported_import_file(name), name)
+
+    def test_streams_are_decompressed_and_seekable(self):
+        second_line = self.data.index(b'1,')
+        for name in ('plain.csv', 'data.csv.gz', 'data.csv.bz2', 'data.csv.xz', 'data.zip'):
+            with self.subTest(file=name), _open_import_stream(self.make_file(name)) as (stream, raw):
+                self.assertEqual(stream.readline(), b'ID,Number\n')
+                self.assertEqual(stream.tell(), second_line)
+                self.assertEqual(stream.read(), self.data[second_line:])
+                self.assertGreater(raw.tell(), 0)
+                # Резюме: переход к контрольной точке в распакованных байтах
+                stream.seek(second_line)
+                self.assertEqual(stream.readline(), b'1,99365000081\n')
+
+    def test_zip_must_hold_one_file(self):
+        path = Path(self.tmp_dir.name) / 'two.zip'
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('a.csv', self.data)
+            archive.writestr('b.csv', self.data)
+        with zipfile.ZipFile(path) as archive:
+            with self.assertRaises(ValueError):
+                get_zip_csv_entry(archive)
+        with zipfile.ZipFile(self.make_file('one.zip')) as archive:
+            self.assertEqual(get_zip_csv_entry(archive).filename, 'export/subscribers.csv')
+
+
+@override_settings(FINALIZE_LOCK_RETRIES=3, FINALIZE_RETRY_BACKOFF_SECONDS=0)
+class SwapTablesRetryTest(TestCase):
+    """Подмена таблиц повторяется, если блокировки не получены за lock_timeout (SQLSTATE 55P03)"""
+
+    def db_error(self, pgcode):
+        cause = Exception(f'SQLSTATE {pgcode}')
+        cause.pgcode = pgcode
+        error = OperationalError(f'SQLSTATE {pgcode}')
+        error.__cause__ = cause
+        return error
+
+    def swap(self, failures):
+        """Подмена на поддельном курсоре: LOCK TABLE по очереди бросает ошибки failures"""
+        executed = []
+
+        def execute(sql, params=None):
+            executed.append(sql)
+            if sql.startswith('LOCK TABLE') and failures:
+                raise failures.pop(0)
+
+        fake_connection = mock.MagicMock()
+        fake_connection.ops.quote_name = connection.ops.quote_name
+        fake_connection.cursor.return_value.__enter__.return_value.execute.side_effect = execute
+        timings = {}
+        with mock.patch('subscribers.tasks.connection', fake_connection):
+            try:
+                _swap_tables('subscribers_subscriber_temp_1', 'subscribers_subscriber_archive_1', timings)
+            finally:
+                self.renames = [sql for sql in executed if 'RENAME' in sql]
+        return timings
+
+    def test_retries_on_lock_timeout(self):
+        timings = self.swap([self.db_error('55P03'), self.db_error('55P03')])
+        self.assertEqual(timings['lock_attempts'], 3)
+        self.assertIn('swap_ms', timings)
+        self.assertEqual(len(self.renames), 2)
+
+    def test_gives_up_after_retries(self):
+        with self.assertRaisesMessage(Exception, 'за 3 попыток'):
+            self.swap([self.db_error('55P03')] * 3)
+        self.assertEqual(self.renames, [])
+
+    def test_other_errors_are_not_retried(self):
+        with self.assertRaises(OperationalError):
+            self.swap([self.db_error('40P01')])
+        self.assertEqual(self.renames, [])
+
+
+class RollbackToArchiveTest(TestCase):
+    archive_table = 'subscribers_subscriber_archive_1700000001'
+
+    def setUp(self):
+        Subscriber.objects.create(number='99365000091', last_name='Иванов', first_name='Иван')
+        Subscriber.objects.create(number='99365000092', last_name='Петров', first_name='Пётр')
+        with connection.cursor() as cursor:
+            # Архив без индексов и без своей последовательности id - как у архивов старых версий
+            cursor.execute(f"CREATE TABLE {self.archive_table} (LIKE subscribers_subscriber)")
+            cursor.execute(f"INSERT INTO {self.archive_table} SELECT * FROM subscribers_subscriber")
+            cursor.execute(f"UPDATE {self.archive_table} SET id = id + 100, last_name = 'Архивный'")
+            self.main_indexes = _index_signatures(cursor, 'subscribers_subscriber')
+        self.import_history = ImportHistory.objects.create(
+            file_name='rollback.csv', import_session_id='rollback-test', archive_table_name=self.archive_table
+        )
+
+    def test_rollback_restores_archive_with_indexes_and_sequence(self):
+        with mock.patch('subscribers.tasks.start_typeahead_rebuild'):
+            result = rollback_to_archive(self.archive_table)
+        self.assertTrue(result['success'], result)
+        self.assertTrue(result['created_indexes'])
+        self.assertEqual(set(Subscriber.objects.values_list('last_name', flat=True)), {'Архивный'})
+        with connection.cursor() as cursor:
+            self.assertEqual(_index_signatures(cursor, 'subscribers_subscriber'), self.main_indexes)
+            # Прежняя основная таблица ушла в архив целиком
+            cursor.execute(f"SELECT COUNT(*) FROM {result['archive_table_name']} WHERE last_name <> 'Архивный'")
+            self.assertEqual(cursor.fetchone()[0], 2)
+            cursor.execute("SELECT to_regclass(%s)", [self.archive_table])
+            self.assertIsNone(cursor.fetchone()[0])
+
+        max_id = max(Subscriber.objects.values_list('id', flat=True))
+        created = Subscriber.objects.create(number='99365000093', last_name='Новиков', first_name='Ной')
+        self.assertEqual(created.id, max_id + 1)
+
+        self.import_history.refresh_from_db()
+        self.assertIsNotNone(self.import_history.rolled_back_at)
+        self.assertEqual(self.import_history.rollback_table_name, result['archive_table_name'])
+        self.assertEqual(self.import_history.rollback_stats['status'], 'completed')
+
+    def test_async_rollback_is_marked_running_and_blocks_finalize(self):
+        with mock.patch('subscribers.tasks.threading.Thread') as thread:
+            result = start_rollback_async(self.archive_table)
+        self.assertTrue(result['success'], result)
+        self.assertIs(thread.call_args.kwargs['target'], process_rollback)
+        thread.return_value.start.assert_called_once()
+        # Таблицы ещё не подменены - это сделает фоновый поток
+        self.assertEqual(set(Subscriber.objects.values_list('last_name', flat=True)), {'Иванов', 'Петров'})
+        self.import_history.refresh_from_db()
+        self.assertEqual(self.import_history.rollback_stats['status'], 'running')
+
+        pending = ImportHistory.objects.create(file_name='next.csv', import_session_id='next', status='temp_completed')
+        self.assertIsNotNone(claim_table_swap(pending, status='processing', phase='finalizing'))
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, 'temp_completed')
+        self.assertFalse(rollback_to_archive(self.archive_table)['success'])
+
+    def test_rollback_refused_during_finalize(self):
+        ImportHistory.objects.create(file_name='final.csv', import_session_id='final',
+                                     status='processing', phase='finalizing')
+        result = rollback_to_archive(self.archive_table)
+        self.assertFalse(result['success'])
+        self.import_history.refresh_from_db()
+        self.assertIsNone(self.import_history.rollback_stats)
+
+    def test_archive_listing_reads_manifest(self):
+        manifest = {'import_id': self.import_history.id, 'file_name': 'rollback.csv', 'rows': 2}
+        with connection.cursor() as cursor:
+            cursor.execute(f"COMMENT ON TABLE {self.archive_table} IS %s", [json.dumps(manifest)])
+        tables = {table['name']: table for table in list_archive_tables()['tables']}
+        archive = tables[self.archive_table]
+        self.assertEqual((archive['rows'], archive['rows_source']), (2, 'manifest'))
+        self.assertEqual(archive['manifest'], manifest)
+        self.assertEqual(archive['import_id'], self.import_history.id)
+        exact = {table['name']: table for table in list_archive_tables(exact_counts=True)['tables']}
+        self.assertEqual((exact[self.archive_table]['rows'], exact[self.archive_table]['rows_source']), (2, 'exact'))
+
+    def test_rejects_foreign_table_names(self):
+        result = rollback_to_archive('auth_user')
+        self.assertFalse(result['success'])
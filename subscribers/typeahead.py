@@ -0,0 +1,182 @@
+import bisect
+import heapq
+import logging
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Count, Min
+
+from .models import Subscriber, SEARCH_NORMALIZED_FIELDS, get_data_generation, normalize_search_text
+
+logger = logging.getLogger(__name__)
+
+# Поля подсказок ФИО
+TYPEAHEAD_FIELDS = ('last_name', 'first_name')
+
+# Символ больше любой буквы: prefix + _PREFIX_END - верхняя граница диапазона префикса
+_PREFIX_END = '\U0010ffff'
+
+
+class PrefixIndex:
+    """
+    Подсказки по префиксу без обращения к БД: отсортированный массив различных
+    нормализованных значений и параллельные массивы исходного написания и частоты.
+    Диапазон префикса находится двумя bisect, из него берутся самые частые значения.
+    """
+
+    def __init__(self, entries):
+        entries = sorted(entries)
+        self.keys = [key for key, _, _ in entries]
+        self.values = [value for _, value, _ in entries]
+        self.counts = [count for _, _, count in entries]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def suggest(self, prefix, limit=10):
+        """Самые частые значения, начинающиеся с prefix (уже нормализованного): [(значение, частота)]"""
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + _PREFIX_END, lo=start)
+        top = heapq.nlargest(limit, range(start, end), key=self.counts.__getitem__)
+        return [(self.values[position], self.counts[position]) for position in top]
+
+
+# Текущие индексы процесса и поколение данных, по которому они построены
+_state = {'indexes': None, 'generation': None}
+_rebuild_lock = threading.Lock()
+# Фоновый поток сверки поколения данных, один на процесс
+_watcher = {'thread': None}
+_watcher_lock = threading.Lock()
+
+
+def build_name_indexes():
+    """Строит PrefixIndex по каждому полю TYPEAHEAD_FIELDS: GROUP BY по колонке *_norm активных абонентов."""
+    indexes = {}
+    for field in TYPEAHEAD_FIELDS:
+        norm_field = SEARCH_NORMALIZED_FIELDS[field]
+        rows = (
+            Subscriber.objects.filter(is_active=True).exclude(**{norm_field: ''})
+            .order_by().values_list(norm_field).annotate(value=Min(field), count=Count('id'))
+        )
+        indexes[field] = PrefixIndex(rows.iterator(chunk_size=10000))
+    return indexes
+
+
+def rebuild_name_indexes():
+    """Перестраивает индексы подсказок и подменяет их целиком; параллельные перестройки не запускаются."""
+    if not _rebuild_lock.acquire(blocking=False):
+        return False
+    try:
+        started = time.monotonic()
+        generation = get_data_generation()
+        indexes = build_name_indexes()
+        _state.update(indexes=indexes, generation=generation)
+        logger.info(
+            f"Индекс подсказок ФИО построен за {int((time.monotonic() - started) * 1000)} мс: "
+            + ', '.join(f"{field}={len(index)}" for field, index in indexes.items())
+        )
+        return True
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"Не удалось построить индекс подсказок ФИО: {e}")
+        return False
+    finally:
+        _rebuild_lock.release()
+
+
+def _rebuild_in_thread():
+    try:
+        rebuild_name_indexes()
+    finally:
+        connection.close()
+
+
+def start_rebuild_async():
+    """
+    Перестраивает индексы подсказок в фоновом потоке; до готовности отвечает старый индекс.
+    Если перестройка уже идёт, второй поток не запускается.
+    """
+    if _rebuild_lock.locked():
+        return None
+    t = threading.Thread(target=_rebuild_in_thread, name='typeahead-rebuild', daemon=True)
+    t.start()
+    return t
+
+
+def check_generation():
+    """
+    Сверяет поколение данных (финализация импорта в другом процессе, откат, правка
+    абонента) с поколением индексов и при смене перестраивает их. True - перестроены.
+    """
+    if _state['indexes'] is None or get_data_generation() == _state['generation']:
+        return False
+    return rebuild_name_indexes()
+
+
+def _watch_generation():
+    """Цикл фонового потока: раз в TYPEAHEAD_GENERATION_CHECK_SECONDS - check_generation()."""
+    while True:
+        time.sleep(getattr(settings, 'TYPEAHEAD_GENERATION_CHECK_SECONDS', 60))
+        try:
+            close_old_connections()
+            check_generation()
+        except Exception as e:  # noqa: BLE001
+            logger.warning(f"Не удалось проверить поколение данных для подсказок: {e}")
+
+
+def start_generation_watcher():
+    """Запускает поток сверки поколения данных, если он ещё не запущен в этом процессе."""
+    with _watcher_lock:
+        if _watcher['thread'] is not None and _watcher['thread'].is_alive():
+            return False
+        _watcher['thread'] = threading.Thread(target=_watch_generation, name='typeahead-generation', daemon=True)
+        _watcher['thread'].start()
+        return True
+
+
+def preload_name_indexes():
+    """
+    Построение индексов при старте процесса веб-сервера (SubscribersConfig.ready).
+    Для manage.py, кроме runserver, не строится: миграциям и командам индекс не нужен.
+    """
+    if not getattr(settings, 'TYPEAHEAD_PRELOAD', True):
+        return
+    if sys.argv[0].endswith('manage.py') and sys.argv[1:2] != ['runserver']:
+        return
+    start_rebuild_async()
+    start_generation_watcher()
+
+
+def get_name_indexes():
+    """
+    Индексы процесса. Запрос к БД не делает: пока индексы не построены, отдаёт пустой
+    результат и запускает фоновое построение. Свежесть индексов отслеживает фоновый поток
+    (start_generation_watcher), а не запросы подсказок.
+    """
+    if _state['indexes'] is None:
+        start_rebuild_async()
+        start_generation_watcher()
+        return {}
+    return _state['indexes']
+
+
+def suggest_names(text, field=None, limit=None):
+    """
+    Подсказки для ввода ФИО: по последнему слову ввода, по одному полю или по фамилии
+    и имени вместе (частоты одинаковых написаний складываются). [{'value', 'count'}]
+    """
+    limit = limit or getattr(settings, 'TYPEAHEAD_LIMIT', 10)
+    words = normalize_search_text(text).split()
+    if not words or len(words[-1]) < getattr(settings, 'TYPEAHEAD_MIN_PREFIX', 2):
+        return []
+    indexes = get_name_indexes()
+    fields = [field] if field in TYPEAHEAD_FIELDS else list(TYPEAHEAD_FIELDS)
+    counts = {}
+    for name in fields:
+        if name in indexes:
+            for value, count in indexes[name].suggest(words[-1], limit):
+                counts[value] = counts.get(value, 0) + count
+    top = heapq.nlargest(limit, counts.items(), key=lambda item: item[1])
+    return [{'value': value, 'count': count} for value, count in top]
@@ -22,11 +22,18 @@ urlpatterns = [
     path('import/cancel/<int:import_id>/', views.import_cancel, name='import_cancel'),
     path('import/finalize/<int:import_id>/', views.import_finalize, name='import_finalize'),
     path('import/errors/<int:import_id>/', views.import_errors, name='import_errors'),
+    path('import/diff/<int:import_id>/', views.import_diff, name='import_diff'),
+    path('import/diff/<int:import_id>/download/', views.import_diff_download, name='import_diff_download'),
     path('import/cleanup-archives/', views.cleanup_archives, name='cleanup_archives'),
     path('import/list-archives/', views.list_archives, name='list_archives'),
+    path('import/rollback-archive/<str:table_name>/', views.rollback_archive, name='rollback_archive'),
     
     # Поиск абонентов
     path('search/', views.search_subscribers, name='search'),
+    path('search/bulk/', views.bulk_lookup, name='bulk_lookup'),
+    path('search/export/', views.export_search_results, name='search_export'),
+    path('search/typeahead/', views.name_typeahead, name='name_typeahead'),
+    path('search/history/', views.subscriber_history, name='history'),
     
     # Детали абонента
     path('subscriber/<int:subscriber_id>/', views.subscriber_detail, name='subscriber_detail'),
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.postgres.search import SearchQuery
+from django.db.models import Q
+from django.db import connections, router
+
+from .models import Subscriber, get_data_generation, normalize_search_text, phonetic_key
+
+# Колонки выгрузки массовой проверки номеров: (колонка таблицы, заголовок CSV)
+BULK_LOOKUP_COLUMNS = (
+    ('number', 'Номер'),
+    ('last_name', 'Фамилия'),
+    ('first_name', 'Имя'),
+    ('middle_name', 'Отчество'),
+    ('birth_date', 'Дата рождения'),
+    ('birth_place', 'Место рождения'),
+    ('address', 'Адрес'),
+    ('memo1', 'Паспорт'),
+    ('memo2', 'Memo2'),
+    ('imsi', 'IMSI'),
+)
+
+_NON_DIGITS_RE = re.compile(r'\D+')
+_WORD_RE = re.compile(r'[^\W_]+')
+
+# Основы слов запроса по конфигурации russian и основа от основы: стеммер режет
+# «Иванова» до «иванов», а «Иванов» - до «иван», поэтому одной основы мало
+_FULLTEXT_STEMS_SQL = """
+    SELECT s.stem, (tsvector_to_array(to_tsvector('russian', s.stem)))[1]
+    FROM unnest(%s::text[]) WITH ORDINALITY AS w(word, n)
+    CROSS JOIN LATERAL unnest(tsvector_to_array(to_tsvector('russian', w.word))) AS s(stem)
+    ORDER BY w.n
+"""
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи, чтобы отдавать CSV потоком."""
+
+    def write(self, value):
+        return value
+
+
+def read_lookup_numbers(lines):
+    """
+    Собирает номера для массовой проверки: первое поле каждой строки, только цифры.
+    Пустые строки и заголовки без цифр пропускаются, повторы убираются с сохранением порядка.
+    """
+    numbers = {}
+    for line in lines:
+        first_field = re.split(r'[,;\t|]', line.strip(), maxsplit=1)[0]
+        number = _NON_DIGITS_RE.sub('', first_field)
+        if number:
+            numbers[number] = None
+    return list(numbers)
+
+
+def bulk_lookup_header(include_imsi=True):
+    """Заголовок CSV массовой проверки."""
+    return [title for column, title in BULK_LOOKUP_COLUMNS if include_imsi or column != 'imsi']
+
+
+def iter_bulk_lookup_rows(numbers, include_imsi=True, batch_size=None):
+    """
+    Ищет номера пачками через number = ANY(%s): один запрос на пачку по уникальному
+    индексу number вместо запроса на каждый номер. Отдаёт строки найденных абонентов
+    в порядке BULK_LOOKUP_COLUMNS.
+    """
+    batch_size = batch_size or getattr(settings, 'BULK_LOOKUP_BATCH_SIZE', 5000)
+    # Соединение выбирает роутер: в представлениях только для чтения - реплика
+    db = connections[router.db_for_read(Subscriber)]
+    columns = [column for column, _ in BULK_LOOKUP_COLUMNS if include_imsi or column != 'imsi']
+    sql = (
+        f"SELECT {', '.join(db.ops.quote_name(column) for column in columns)} "
+        f"FROM {db.ops.quote_name(Subscriber._meta.db_table)} "
+        f"WHERE number = ANY(%s) AND is_active"
+    )
+    with db.cursor() as cursor:
+        for offset in range(0, len(numbers), batch_size):
+            cursor.execute(sql, [numbers[offset:offset + batch_size]])
+            for row in cursor.fetchall():
+                yield ['' if value is None else value for value in row]
+
+
+def build_fulltext_query(text):
+    """
+    Готовит запрос полнотекстового поиска: каждое слово - префикс своей основы (иванов:*),
+    или основа от основы целиком (иван), слова через &. Так «Иванова» найдёт и «Иванов».
+    Стоп-слова отбрасываются; для строки без слов - None.
+    """
+    words = _WORD_RE.findall(text or '')
+    if not words:
+        return None
+    with connections[router.db_for_read(Subscriber)].cursor() as cursor:
+        cursor.execute(_FULLTEXT_STEMS_SQL, [words])
+        stems = cursor.fetchall()
+    if not stems:
+        return None
+    terms = [
+        f"('{stem}':* | '{short_stem}')" if short_stem and short_stem != stem else f"'{stem}':*"
+        for stem, short_stem in stems
+    ]
+    # Основы уже готовы - конфигурация simple не меняет их повторно
+    return SearchQuery(' & '.join(terms), search_type='raw', config='simple')
+
+
+def edit_distance(first, second):
+    """Расстояние Левенштейна: число вставок, удалений и замен символов."""
+    if len(first) < len(second):
+        first, second = second, first
+    previous = list(range(len(second) + 1))
+    for row, first_char in enumerate(first, 1):
+        current = [row]
+        for column, second_char in enumerate(second, 1):
+            current.append(min(
+                previous[column] + 1,
+                current[column - 1] + 1,
+                previous[column - 1] + (first_char != second_char),
+            ))
+        previous = current
+    return previous[-1]
+
+
+def fuzzy_name_filter(text):
+    """
+    Фильтр кандидатов нечёткого поиска: фонетический ключ фамилии или имени совпадает
+    с ключом одного из слов ввода (равенство по индексам sub_*_phonetic). None - нет слов.
+    """
+    keys = sorted({key for key in (phonetic_key(word) for word in _WORD_RE.findall(text or '')) if key})
+    if not keys:
+        return None
+    return Q(last_name_phonetic__in=keys) | Q(first_name_phonetic__in=keys)
+
+
+def rank_fuzzy_candidates(text, candidates):
+    """
+    Упорядочивает кандидатов нечёткого поиска: для каждого слова ввода берётся ближайшее
+    по расстоянию Левенштейна слово ФИО (по колонкам *_norm), расстояния суммируются.
+    Считается в Python только по уже ограниченному набору кандидатов.
+    """
+    words = [normalize_search_text(word) for word in _WORD_RE.findall(text or '')]
+
+    def score(subscriber):
+        name_words = ' '.join(filter(None, [
+            subscriber.last_name_norm, subscriber.first_name_norm, subscriber.middle_name_norm
+        ])).split()
+        if not name_words:
+            return sum(len(word) for word in words)
+        return sum(min(edit_distance(word, name_word) for name_word in name_words) for word in words)
+
+    for subscriber in candidates:
+        subscriber.fuzzy_distance = score(subscriber)
+    return sorted(candidates, key=lambda subscriber: (
+        subscriber.fuzzy_distance, subscriber.last_name_norm, subscriber.first_name_norm, subscriber.id
+    ))
+
+
+def number_search_filter(digits, mode='auto'):
+    """
+    Фильтр поиска по номеру, направленный на подходящий индекс:
+    полный номер (11 цифр с 993) - точное совпадение по уникальному индексу;
+    prefix - number LIKE 'x%' (покрывающий индекс sub_number_prefix_cover);
+    suffix - number_reversed LIKE 'обратное x%' (индекс sub_number_suffix);
+    contains - number LIKE '%x%' (триграммный индекс).
+    В режиме auto ввод с кодом страны 993 ищется по префиксу, короткий ввод (операторы
+    набирают последние 4-7 цифр) - по окончанию номера, более длинный - по любой части.
+    """
+    if len(digits) == 11 and digits.startswith('993'):
+        return Q(number=digits)
+    if mode == 'auto':
+        if digits.startswith('993'):
+            mode = 'prefix'
+        elif len(digits) <= getattr(settings, 'NUMBER_SUFFIX_MAX_DIGITS', 7):
+            mode = 'suffix'
+        else:
+            mode = 'contains'
+    if mode == 'prefix':
+        return Q(number__startswith=digits)
+    if mode == 'suffix':
+        return Q(number_reversed__startswith=digits[::-1])
+    return Q(number__contains=digits)
+
+
+def get_search_cache():
+    """Кеш результатов поиска (алиас SEARCH_CACHE_ALIAS в CACHES)."""
+    return caches[getattr(settings, 'SEARCH_CACHE_ALIAS', 'default')]
+
+
+def search_cache_key(cleaned_data, cursor=None):
+    """
+    Ключ кеша поиска: нормализованный ввод SearchForm, курсор страницы и поколение данных.
+    После финализации импорта или отката поколение растёт, и все старые ключи
+    перестают совпадать сразу - без перебора и удаления записей кеша.
+    """
+    normalized = {
+        name: normalize_search_text(value) if isinstance(value, str) else value
+        for name, value in sorted(cleaned_data.items())
+    }
+    payload = json.dumps([normalized, cursor or ''], ensure_ascii=False, default=str)
+    digest = hashlib.md5(payload.encode()).hexdigest()
+    return f"search:{get_data_generation()}:{digest}"
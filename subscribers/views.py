@@ -4,12 +4,14 @@ import io
 import datetime
 import logging
 import base64
+import zipfile
 from django.shortcuts import redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.core.paginator import Paginator
+from django.conf import settings
+from django.contrib.postgres.search import SearchRank
 from django.db import transaction
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.urls import reverse
 from django.db import models
@@ -20,10 +22,28 @@ from django.urls import reverse_lazy
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
-from .models import Subscriber, ImportHistory, ImportError
-from .forms import CSVImportForm, SearchForm
-from .tasks import process_csv_import_task_impl, start_import_async, is_import_running
-from accounts.utils import is_admin
+from .models import (
+    Subscriber, ImportHistory, ImportError, SUBSCRIBER_KEYSET_KEYS, SUBSCRIBER_LIST_COLUMNS,
+    SUBSCRIBER_SEARCH_COLUMNS, normalize_search_text,
+)
+from .forms import CSVImportForm, SearchForm, BulkLookupForm, HistoryLookupForm
+from .utils import (
+    BULK_LOOKUP_COLUMNS, Echo, read_lookup_numbers, bulk_lookup_header, iter_bulk_lookup_rows, build_fulltext_query,
+    number_search_filter, get_search_cache, search_cache_key, fuzzy_name_filter, rank_fuzzy_candidates,
+)
+from .typeahead import suggest_names
+from .history import lookup_history
+from .diff import is_diff_running, start_diff_async
+from .tasks import (
+    process_csv_import_task_impl, start_import_async, start_finalize_async, is_import_running, get_pipeline_stats,
+    claim_table_swap,
+    is_supported_import_file, get_zip_csv_entry,
+)
+from accounts.utils import is_admin, can_view_imsi, can_export_data
+from vl09_web.pagination import EstimatedCountPaginator, KeysetPage, KeysetPaginator
+from vl09_web.db_router import use_read_replica
+from vl09_web.db_timeouts import statement_timeout
+from logs.slow_queries import capture_slow_queries
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -42,38 +62,57 @@ from logs.utils import (
 
 @login_required
 @user_passes_test(is_admin, login_url='subscriber_search')
+@statement_timeout('list')
+@capture_slow_queries
+@use_read_replica
 def subscriber_list(request):
     """Представление для просмотра списка абонентов (только для администраторов)"""
     # Получение параметров фильтрации из GET запроса
     search_query = request.GET.get('q', '')
     
-    # Базовый QuerySet
-    subscribers = Subscriber.objects.all()
+    # Базовый QuerySet: только колонки таблицы списка - страница читается из
+    # покрывающего индекса sub_name_keyset_cover (index-only scan)
+    subscribers = Subscriber.objects.only(*SUBSCRIBER_LIST_COLUMNS)
     
     # Применение фильтра поиска, если указан
     if search_query:
+        search_key = normalize_search_text(search_query)
         subscribers = subscribers.filter(
-            models.Q(number__icontains=search_query) |
-            models.Q(last_name__icontains=search_query) |
-            models.Q(first_name__icontains=search_query) |
-            models.Q(middle_name__icontains=search_query) |
-            models.Q(address__icontains=search_query) |
-            models.Q(imsi__icontains=search_query)
+            # Номер и IMSI - только цифры, текстовые поля - по нормализованным колонкам *_norm;
+            # все условия - contains по триграммным индексам колонок
+            models.Q(number__contains=search_query) |
+            models.Q(last_name_norm__contains=search_key) |
+            models.Q(first_name_norm__contains=search_key) |
+            models.Q(middle_name_norm__contains=search_key) |
+            models.Q(address_norm__contains=search_key) |
+            models.Q(imsi__contains=search_query)
         )
     
-    # Сортировка по фамилии и имени
-    subscribers = subscribers.order_by('last_name', 'first_name')
-    
-    # Пагинация
-    paginator = Paginator(subscribers, 20)  # 20 записей на страницу
-    page = request.GET.get('page')
-    subscribers_page = paginator.get_page(page)
+    # Сортировка по фамилии и имени, пагинация по ключу без OFFSET
+    paginator = KeysetPaginator(subscribers, SUBSCRIBER_KEYSET_KEYS, per_page=20)  # 20 записей на страницу
+    subscribers_page = paginator.paginate_request(request)
     
     return render(request, 'subscribers/subscriber_list.html', {
         'subscribers_page': subscribers_page,
         'search_query': search_query
     })
 
+def _validate_import_upload(uploaded_file):
+    """Проверяет формат загруженного файла импорта. Возвращает текст ошибки или None."""
+    if not is_supported_import_file(uploaded_file.name):
+        return 'Пожалуйста, загрузите файл в формате CSV (допускаются архивы .csv.gz, .csv.bz2, .csv.xz и .zip)'
+    if uploaded_file.name.lower().endswith('.zip'):
+        try:
+            with zipfile.ZipFile(uploaded_file) as archive:
+                get_zip_csv_entry(archive)
+        except zipfile.BadZipFile:
+            return 'Файл не является корректным ZIP-архивом'
+        except ValueError as e:
+            return str(e)
+        finally:
+            uploaded_file.seek(0)
+    return None
+
 @login_required
 @user_passes_test(is_admin, login_url='subscriber_search')
 def import_csv(request):
@@ -102,9 +141,10 @@ def import_csv(request):
                 encoding = form.cleaned_data['encoding']
                 # has_header убран - теперь всегда пропускаем первую строку если она невалидна
                 
-                # Проверяем, что это действительно CSV файл
-                if not csv_file.name.lower().endswith('.csv'):
-                    messages.error(request, 'Пожалуйста, загрузите файл в формате CSV')
+                # Проверяем, что это действительно CSV файл (или архив с ним)
+                upload_error = _validate_import_upload(csv_file)
+                if upload_error:
+                    messages.error(request, upload_error)
                     return render(request, 'subscribers/import_csv.html', {'form': form})
                 
                 # Проверяем, что файл не пустой
@@ -190,9 +230,10 @@ def import_csv_async(request):
             if not csv_file:
                 return JsonResponse({'success': False, 'error': 'Файл не найден'})
             
-            # Проверяем, что это действительно CSV файл
-            if not csv_file.name.lower().endswith('.csv'):
-                return JsonResponse({'success': False, 'error': 'Пожалуйста, загрузите файл в формате CSV'})
+            # Проверяем, что это действительно CSV файл (или архив с ним)
+            upload_error = _validate_import_upload(csv_file)
+            if upload_error:
+                return JsonResponse({'success': False, 'error': upload_error})
             
             # Проверяем, что файл не пустой
             if csv_file.size == 0:
@@ -260,12 +301,13 @@ def import_csv_async(request):
 
 @login_required
 @user_passes_test(is_admin, login_url='subscriber_search')
+@statement_timeout('list')
 def import_history(request):
     """Представление для просмотра истории импорта (только для администраторов)"""
     history_list = ImportHistory.objects.all().order_by('-created_at')
     
     # Пагинация
-    paginator = Paginator(history_list, 10)  # 10 записей на страницу
+    paginator = EstimatedCountPaginator(history_list, 10)  # 10 записей на страницу
     page = request.GET.get('page')
     history_page = paginator.get_page(page)
     
@@ -273,14 +315,14 @@ def import_history(request):
 
 @login_required
 @user_passes_test(is_admin, login_url='subscriber_search')
+@statement_timeout('list')
 def import_detail(request, import_id):
     """Представление для просмотра деталей импорта (только для администраторов)"""
     import_history = get_object_or_404(ImportHistory, id=import_id)
-    subscribers = Subscriber.objects.filter(import_history=import_history).order_by('id')
+    subscribers = Subscriber.objects.filter(import_history=import_history)
     
-    paginator = Paginator(subscribers, 20)
-    page_number = request.GET.get('page')
-    subscribers_page = paginator.get_page(page_number)
+    paginator = KeysetPaginator(subscribers, [('"subscribers_subscriber"."id"', 'id')], per_page=20)
+    subscribers_page = paginator.paginate_request(request)
     
     context = {
         'import_history': import_history,
@@ -291,6 +333,7 @@ def import_detail(request, import_id):
 
 @login_required
 @user_passes_test(is_admin, login_url='subscriber_search')
+@statement_timeout('status', json_response=True)
 def import_status(request, import_id):
     """JSON-статус прогресса импорта."""
     import_history = get_object_or_404(ImportHistory, id=import_id)
@@ -316,6 +359,12 @@ def import_status(request, import_id):
         'errors_count': getattr(import_history, 'errors', None).count() if hasattr(import_history, 'errors') else 0,
         'records_created': import_history.records_created,
         'records_failed': import_history.records_failed,
+        # Глубина очереди и простои стадий конвейера (None, если импорт не идёт в этом процессе)
+        'pipeline': get_pipeline_stats(import_history.id),
+        # Проверки, прогрев кеша и длительность этапов финализации
+        'finalize_stats': import_history.finalize_stats,
+        # Ход и итог отката к архиву этого импорта (status: running/completed/failed)
+        'rollback_stats': import_history.rollback_stats,
     }
     
     logger.debug(f"Данные статуса для импорта {import_id}: {data}")
@@ -361,12 +410,16 @@ def import_resume(request, import_id):
         import_history.stop_reason = None
         import_history.error_message = None
         import_history.processed_rows = 0
+        import_history.resume_byte_offset = 0
         import_history.records_created = 0
         import_history.records_failed = 0
         import_history.progress_percent = 0
+        # Временная таблица удаляется при ошибке, создадим новую
+        import_history.temp_table_name = None
         import_history.save(update_fields=[
             'pause_requested', 'cancel_requested', 'status', 'phase', 'stop_reason',
-            'error_message', 'processed_rows', 'records_created', 'records_failed', 'progress_percent'
+            'error_message', 'processed_rows', 'resume_byte_offset', 'records_created', 'records_failed',
+            'progress_percent', 'temp_table_name'
         ])
         started = start_import_async(import_history.id)
         logger.info(f"Импорт {import_id} перезапущен после ошибки: {started}")
@@ -413,27 +466,18 @@ def import_finalize(request, import_id):
     try:
         logger.info(f"🏁 Начинаем финализацию импорта {import_id} пользователем {request.user.username}")
         
-        # Обновляем статус на финализацию
-        import_history.status = 'processing'
-        import_history.phase = 'finalizing'
-        import_history.save()
+        # Обновляем статус на финализацию, если не идёт другая финализация или откат
+        error = claim_table_swap(import_history, status='processing', phase='finalizing')
+        if error:
+            return JsonResponse({'success': False, 'error': error}, status=409)
         
-        # Импортируем функцию финализации
-        from .tasks import _finalize_import
-        
-        # Выполняем финализацию
-        _finalize_import(import_history)
-        
-        # Обновляем статус на завершено
-        import_history.status = 'completed'
-        import_history.phase = 'completed'
-        import_history.save()
-        
-        logger.info(f"✅ Финализация импорта {import_id} успешно завершена")
+        # Проверки, подмена таблиц и ожидание блокировок - в фоне; итог виден в import_status
+        started = start_finalize_async(import_history.id)
         
         return JsonResponse({
-            'success': True, 
-            'message': 'Импорт успешно финализирован. Данные перенесены в основную таблицу.'
+            'success': True,
+            'started': started,
+            'message': 'Финализация запущена в фоне. Статус обновится после подмены таблиц.',
         })
         
     except Exception as e:
@@ -452,6 +496,50 @@ def import_finalize(request, import_id):
 
 @login_required
 @user_passes_test(is_admin, login_url='subscriber_search')
+@csrf_exempt
+def import_diff(request, import_id):
+    """
+    Сравнение основной таблицы с архивом импорта: POST запускает фоновое сравнение
+    (archive_table_name - другой архив вместо архива этого импорта), GET - ход и итоги.
+    """
+    import_history = get_object_or_404(ImportHistory, id=import_id)
+    
+    if request.method == 'POST':
+        archive_table_name = request.POST.get('archive_table_name') or import_history.archive_table_name
+        if not archive_table_name:
+            return JsonResponse({'success': False, 'error': 'У импорта нет архивной таблицы для сравнения'}, status=400)
+        logger.info(f"Сравнение импорта {import_id} с {archive_table_name} запрошено пользователем {request.user.username}")
+        started = start_diff_async(import_history.id, archive_table_name)
+        return JsonResponse({'success': True, 'started': started})
+    
+    return JsonResponse({
+        'success': True,
+        'running': is_diff_running(import_history.id),
+        'stats': import_history.diff_stats,
+        'download_url': reverse('subscribers:import_diff_download', args=[import_history.id]) if import_history.diff_file else None,
+    })
+
+@login_required
+@user_passes_test(is_admin, login_url='subscriber_search')
+def import_diff_download(request, import_id):
+    """Скачивание CSV с отличиями основной таблицы от архива"""
+    import_history = get_object_or_404(ImportHistory, id=import_id)
+    if not import_history.diff_file:
+        raise Http404('Сравнение для этого импорта не выполнялось')
+    try:
+        diff_file = import_history.diff_file.open('rb')
+    except FileNotFoundError:
+        raise Http404('Файл сравнения не найден')
+    log_export(request, request.user, additional_data={
+        'format': 'csv',
+        'import_diff': import_history.id,
+        'counts': (import_history.diff_stats or {}).get('counts'),
+    })
+    return FileResponse(diff_file, as_attachment=True, filename=f'import_{import_history.id}_diff.csv')
+
+@login_required
+@user_passes_test(is_admin, login_url='subscriber_search')
+@statement_timeout('list')
 def import_errors(request, import_id):
     """Получение ошибок импорта."""
     try:
@@ -547,15 +635,142 @@ def list_archives(request):
     from subscribers.tasks import list_archive_tables
     from django.http import JsonResponse
     
-    result = list_archive_tables()
+    # Точный COUNT(*) по архивам - только по явному запросу (?exact=1)
+    exact_counts = request.GET.get('exact') == '1'
+    result = list_archive_tables(exact_counts=exact_counts)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse(result)
     
     # Для обычных запросов показываем страницу
-    return render(request, 'subscribers/archive_list.html', {'archive_info': result})
+    return render(request, 'subscribers/archive_list.html', {'archive_info': result, 'exact_counts': exact_counts})
+
+@login_required
+@user_passes_test(is_admin, login_url='subscriber_search')
+@require_POST
+def rollback_archive(request, table_name):
+    """Откат абонентов к архивной таблице (только для администраторов); выполняется в фоне"""
+    from subscribers.tasks import start_rollback_async
+    
+    logger.info(f"⏪ Откат к архиву {table_name} запрошен пользователем {request.user.username}")
+    result = start_rollback_async(table_name, user=request.user)
+    
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse(result, status=200 if result['success'] else 400)
+    
+    if result['success']:
+        messages.info(request, result['message'])
+    else:
+        messages.error(request, f"Ошибка при откате: {result['error']}")
+    return redirect('subscribers:list_archives')
 
 @login_required
+@user_passes_test(can_export_data, login_url='subscriber_search')
+@statement_timeout('export')
+@capture_slow_queries
+@use_read_replica
+def bulk_lookup(request):
+    """Массовая проверка списка номеров: совпадения отдаются потоком в CSV"""
+    form = BulkLookupForm(request.POST or None, request.FILES or None)
+    if request.method != 'POST' or not form.is_valid():
+        return render(request, 'subscribers/bulk_lookup.html', {'form': form})
+    
+    if form.cleaned_data.get('numbers_file'):
+        lines = io.TextIOWrapper(form.cleaned_data['numbers_file'].file, encoding='utf-8', errors='replace')
+    else:
+        lines = form.cleaned_data['numbers'].splitlines()
+    numbers = read_lookup_numbers(lines)
+    include_imsi = can_view_imsi(request.user)
+    
+    def stream():
+        writer = csv.writer(Echo())
+        matched = 0
+        try:
+            yield writer.writerow(bulk_lookup_header(include_imsi))
+            for row in iter_bulk_lookup_rows(numbers, include_imsi=include_imsi):
+                matched += 1
+                yield writer.writerow(row)
+        finally:
+            # Одна запись в журнале на всю проверку, а не на каждую пачку
+            log_search(request, request.user, additional_data={
+                'bulk_lookup': True,
+                'numbers_count': len(numbers),
+                'results_count': matched,
+            })
+    
+    response = StreamingHttpResponse(stream(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="bulk_lookup_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv"'
+    return response
+
+def _build_search_query(cleaned_data, columns=SUBSCRIBER_SEARCH_COLUMNS):
+    """
+    Строит выборку по очищенным данным SearchForm. Возвращает (выборка, режим):
+    'fulltext' - выборка с рангом, уже отсортирована; 'fuzzy' - кандидаты нечёткого
+    поиска, ранжируются в Python; 'plain' - обычные фильтры.
+    """
+    phone_number = cleaned_data.get('phone_number')
+    full_name = cleaned_data.get('full_name')
+    passport = cleaned_data.get('passport')
+    address = cleaned_data.get('address')
+    fulltext_query = None
+    fuzzy_filter = fuzzy_name_filter(full_name) if cleaned_data.get('fuzzy') else None
+    if cleaned_data.get('fulltext'):
+        fulltext_query = build_fulltext_query(' '.join(filter(None, [full_name, address])))
+    # Только нужные колонки (для нечёткого поиска - и ключи ранжирования)
+    if fuzzy_filter is not None:
+        columns += ('last_name_norm', 'first_name_norm', 'middle_name_norm')
+    query = Subscriber.objects.filter(is_active=True).only(*columns)
+    if phone_number:
+        query = query.filter(number_search_filter(phone_number, cleaned_data.get('number_match') or 'auto'))
+    if fulltext_query:
+        # Ранжированный поиск по search_vector (GIN)
+        query = query.filter(search_vector=fulltext_query).annotate(
+            rank=SearchRank(models.F('search_vector'), fulltext_query)
+        )
+    elif fuzzy_filter is not None:
+        # Кандидаты - по равенству фонетического ключа (индекс), не больше FUZZY_CANDIDATE_LIMIT
+        query = query.filter(fuzzy_filter)
+        if address:
+            query = query.filter(address_norm__contains=normalize_search_text(address))
+    else:
+        # Ввод нормализуется так же, как колонки *_norm при импорте
+        if full_name:
+            name_key = normalize_search_text(full_name)
+            query = query.filter(
+                models.Q(first_name_norm__contains=name_key) |
+                models.Q(last_name_norm__contains=name_key) |
+                models.Q(middle_name_norm__contains=name_key)
+            )
+        if address:
+            query = query.filter(address_norm__contains=normalize_search_text(address))
+    if passport:
+        query = query.filter(memo1_norm__contains=normalize_search_text(passport))
+    if fulltext_query:
+        return query.order_by('-rank', 'last_name', 'first_name'), 'fulltext'
+    if fuzzy_filter is not None:
+        return query, 'fuzzy'
+    return query, 'plain'
+
+def _rank_fuzzy(query, full_name):
+    """Ближайшие по расстоянию Левенштейна среди ограниченного набора кандидатов"""
+    candidates = list(query.order_by('id')[:getattr(settings, 'FUZZY_CANDIDATE_LIMIT', 500)])
+    return rank_fuzzy_candidates(full_name, candidates)[:getattr(settings, 'FUZZY_SEARCH_LIMIT', 50)]
+
+def _find_subscribers(cleaned_data, request):
+    """Выполняет поиск по очищенным данным SearchForm и возвращает страницу результатов"""
+    query, mode = _build_search_query(cleaned_data)
+    if mode == 'fulltext':
+        # Лучшие по рангу совпадения одной страницей
+        return KeysetPage(list(query[:getattr(settings, 'FTS_SEARCH_LIMIT', 100)]))
+    if mode == 'fuzzy':
+        return KeysetPage(_rank_fuzzy(query, cleaned_data.get('full_name')))
+    paginator = KeysetPaginator(query, SUBSCRIBER_KEYSET_KEYS, per_page=20)
+    return paginator.paginate_request(request)
+
+@login_required
+@statement_timeout('search')
+@capture_slow_queries
+@use_read_replica
 def search_subscribers(request):
     """Представление для поиска абонентов"""
     form = SearchForm(request.GET or None)
@@ -564,32 +779,19 @@ def search_subscribers(request):
 
     if request.GET and form.is_valid():
         search_performed = True
-        phone_number = form.cleaned_data.get('phone_number')
-        full_name = form.cleaned_data.get('full_name')
-        passport = form.cleaned_data.get('passport')
-        address = form.cleaned_data.get('address')
-        query = Subscriber.objects.filter(is_active=True)
-        if phone_number:
-            if len(phone_number) == 11 and phone_number.startswith('993'):
-                query = query.filter(number=phone_number)
+        data = form.cleaned_data
+        if data.get('phone_number') or data.get('full_name') or data.get('passport') or data.get('address'):
+            # Повторные поиски и листание страниц - из кеша, пока не сменилось поколение данных
+            search_cache = get_search_cache()
+            cache_key = search_cache_key(data, request.GET.get('cursor'))
+            subscribers = search_cache.get(cache_key)
+            if subscribers is None:
+                subscribers = _find_subscribers(data, request)
+                search_cache.set(cache_key, subscribers)
             else:
-                query = query.filter(number__icontains=phone_number)
-        if full_name:
-            query = query.filter(
-                models.Q(first_name__icontains=full_name) |
-                models.Q(last_name__icontains=full_name) |
-                models.Q(middle_name__icontains=full_name)
-            )
-        if passport:
-            query = query.filter(memo1__icontains=passport)
-        if address:
-            query = query.filter(address__icontains=address)
-        if phone_number or full_name or passport or address:
-            subscribers = query.order_by('last_name', 'first_name')
-            paginator = Paginator(subscribers, 20)
-            page_number = request.GET.get('page')
-            subscribers_page = paginator.get_page(page_number)
-            subscribers = subscribers_page
+                params = request.GET.copy()
+                params.pop('cursor', None)
+                subscribers.query_string = params.urlencode()
             # Логируем только если реально был поиск и есть результаты
             if subscribers:
                 log_search(request, request.user, additional_data={
@@ -604,6 +806,100 @@ def search_subscribers(request):
     return render(request, 'subscribers/search.html', context)
 
 @login_required
+@user_passes_test(can_export_data, login_url='subscriber_search')
+@statement_timeout('export')
+@capture_slow_queries
+@use_read_replica
+def export_search_results(request):
+    """
+    Выгрузка результатов поиска в CSV потоком: те же фильтры SearchForm, что и у поиска,
+    IMSI - только для can_view_imsi. Строки читаются серверным курсором
+    (iterator(chunk_size=...)), память не растёт с размером выгрузки.
+    """
+    form = SearchForm(request.GET or None)
+    if not form.is_valid():
+        messages.error(request, 'Некорректные условия поиска для выгрузки')
+        return redirect('subscriber_search')
+    data = form.cleaned_data
+    if not (data.get('phone_number') or data.get('full_name') or data.get('passport') or data.get('address')):
+        messages.error(request, 'Укажите условия поиска для выгрузки')
+        return redirect('subscriber_search')
+    
+    include_imsi = can_view_imsi(request.user)
+    columns = [column for column, _ in BULK_LOOKUP_COLUMNS if include_imsi or column != 'imsi']
+    query, mode = _build_search_query(data)
+    if mode == 'fuzzy':
+        # Нечёткий поиск ограничен набором кандидатов - ранжируется в памяти
+        rows = ([getattr(subscriber, column) for column in columns] for subscriber in _rank_fuzzy(query, data.get('full_name')))
+    else:
+        if mode == 'plain':
+            query = KeysetPaginator(query, SUBSCRIBER_KEYSET_KEYS).ordered_queryset()
+        rows = query.values_list(*columns).iterator(chunk_size=getattr(settings, 'EXPORT_CHUNK_SIZE', 2000))
+    
+    def stream():
+        writer = csv.writer(Echo())
+        exported = 0
+        try:
+            yield writer.writerow(bulk_lookup_header(include_imsi))
+            for row in rows:
+                exported += 1
+                yield writer.writerow(['' if value is None else value for value in row])
+        finally:
+            # Одна запись в журнале на всю выгрузку
+            log_export(request, request.user, additional_data={
+                'format': 'csv',
+                'filters': request.GET.dict(),
+                'rows_count': exported,
+            })
+    
+    response = StreamingHttpResponse(stream(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="search_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv"'
+    return response
+
+@login_required
+def name_typeahead(request):
+    """Подсказки ФИО для формы поиска: JSON из индекса в памяти процесса, без запросов к БД"""
+    suggestions = suggest_names(request.GET.get('q', ''), field=request.GET.get('field'))
+    return JsonResponse({'suggestions': suggestions})
+
+@login_required
+@statement_timeout('search')
+@use_read_replica
+def subscriber_history(request):
+    """
+    Кто владел номером (или IMSI) на момент времени: интервалы из индекса истории и данные
+    абонента по указателю в таблицу импорта. JSON - по ?format=json.
+    """
+    form = HistoryLookupForm(request.GET or None)
+    include_imsi = can_view_imsi(request.user)
+    entries = None
+    
+    if request.GET and form.is_valid():
+        data = form.cleaned_data
+        if data['imsi'] and not data['number'] and not include_imsi:
+            form.add_error('imsi', 'У вас нет прав для поиска по IMSI')
+        else:
+            entries = lookup_history(number=data['number'], imsi=data['imsi'], at=data['at'], include_imsi=include_imsi)
+            log_search(request, request.user, additional_data={
+                'history_lookup': True,
+                'query': request.GET.dict(),
+                'results_count': len(entries),
+            })
+    
+    if request.GET.get('format') == 'json':
+        if entries is None:
+            return JsonResponse({'success': False, 'errors': form.errors}, status=400)
+        return JsonResponse({'success': True, 'entries': entries})
+    
+    return render(request, 'subscribers/history_lookup.html', {
+        'form': form,
+        'entries': entries,
+        'include_imsi': include_imsi,
+    })
+
+@login_required
+@statement_timeout('search')
+@use_read_replica
 def subscriber_detail(request, subscriber_id):
     """Представление для просмотра подробной информации об абоненте"""
     subscriber = get_object_or_404(Subscriber, id=subscriber_id)
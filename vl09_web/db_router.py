@@ -0,0 +1,116 @@
+import contextvars
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Разрешено ли читать с реплики в текущем запросе (ставит use_read_replica)
+_replica_allowed = contextvars.ContextVar('replica_allowed', default=False)
+# Чтения прижаты к основной базе: недавняя запись пользователя или запись в этом запросе
+_primary_pinned = contextvars.ContextVar('primary_pinned', default=False)
+
+PIN_COOKIE_NAME = 'db_primary_until'
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def _pinned_to_primary():
+    return _primary_pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+class ReplicaRouter:
+    """
+    Чтение - с реплики (DATABASE_REPLICAS), запись и DDL - на основную базу.
+
+    С реплики читают только представления, помеченные use_read_replica; всё остальное,
+    включая фоновые потоки импорта и финализации (subscribers.tasks), остаётся на
+    default. Чтения идут на основную базу и внутри transaction.atomic, и после записи
+    в этом же запросе, и в течение REPLICA_STICKY_SECONDS после изменяющего запроса
+    пользователя (ReplicaStickinessMiddleware) - пользователь видит свои изменения,
+    даже если реплика отстаёт.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if not replicas or not _replica_allowed.get() or _pinned_to_primary():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if _replica_allowed.get():
+            _primary_pinned.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - физические копии default, объекты из них связываются свободно
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит репликацией
+        return db not in replica_aliases()
+
+
+def use_read_replica(view_func):
+    """
+    Разрешает представлению только для чтения читать с реплики. Потоковый ответ
+    (StreamingHttpResponse) читает данные после возврата из представления - для него
+    разрешение действует и на время выдачи содержимого.
+    """
+
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        token = _replica_allowed.set(True)
+        try:
+            response = view_func(request, *args, **kwargs)
+        finally:
+            _replica_allowed.reset(token)
+        if getattr(response, 'streaming', False):
+            response.streaming_content = _stream_on_replica(response.streaming_content, _primary_pinned.get())
+        return response
+
+    return wrapper
+
+
+def _stream_on_replica(content, pinned):
+    allowed_token = _replica_allowed.set(True)
+    pinned_token = _primary_pinned.set(pinned)
+    try:
+        yield from content
+    finally:
+        _primary_pinned.reset(pinned_token)
+        _replica_allowed.reset(allowed_token)
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Read-your-writes: после изменяющего запроса (POST, PUT, PATCH, DELETE) пользователь
+    REPLICA_STICKY_SECONDS читает с основной базы. Срок хранится в cookie; подделка
+    cookie может только отправить чтения на основную базу.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE_NAME, 0))
+        except ValueError:
+            pinned_until = 0
+        token = _primary_pinned.set(pinned_until > time.time())
+        try:
+            response = self.get_response(request)
+        finally:
+            _primary_pinned.reset(token)
+
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and replica_aliases():
+            sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+            response.set_cookie(PIN_COOKIE_NAME, str(time.time() + sticky_seconds),
+                                max_age=sticky_seconds, httponly=True, samesite='Lax')
+        return response
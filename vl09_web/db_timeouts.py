@@ -0,0 +1,116 @@
+import contextlib
+import functools
+import logging
+
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.http import JsonResponse
+from django.shortcuts import render
+
+logger = logging.getLogger(__name__)
+
+# SQLSTATE query_canceled: запрос прерван по statement_timeout
+QUERY_CANCELED = '57014'
+
+
+def is_statement_timeout(error):
+    """Проверяет, что ошибка БД - истечение statement_timeout (SQLSTATE 57014)."""
+    return getattr(error.__cause__, 'pgcode', None) == QUERY_CANCELED
+
+
+def timeout_budget_ms(budget):
+    """Бюджет времени на запрос: число мс или имя из STATEMENT_TIMEOUT_BUDGETS."""
+    if isinstance(budget, int):
+        return budget
+    return getattr(settings, 'STATEMENT_TIMEOUT_BUDGETS', {}).get(budget, 0)
+
+
+class _StatementTimeout:
+    """
+    execute_wrapper: перед первым запросом на соединении ставит SET statement_timeout,
+    при выходе возвращает значение по умолчанию. Соединения постоянные (CONN_MAX_AGE),
+    поэтому настройка не должна пережить запрос.
+    """
+
+    def __init__(self, timeout_ms):
+        self.timeout_ms = timeout_ms
+        self.applied = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        db = context['connection']
+        if db.alias not in self.applied:
+            self.applied.add(db.alias)
+            with db.cursor() as cursor:
+                cursor.execute(f"SET statement_timeout = {int(self.timeout_ms)}")
+        return execute(sql, params, many, context)
+
+    def restore(self):
+        for alias in self.applied:
+            db = connections[alias]
+            try:
+                with db.cursor() as cursor:
+                    cursor.execute("SET statement_timeout = DEFAULT")
+            except Exception:  # noqa: BLE001 - например, транзакция прервана таймаутом
+                # Соединение с чужой настройкой в пул не возвращаем
+                db.close()
+        self.applied.clear()
+
+
+@contextlib.contextmanager
+def _statement_timeout(timeout_ms):
+    wrapper = _StatementTimeout(timeout_ms)
+    try:
+        with contextlib.ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(wrapper))
+            yield
+    finally:
+        wrapper.restore()
+
+
+def _stream_with_timeout(content, timeout_ms):
+    with _statement_timeout(timeout_ms):
+        yield from content
+
+
+def timeout_response(request, json_response=False):
+    """Понятный оператору ответ вместо ошибки 500, когда запрос не уложился в бюджет."""
+    message = 'Запрос выполнялся слишком долго и был остановлен. Уточните условия поиска и повторите.'
+    if json_response or request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse({'success': False, 'error': message, 'timeout': True}, status=503)
+    return render(request, 'query_timeout.html', {'message': message}, status=503)
+
+
+def statement_timeout(budget, json_response=False):
+    """
+    Ограничивает время каждого SQL-запроса представления (statement_timeout PostgreSQL).
+    budget - миллисекунды или имя бюджета из STATEMENT_TIMEOUT_BUDGETS; 0 - без ограничения.
+    Запрос, прерванный по таймауту, превращается в ответ timeout_response (503, JSON для
+    json_response и AJAX-запросов). Для потокового ответа ограничение действует и при
+    выдаче содержимого.
+    """
+
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            timeout_ms = timeout_budget_ms(budget)
+            if not timeout_ms:
+                return view_func(request, *args, **kwargs)
+            try:
+                with _statement_timeout(timeout_ms):
+                    response = view_func(request, *args, **kwargs)
+                    # Ленивый TemplateResponse рендерится здесь же, под ограничением
+                    if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                        response.render()
+            except OperationalError as e:
+                if not is_statement_timeout(e):
+                    raise
+                logger.warning(f"Превышен statement_timeout {timeout_ms} мс: {request.path}")
+                return timeout_response(request, json_response)
+            if getattr(response, 'streaming', False):
+                response.streaming_content = _stream_with_timeout(response.streaming_content, timeout_ms)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,264 @@
+import datetime
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import BooleanField, QuerySet
+from django.db.models.expressions import RawSQL
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_queryset_count(queryset):
+    """
+    Оценка числа строк выборки без её чтения: для выборки без фильтров - pg_class.reltuples,
+    иначе - оценка планировщика из EXPLAIN. None, если оценки нет (таблица ни разу не
+    анализировалась, ошибка EXPLAIN).
+    """
+    connection = connections[queryset.db]
+    try:
+        with connection.cursor() as cursor:
+            if not queryset.query.where and not queryset.query.distinct:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [connection.ops.quote_name(queryset.model._meta.db_table)]
+                )
+                row = cursor.fetchone()
+                if row and row[0] >= 0:
+                    return row[0]
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+    except Exception as e:  # noqa: BLE001
+        logger.warning(f"Не удалось оценить число строк: {e}")
+        return None
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_signature(queryset):
+    """Ключ кеша счётчика: SQL выборки с параметрами (сортировка не влияет на число строк)."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    digest = hashlib.md5(f"{queryset.db}|{sql}|{params!r}".encode()).hexdigest()
+    return f"estimated_count:{digest}"
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator без COUNT(*) по большим выборкам: замена django.core.paginator.Paginator.
+
+    Число строк берётся по цепочке: кеш по сигнатуре фильтра -> оценка (reltuples для
+    выборки без фильтров, EXPLAIN для остальных) -> точный COUNT(*), если оценка меньше
+    ESTIMATED_COUNT_EXACT_THRESHOLD или её нет. Результат кешируется на
+    ESTIMATED_COUNT_CACHE_SECONDS. count_is_estimate - показан ли приблизительный счётчик.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True,
+                 exact_threshold=None, cache_timeout=None):
+        super().__init__(object_list, per_page, orphans=orphans, allow_empty_first_page=allow_empty_first_page)
+        self.exact_threshold = (
+            exact_threshold if exact_threshold is not None
+            else getattr(settings, 'ESTIMATED_COUNT_EXACT_THRESHOLD', 10000)
+        )
+        self.cache_timeout = (
+            cache_timeout if cache_timeout is not None
+            else getattr(settings, 'ESTIMATED_COUNT_CACHE_SECONDS', 60)
+        )
+        self.count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+
+        key = count_signature(self.object_list)
+        cached = cache.get(key)
+        if cached is not None:
+            count, self.count_is_estimate = cached
+            return count
+
+        estimate = estimate_queryset_count(self.object_list)
+        if estimate is None or estimate < self.exact_threshold:
+            count, self.count_is_estimate = self.object_list.count(), False
+        else:
+            count, self.count_is_estimate = estimate, True
+        cache.set(key, (count, self.count_is_estimate), self.cache_timeout)
+        return count
+
+
+class _CursorSerializer:
+    """JSON для курсора: даты - в isoformat без потери микросекунд (DjangoJSONEncoder их обрезает)."""
+
+    def dumps(self, obj):
+        return json.dumps(
+            obj, separators=(',', ':'),
+            default=lambda value: value.isoformat() if isinstance(value, (datetime.date, datetime.time)) else str(value)
+        ).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+class KeysetPage:
+    """Страница KeysetPaginator: объекты, курсоры соседних страниц и ограниченный счётчик."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None,
+                 count_capped=False, query_string='', count_is_estimate=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = len(object_list) if count is None else count
+        self.count_capped = count_capped
+        self.count_is_estimate = count_is_estimate
+        self.query_string = query_string
+
+    @property
+    def has_next(self):
+        return bool(self.next_cursor)
+
+    @property
+    def has_previous(self):
+        return bool(self.previous_cursor)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def last_cursor(self):
+        return KeysetPaginator.last_page_token()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+class KeysetPaginator:
+    """
+    Постраничный вывод по ключу (seek-пагинация) вместо OFFSET.
+
+    Следующая страница - WHERE (k1, k2, ...) > (ключ последней строки) ORDER BY k1, k2, ...
+    LIMIT per_page: при индексе, совпадающем с сортировкой, стоимость не зависит от номера
+    страницы. Ключ должен быть уникальным (последним полем обычно идёт id), все части
+    сортируются в одном направлении (descending).
+
+    keys - список кортежей (SQL-выражение, атрибут объекта или функция от объекта[, плейсхолдер]).
+    SQL-выражения должны в точности совпадать с выражениями индекса, например
+    COALESCE("subscribers_subscriber"."last_name", ''). Плейсхолдер задаёт приведение
+    значения из курсора, например '%s::timestamptz'.
+
+    Курсор в URL - подписанный токен (django.core.signing), подделанный или устаревший
+    курсор открывает первую страницу. Общее число строк считается точно не дальше
+    count_limit, выше - показывается оценка планировщика.
+    """
+    cursor_salt = 'keyset-pagination'
+    last_page = 'last'
+
+    def __init__(self, queryset, keys, per_page=20, descending=False, count_limit=None):
+        self.queryset = queryset
+        self.keys = [key if len(key) == 3 else (key[0], key[1], '%s') for key in keys]
+        self.per_page = per_page
+        self.descending = descending
+        self.count_limit = count_limit if count_limit is not None else getattr(settings, 'KEYSET_COUNT_LIMIT', 1000)
+
+    @classmethod
+    def last_page_token(cls):
+        return signing.dumps({'d': cls.last_page}, salt=cls.cursor_salt, serializer=_CursorSerializer)
+
+    def _ordering(self, reverse=False):
+        descending = self.descending != reverse
+        return [RawSQL(sql, []).desc() if descending else RawSQL(sql, []).asc() for sql, _, _ in self.keys]
+
+    def ordered_queryset(self):
+        """Вся выборка в порядке ключа - для выгрузки целиком по тому же индексу"""
+        return self.queryset.order_by(*self._ordering())
+
+    def _seek(self, values, forward=True):
+        operator = '<' if self.descending == forward else '>'
+        columns = ', '.join(sql for sql, _, _ in self.keys)
+        placeholders = ', '.join(placeholder for _, _, placeholder in self.keys)
+        return RawSQL(f"({columns}) {operator} ({placeholders})", values, output_field=BooleanField())
+
+    def _key_values(self, obj):
+        return [getter(obj) if callable(getter) else getattr(obj, getter) for _, getter, _ in self.keys]
+
+    def _encode(self, direction, obj):
+        return signing.dumps({'d': direction, 'k': self._key_values(obj)}, salt=self.cursor_salt,
+                             serializer=_CursorSerializer)
+
+    def _decode(self, token):
+        if not token:
+            return None
+        try:
+            position = signing.loads(token, salt=self.cursor_salt, serializer=_CursorSerializer)
+        except signing.BadSignature:
+            return None
+        if position.get('d') == self.last_page:
+            return position
+        if position.get('d') not in ('next', 'prev') or len(position.get('k') or []) != len(self.keys):
+            return None
+        return position
+
+    def count(self):
+        """
+        Число строк: точное до count_limit, дальше - оценка планировщика (estimate_queryset_count).
+        Возвращает (число, превышен ли предел, оценка ли это).
+        """
+        total = self.queryset.order_by()[:self.count_limit + 1].count()
+        if total <= self.count_limit:
+            return total, False, False
+        estimate = estimate_queryset_count(self.queryset)
+        if estimate is not None and estimate > self.count_limit:
+            return estimate, True, True
+        return self.count_limit, True, False
+
+    def get_page(self, cursor=None, query_string=''):
+        position = self._decode(cursor)
+        direction = position['d'] if position else None
+
+        if direction in ('prev', self.last_page):
+            # Идём от курсора назад: обратная сортировка, затем разворачиваем страницу
+            queryset = self.queryset.order_by(*self._ordering(reverse=True))
+            if direction == 'prev':
+                queryset = queryset.filter(self._seek(position['k'], forward=False))
+            rows = list(queryset[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = direction == 'prev'
+        else:
+            queryset = self.queryset.order_by(*self._ordering())
+            if direction == 'next':
+                queryset = queryset.filter(self._seek(position['k']))
+            rows = list(queryset[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = direction == 'next'
+
+        count, count_capped, count_is_estimate = self.count()
+        return KeysetPage(
+            rows,
+            next_cursor=self._encode('next', rows[-1]) if has_next and rows else None,
+            previous_cursor=self._encode('prev', rows[0]) if has_previous and rows else None,
+            count=count,
+            count_capped=count_capped,
+            count_is_estimate=count_is_estimate,
+            query_string=query_string,
+        )
+
+    def paginate_request(self, request, param='cursor'):
+        """Страница по курсору из GET; остальные параметры запроса сохраняются для ссылок."""
+        params = request.GET.copy()
+        params.pop(param, None)
+        params.pop('page', None)
+        return self.get_page(request.GET.get(param), query_string=params.urlencode())
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # Наши приложения
     'accounts',
@@ -63,6 +64,7 @@ MIDDLEWARE = [
     'django.middleware.locale.LocaleMiddleware',  # Добавить после SessionMiddleware
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
+    'vl09_web.db_router.ReplicaStickinessMiddleware',  # Чтение своих записей с основной базы
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django_otp.middleware.OTPMiddleware',  # Новый middleware для 2FA
     'accounts.middleware.TOTPMiddleware',  # Наш кастомный middleware для проверки 2FA
@@ -103,9 +105,46 @@ DATABASES = {
         'PASSWORD': 'postgres',
         'HOST': '127.0.0.1',
         'PORT': '5432',
+        # Постоянные соединения: не открывать новое на каждый запрос (опрос import_status
+        # каждые 1,5 с); перед повторным использованием соединение проверяется.
+        # Встроенный пул Django (OPTIONS['pool']) требует psycopg 3, в проекте - psycopg2
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Реплики только для чтения (vl09_web.db_router.ReplicaRouter): поиск, карточка и список
+# абонентов, журнал действий, выгрузки. Локально - второй экземпляр PostgreSQL или тот же
+# сервер: DB_REPLICA_HOST=127.0.0.1 DB_REPLICA_PORT=5433
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'PORT': os.environ.get('DB_REPLICA_PORT', '5432'),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['vl09_web.db_router.ReplicaRouter']
+
+# Сколько секунд после изменяющего запроса пользователь читает с основной базы
+REPLICA_STICKY_SECONDS = 5
+
+# Бюджеты statement_timeout представлений, мс (vl09_web.db_timeouts.statement_timeout);
+# 0 - без ограничения
+STATEMENT_TIMEOUT_BUDGETS = {
+    'search': 15000,
+    'list': 20000,
+    'status': 3000,
+    'logs': 30000,
+    'export': 120000,
+}
+
+# Учёт медленных запросов представлений поиска (logs.slow_queries.capture_slow_queries):
+# порог, доля медленных запросов, для которых снимается EXPLAIN (ANALYZE, BUFFERS)
+SLOW_QUERY_CAPTURE = True
+SLOW_QUERY_THRESHOLD_MS = 500
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = 0.1
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -142,6 +181,82 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 FILE_UPLOAD_PERMISSIONS = 0o644
 
+# Конвейер потокового импорта CSV: ёмкость очереди между чтением/разбором и записью в БД
+# (обратное давление) и размер пакета вставки во временную таблицу
+IMPORT_PIPELINE_QUEUE_SIZE = 5000
+IMPORT_PIPELINE_BATCH_SIZE = 500
+
+# Прогрев кеша новой таблицы абонентов перед подменой при финализации импорта
+# (pg_prewarm, если расширение установлено, иначе index-only сканирование)
+IMPORT_PREWARM_ENABLED = True
+IMPORT_PREWARM_MAX_MB = 512
+IMPORT_PREWARM_MAX_SECONDS = 30
+
+# Подмена таблиц при финализации: ожидание блокировок на одну попытку,
+# число попыток и начальная пауза между ними (удваивается, не более 30 с)
+FINALIZE_LOCK_TIMEOUT_MS = 2000
+FINALIZE_LOCK_RETRIES = 10
+FINALIZE_RETRY_BACKOFF_SECONDS = 1
+
+# Массовая проверка номеров: номеров в одном запросе number = ANY(...)
+BULK_LOOKUP_BATCH_SIZE = 5000
+
+# Выгрузка результатов поиска: строк за одно чтение серверного курсора
+EXPORT_CHUNK_SIZE = 2000
+
+# Сравнение основной таблицы с архивом (subscribers.diff): строк в одной пачке чтения
+# по индексу номера и как часто сохранять ход сравнения в ImportHistory.diff_stats
+DIFF_BATCH_SIZE = 10000
+DIFF_PROGRESS_EVERY = 100000
+
+# История номера (subscribers.history): сколько интервалов показывать за один запрос
+HISTORY_LOOKUP_LIMIT = 100
+
+# Поиск по номеру в режиме «Автоматически»: ввод без 993 не длиннее N цифр ищется
+# по последним цифрам номера (индекс sub_number_suffix), длиннее - по любой части
+NUMBER_SUFFIX_MAX_DIGITS = 7
+
+# Полнотекстовый поиск: сколько лучших по рангу совпадений показывать
+FTS_SEARCH_LIMIT = 100
+
+# Нечёткий поиск по ФИО: сколько кандидатов по фонетическому ключу ранжировать и сколько показать
+FUZZY_CANDIDATE_LIMIT = 500
+FUZZY_SEARCH_LIMIT = 50
+
+# Подсказки ФИО (subscribers.typeahead): индекс в памяти процесса строится при старте
+# и после финализации импорта; поколение данных сверяет фоновый поток раз в N секунд
+TYPEAHEAD_PRELOAD = True
+TYPEAHEAD_GENERATION_CHECK_SECONDS = 60
+TYPEAHEAD_MIN_PREFIX = 2
+TYPEAHEAD_LIMIT = 10
+
+# Постраничный вывод по ключу: общее число строк считается не дальше этого предела
+KEYSET_COUNT_LIMIT = 1000
+
+# Оценочный счётчик страниц (EstimatedCountPaginator): ниже порога - точный COUNT(*),
+# счётчики кешируются по сигнатуре фильтра
+ESTIMATED_COUNT_EXACT_THRESHOLD = 10000
+ESTIMATED_COUNT_CACHE_SECONDS = 60
+
+# Кеши. Результаты поиска - в отдельном кеше с ограничением размера; ключи содержат
+# поколение данных, поэтому устаревшие записи просто вытесняются. Для общего кеша
+# между воркерами можно указать django.core.cache.backends.redis.RedisCache
+# (память ограничивается maxmemory на стороне Redis)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'subscriber-search',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+        },
+    },
+}
+SEARCH_CACHE_ALIAS = 'search'
+
 # Настройки для Gunicorn (если используется)
 GUNICORN_TIMEOUT = 300
 